@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules import each other by their flat names, like when run from this directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -3,25 +3,140 @@ Compiling error support
 Gives a detailed error messages in the output
 
 Usage:
-    error(line_no=line_no_where_the_error_happened, error_message='some error explaining message', source="filename.src | TextBox")
+    error(line_no=line_no_where_the_error_happened, error_message='some error explaining message', source="filename.src | TextBox", column=column_no)
     errors_count()
     clear_errors()
+    replay_errors(messages)
+
+    with collecting(limit=100) as diagnostics:      # errors of the block go to diagnostics, not stderr
+        ...
+    diagnostics.count
+    diagnostics.emit(sys.stderr, 'text' | 'json')
+
+Outside of collecting, errors are printed to stderr as they happen and counted process wide.
+Inside it, they're kept by the Diagnostics of the current context (thread or asyncio task), so
+compilations running side by side have their own errors and count. A Diagnostics keeps the first
+limit errors and only counts the rest.
 '''
 
+from collections import namedtuple
+import contextlib
+import contextvars
 import sys
+import threading
 
 _errors_num = 0
 
-def error(line_no, error_message, source=None):
+_current = contextvars.ContextVar('diagnostics', default=None)
+
+
+class Diagnostic(namedtuple('Diagnostic', ['line', 'column', 'message', 'source'])):
+
+    def text(self):
+        position = str(self.line)
+        if self.column is not None:
+            position += ':' + str(self.column)
+        if self.source:
+            return 'ERROR @ LINE {src}:{position}: {msg}'.format(src=self.source, position=position, msg=self.message)
+        return 'ERROR @ LINE {position}: {msg}'.format(position=position, msg=self.message)
+
+
+class Diagnostics(object):
+    '''
+    Errors of a compilation, safe to share between threads
+    '''
+
+    def __init__(self, limit=100):
+        self.limit = limit
+        self.entries = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, line, message, source=None, column=None):
+        with self.lock:
+            self.count += 1
+            if len(self.entries) < self.limit:
+                self.entries.append(Diagnostic(line, column, message, source))
+
+    def extend(self, other):
+        with self.lock:
+            self.entries.extend(other.entries[:max(0, self.limit - len(self.entries))])
+            self.count += other.count
+
+    def clear(self):
+        with self.lock:
+            self.entries = []
+            self.count = 0
+
+    @property
+    def dropped(self):
+        return self.count - len(self.entries)
+
+    def lines(self):
+        lines = [entry.text() for entry in self.entries]
+        if self.dropped:
+            lines.append('... {count} more error(s)'.format(count=self.dropped))
+        return lines
+
+    def as_dict(self):
+        return {'count': self.count, 'errors': [entry._asdict() for entry in self.entries]}
+
+    def dumps(self):
+        import json
+        return json.dumps(self.as_dict())
+
+    @staticmethod
+    def loads(data, limit=100):
+        import json
+        diagnostics = Diagnostics(limit)
+        state = json.loads(data)
+        diagnostics.entries = [Diagnostic(**entry) for entry in state['errors']]
+        diagnostics.count = state['count']
+        return diagnostics
+
+    def emit(self, out=None, format='text'):
+        '''
+        Writes the errors to out (stderr by default) as text lines or a JSON document
+        '''
+
+        out = sys.stderr if out is None else out
+        if format == 'json':
+            import json
+            out.write(json.dumps(self.as_dict(), indent=2) + '\n')
+        elif self.count:
+            out.write('\n'.join(self.lines()) + '\n')
+
+
+@contextlib.contextmanager
+def collecting(diagnostics=None, limit=100):
+    '''
+    Sends the errors of the block to diagnostics (a new Diagnostics by default)
+    '''
+
+    if diagnostics is None:
+        diagnostics = Diagnostics(limit)
+    token = _current.set(diagnostics)
+    try:
+        yield diagnostics
+    finally:
+        _current.reset(token)
+
+
+def current_diagnostics():
+    return _current.get()
+
+
+def error(line_no, error_message, source=None, column=None):
     '''
     Display a compilation error
     '''
 
-    if source:
-        error_message = 'ERROR @ LINE {src}:{line}: {msg}'.format(src=source, line=line_no, msg=error_message)
-    else:
-        error_message = 'ERROR @ LINE {line}: {msg}'.format(line=line_no, msg=error_message)
-    print(error_message, file=sys.stderr)
+    diagnostics = _current.get()
+    if diagnostics is not None:
+        diagnostics.add(line_no, error_message, source, column)
+        return
+
+    print(Diagnostic(line_no, column, error_message, source).text(), file=sys.stderr)
 
     global _errors_num
     _errors_num += 1
@@ -32,6 +147,9 @@ def errors_count():
     Returns the number of errors encountered during the compilation
     '''
 
+    diagnostics = _current.get()
+    if diagnostics is not None:
+        return diagnostics.count
     return _errors_num
 
 
@@ -40,5 +158,31 @@ def clear_errors():
     Clears encountered errors count
     '''
 
+    diagnostics = _current.get()
+    if diagnostics is not None:
+        diagnostics.clear()
+        return
+
     global _errors_num
     _errors_num = 0
+
+
+def replay_errors(messages):
+    '''
+    Reports the errors of an earlier compilation again, messages is what Diagnostics.dumps returned
+    '''
+
+    if not messages:
+        return
+    replayed = Diagnostics.loads(messages, sys.maxsize)
+    diagnostics = _current.get()
+    if diagnostics is not None:
+        diagnostics.extend(replayed)
+        return
+
+    lines = replayed.lines()
+    if lines:
+        print('\n'.join(lines), file=sys.stderr)
+
+    global _errors_num
+    _errors_num += replayed.count
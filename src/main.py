@@ -1,137 +1,400 @@
-from tiny_scanner import TinyScanner
-from tiny_parser import TinyParser
-from errors import clear_errors
-import sys
+'''
+TINY compiler command line
 
-Tokenize = TinyScanner.tokenize
-Parse = TinyParser.parse
+Usage:
+    tinycompiler <command> <in_file> [<out_file>] [<options>]
+    main(['scan', 'in_file.ext'])           # returns the exit status
 
-def exit():
-    sys.exit(
+Only sys is imported up front, every command imports what it uses when it runs: scanning loads
+the scanner (and the cache unless --no-cache), not the parser, the optimizer, the renderers or the
+backends. `python tiny_bench.py --startup` checks the import time of a scan against a budget.
 '''
-Usage: tinycompiler <single-command> [<args>]
 
+import sys
+
+description = '''
 Available commands are:
-    -s  : Work as a scanner
-    -p  : Work as a parser
+    scan  (-s) : Work as a scanner
+    parse (-p) : Work as a parser
+    run   (-r) : Run the program, reading its input from stdin
+    batch      : Scan or parse many files at once, see `tinycompiler batch -h`
+    serve      : Keep a compile server running on a Unix socket, see `tinycompiler serve -h`
 
 Arguments must contain at least the input file, you could supply an output file if you want to save the program's results to the desk.
+A bare --stats, --profile or --connect takes the argument after it as its value, put it after the files or use --stats=FILE.
+'''
 
+epilog = '''
 For example:
     `tinycompiler -s in_file.ext`
-    `tinycompiler -s in_file.ext out_file.ext`
+    `tinycompiler scan in_file.ext out_file.ext`
     `tinycompiler -p in_file.ext`
-    `tinycompiler -p in_file.ext out_file.ext`
-''')
+    `tinycompiler parse in_file.ext out_file.svg` (the tree image as SVG, PNG for other extensions)
+    `tinycompiler -p in_file.ext out_file.dot` (Graphviz source of the tree instead of the image)
+    `tinycompiler -r in_file.ext`
+    `tinycompiler run -O --backend=python in_file.ext`
+    `tinycompiler -r in_file.ext out_file.ext` (what the program writes goes to out_file.ext)
+    `tinycompiler -p --no-cache in_file.ext out_file.svg --stats`
+    `tinycompiler -p -j 4 in_file.ext out_file.svg` (large programs are parsed by 4 processes)
+    `tinycompiler -p --errors=json in_file.ext out_file.svg`
+    `tinycompiler batch -p src_dir -o out_dir`
+    `tinycompiler serve -j 4`
+    `tinycompiler -p in_file.ext out_file.svg --connect`
+    `tinycompiler -s in_file.ext out_file.tok` (binary token file, see tiny_scanner)
+    `tinycompiler -p out_file.tok tree.svg` (parsed from the token file, not scanned again)
+    `tinycompiler -p --format=json in_file.ext` (the tree as JSON, sexp for an S-expression)
+    `tinycompiler -p in_file.ext tree.ast` (binary tree file, see tiny_ast, same as --format=bin)
+    `tinycompiler -r tree.ast` (run from the tree file, not parsed again)
+    `tinycompiler -r in_file.ext --profile` (statement counts, times and hotspots to stderr, see tiny_profile)
+'''
+
+commands = {'scan': 'scan', '-s': 'scan', 'parse': 'parse', '-p': 'parse', 'run': 'run', '-r': 'run'}
+
 
-if '-h' in sys.argv:
-	exit()
+def arguments(argv):
+    '''
+    Options of a scan, parse or run command line
+    '''
 
-if len(sys.argv) is 4:
+    import argparse
+    parser = argparse.ArgumentParser(prog='tinycompiler', usage='tinycompiler <command> <in_file> [<out_file>] [<options>]',
+                                     description=description, epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('scan', 'parse', 'run'), metavar='command')
+    parser.add_argument('infile', help='TINY source file')
+    parser.add_argument('outfile', nargs='?', help='token list, tree image or program output, stdout (or the browser) by default')
+    parser.add_argument('--format', choices=('png', 'svg', 'dot', 'json', 'sexp', 'bin'),
+                        help='what -p writes: a tree image, the tree as JSON or an S-expression, or a binary .ast tree file (from the extension by default)')
+    parser.add_argument('-O', dest='optimize', action='store_true',
+                        help='optimize the tree before drawing or running it (constant folding, x * 1 and x + 0, constant conditions)')
+    parser.add_argument('--backend', choices=('vm', 'python'), default='vm',
+                        help='run programs on the bytecode VM (default) or compile them to Python code run by CPython')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='parse the top level statements of large programs in JOBS worker processes (see tiny_parallel)')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='skip the cache in $TINY_CACHE_DIR (~/.cache/tinycompiler by default)')
+    parser.add_argument('--stats', nargs='?', const='-', metavar='FILE',
+                        help='print the time, CPU time and memory of every stage and token/node counts as JSON to stderr (--stats) or FILE')
+    parser.add_argument('--errors', choices=('text', 'json'), default='text',
+                        help='errors are printed to stderr once the command is done (the first 100 of them), as text or a JSON document')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help='count and time every statement run by the VM, print the hotspots and annotated source to stderr (--profile) or FILE')
+    parser.add_argument('--connect', nargs='?', const='', metavar='SOCKET',
+                        help='hand the command to a running compile server ($TINY_SERVER_SOCKET by default), -r reads all of stdin first')
+    return parser.parse_args(argv)
+
+
+def scan(options, infile, cache):
+    from tiny_scanner import TinyScanner
+    from tiny_stats import stage, count_tokens
+    if cache:
+        from tiny_cache import scan_file
+        batches = scan_file(infile, cache)
+    else:
+        batches = TinyScanner.tokenize_stream(infile)
+
+    if options.outfile and options.outfile.lower().endswith('.tok'):
+        from tiny_scanner import TokenWriter
+        with stage('scan'), TokenWriter(options.outfile) as writer:
+            for batch in batches:
+                count_tokens(batch)
+                writer.write(batch)
+        return 0
+
+    outfile = open(options.outfile, 'w') if options.outfile else sys.stdout
     try:
-        infile = open(sys.argv[2], 'r')
-        example = infile.read()
-        infile.close()
-        outfile = True
-    except:
-        sys.exit('No such input file exist')
-elif len(sys.argv) is 3:
+        with stage('scan'):
+            for batch in batches:
+                count_tokens(batch)
+                outfile.write(''.join(str(elm[0]) + ', ' + str(elm[1]) + '\n' for elm in batch))
+    finally:
+        if options.outfile:
+            outfile.close()
+    return 0
+
+
+tree_formats = ('json', 'sexp', 'bin')
+
+
+def image_format(path):
+    extension = path.lower().rsplit('.', 1)[-1]
+    if extension == 'ast':
+        return 'bin'
+    return extension if extension in ('svg', 'dot', 'json', 'sexp') else 'png'
+
+
+def show(image, format):
+    # Shown by the browser, the tree is written next to the other temporary files, named for its format
+    import tempfile, webbrowser
+    with tempfile.NamedTemporaryFile('wb', suffix='.' + format, delete=False) as image_file:
+        image_file.write(image)
+    print(image_file.name)
+    webbrowser.open('file://' + image_file.name)
+
+
+def is_tree_file(path):
+    return path.lower().endswith(('.tok', '.ast'))
+
+
+def file_tree(path, optimize):
+    '''
+    Syntax tree of the tokens in a .tok file or the tree in a .ast file, which have no source to cache it by
+    '''
+
+    from tiny_stats import stage, count_tree
+    if path.lower().endswith('.ast'):
+        from tiny_ast import TreeFile
+        try:
+            nodes = TreeFile(path)
+        except ValueError as e:
+            sys.exit('{path}: {msg}'.format(path=path, msg=e))
+        with stage('read'), nodes:
+            tree, root_id = nodes.to_tree()
+    else:
+        from tiny_scanner import TokenFile
+        from tiny_parser import TinyParser
+        try:
+            tokens = TokenFile(path)
+        except ValueError as e:
+            sys.exit('{path}: {msg}'.format(path=path, msg=e))
+        with stage('parse'), tokens:
+            tree, root_id = TinyParser.parse(tokens)
+    if optimize:
+        from tiny_optimizer import PassManager
+        with stage('optimize'):
+            tree, root_id = PassManager().run(tree, root_id)
+    count_tree(tree, root_id)
+    return tree, root_id
+
+
+def tree_image(tree, root_id, format):
+    if format == 'png':
+        from tiny_layout import render_png
+        return render_png(tree, root_id, 2)
+    if format == 'svg':
+        import io
+        from tiny_layout import write_svg
+        out = io.StringIO()
+        write_svg(tree, root_id, out)
+        return out.getvalue().encode('utf-8')
+    from tiny_render import to_dot
+    return to_dot(tree, root_id).encode('utf-8')
+
+
+def write_tree(tree, root_id, format, outfile):
+    '''
+    Writes the tree as JSON, an S-expression or a .ast file to outfile, stdout by default
+    '''
+
+    from tiny_ast import write
+    from tiny_stats import stage
+    with stage('write'):
+        write(tree, root_id, format, outfile or (sys.stdout.buffer if format == 'bin' else sys.stdout))
+    return 0
+
+
+def output_format(options):
+    if options.format:
+        return options.format
+    return image_format(options.outfile) if options.outfile else 'svg'
+
+
+def parse(options, infile, cache):
+    from tiny_cache import image_source, parse_source
+    from tiny_stats import stage
+    format = output_format(options)
+    if is_tree_file(options.infile):
+        tree, root_id = file_tree(options.infile, options.optimize)
+        if format in tree_formats:
+            return write_tree(tree, root_id, format, options.outfile)
+        image = tree_image(tree, root_id, format)
+    else:
+        with stage('read'):
+            source = infile.read()
+        if format in tree_formats:
+            tree, root_id = parse_source(source, cache, options.optimize, options.jobs)
+            return write_tree(tree, root_id, format, options.outfile)
+        image = image_source(source, format, cache, options.optimize, options.jobs)
+    if options.outfile:
+        with open(options.outfile, 'wb') as image_file:
+            image_file.write(image)
+    else:
+        show(image, format)
+    return 0
+
+
+def run(options, infile, cache):
+    from errors import errors_count
+    from tiny_stats import stage
+    if options.profile is not None and options.backend == 'python':
+        sys.exit('--profile needs the vm backend')
+    tree = source = None
+    if is_tree_file(options.infile):
+        tree, root_id = file_tree(options.infile, options.optimize)
+    else:
+        with stage('read'):
+            source = infile.read()
+    if options.backend == 'python':
+        from tiny_pycode import compile_source, TinyPyCompiler
+        if tree is None:
+            program = compile_source(source, cache, options.optimize)
+        elif errors_count():
+            program = None
+        else:
+            with stage('compile'):
+                program = TinyPyCompiler.compile(tree, root_id)
+        if program is None:
+            return 1
+        execute = program.run
+    else:
+        from tiny_cache import parse_source
+        from tiny_vm import TinyCompiler, TinyVM
+        if tree is None:
+            tree, root_id = parse_source(source, cache, options.optimize, options.jobs)
+        if errors_count():
+            return 1
+        with stage('compile'):
+            program = TinyCompiler.compile(tree, root_id)
+        profile = None
+        if options.profile is not None:
+            from tiny_profile import Profile
+            profile = Profile(program)
+        execute = lambda input, output: TinyVM.run(program, input, output, profile)
+    with stage('run'):
+        if options.outfile:
+            with open(options.outfile, 'w') as outfile:
+                execute(sys.stdin, outfile)
+        else:
+            execute(sys.stdin, sys.stdout)
+    if options.profile is not None:
+        from tiny_profile import report
+        text = report(profile, tree, root_id, source)
+        if options.profile == '-':
+            print(text, file=sys.stderr)
+        else:
+            with open(options.profile, 'w') as profile_out:
+                profile_out.write(text + '\n')
+    return 1 if errors_count() else 0
+
+
+def remote(options, infile):
+    '''
+    The command, done by the compile server listening on options.connect
+    '''
+
+    from tiny_client import TinyClient, RPCError
+    from errors import replay_errors, errors_count
+    from tiny_stats import stage
+    import json
+    if options.profile is not None:
+        sys.exit('--profile runs the program here, it can\'t be used with --connect')
+    if options.command == 'parse' and output_format(options) in tree_formats:
+        sys.exit('The compile server only draws tree images, --format={format} needs a local parse'.format(format=output_format(options)))
     try:
-        infile = open(sys.argv[2], 'r')
-        example = infile.read()
-        infile.close()
-        outfile = False
-    except:
-        sys.exit('No such input file exist')
-else:
-    print('Couldn\'t comprehend input arguments\n\n')
-    exit()
-
-if sys.argv[1].lower() == '-s':
-    if outfile:
-        outfile = open(sys.argv[3], 'w')
-    
-    for elm in Tokenize(example):
-        if outfile:
-            outfile.write(str(elm[0]) + ', ' + str(elm[1]) + '\n')
+        client = TinyClient(options.connect or None)
+    except OSError as e:
+        sys.exit('No compile server to connect to ({msg}), start one with `tinycompiler serve`'.format(msg=e))
+    with stage('read'):
+        source = infile.read()
+    try:
+        with stage('remote'):
+            if options.command == 'scan':
+                result = client.call('tokenize', source=source)
+            elif options.command == 'parse':
+                format = output_format(options)
+                result = client.call('render', source=source, format=format, optimize=options.optimize)
+            else:
+                result = client.call('run', source=source, input=sys.stdin.read(), backend=options.backend, optimize=options.optimize)
+    except RPCError as e:
+        sys.exit('Compile server error {code}: {msg}'.format(code=e.code, msg=e))
+    finally:
+        client.close()
+    replay_errors(json.dumps(result['errors']))
+
+    if options.command == 'scan':
+        text = ''.join(str(value) + ', ' + str(kind) + '\n' for value, kind, line in result['tokens'])
+    elif options.command == 'run':
+        text = result['output']
+    else:
+        if result['encoding'] == 'base64':
+            import base64
+            image = base64.b64decode(result['image'])
         else:
-            print(elm[0], elm[1], sep=', ')
-
-    if outfile:
-        outfile.close()
-
-elif sys.argv[1].lower() == '-p':
-    if outfile:
-        outfile = sys.argv[3]
-
-    tree, root_id = Parse(example)
-
-    import pydot as pd
-    out_graph = pd.Dot()
-    drawn_nodes = set()
-
-    import random
-    r = lambda: random.randint(0, 255)
-    colors = []
-
-    def recursively_print_tree(root_id, tree, reached_height, reached_width, row_space, column_space, level, caller_node_id=False, constraint=True):
-        if len(colors) <= level:
-            colors.append('#%02X%02X%02X' % (r(),r(),r()))
-        color = colors[level]
-            
-        if tree[root_id].data['label'] != 'stmt_sequence':
-            out_graph.add_node(pd.Node(root_id, pos=(str(reached_height) + ', ' + str(reached_width) + '!'), color=color, **tree[root_id].data))
-            reached_height, reached_width = reached_height + row_space, reached_width + column_space
-            if caller_node_id is not False:
-                out_graph.add_edge(pd.Edge(caller_node_id, root_id, constraint=constraint))
-            for node_id in tree.expand_tree():
-                if node_id not in drawn_nodes:
-                    drawn_nodes.add(node_id)
-                    reached_height, reached_width = recursively_print_tree(node_id, tree.subtree(node_id), reached_height, reached_width, row_space, column_space, level+1, root_id)
+            image = result['image'].encode('utf-8')
+        if options.outfile:
+            with open(options.outfile, 'wb') as image_file:
+                image_file.write(image)
         else:
-            out_graph.add_node(pd.Node(root_id, pos=(str(reached_height) + ', ' + str(reached_width) + '!'), style='invis'))
-            if caller_node_id is not False:
-                out_graph.add_edge(pd.Edge(caller_node_id, root_id, constraint=constraint, style='invis'))
-            reached_height, reached_width = reached_height + row_space, reached_width + column_space
-            past_node = caller_node_id
-            for node_id in tree.expand_tree():
-                if node_id not in drawn_nodes:
-                    drawn_nodes.add(node_id)
-                    constraint = False
-                    if past_node is caller_node_id:
-                        constraint = True
-                    reached_height, reached_width = recursively_print_tree(node_id, tree.subtree(node_id), reached_height, reached_width, row_space, column_space, level, past_node, constraint=constraint)
-                    out_graph.add_edge(pd.Edge(root_id, node_id, style='invis'))
-                    past_node = node_id
-        return reached_height, reached_width
-
-    recursively_print_tree(root_id, tree, 0, 0, 1, 1, 0)
-
-    import sys, os
+            show(image, format)
+        return 0
+
+    if options.outfile:
+        with open(options.outfile, 'w') as outfile:
+            outfile.write(text)
+    else:
+        sys.stdout.write(text)
+    return 1 if errors_count() else 0
+
+
+def main(argv=None):
+    '''
+    Runs a command line (sys.argv[1:] by default), returns the exit status
+    '''
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0].lower() == 'batch':
+        from tiny_batch import main as batch_main
+        return batch_main(argv[1:])
+    if argv and argv[0].lower() == 'serve':
+        from tiny_server import main as serve_main
+        return serve_main(argv[1:])
+    if argv and argv[0].lower() in commands:
+        # -s, -p and -r are the old spellings of the commands
+        argv[0] = commands[argv[0].lower()]
+    options = arguments(argv)
+
     try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-    prog = os.path.join(base_path, 'graphviz-2.38\\bin\\dot.exe')
-    
-    if outfile:
-        out_graph.write_png(outfile, prog=prog)
+        infile = open(options.infile, 'r')
+    except OSError:
+        sys.exit('No such input file exist')
+
+    cache = None
+    if options.cache and options.connect is None:
+        from tiny_cache import Cache
+        cache = Cache()
+    if options.connect is not None:
+        command = lambda: remote(options, infile)
     else:
-        png_str = out_graph.create_png(prog=prog)
-        
-        from io import BytesIO
-        sio = BytesIO()
-        sio.write(png_str)
-        sio.seek(0)
-        
-        import matplotlib.pyplot as plt
-        import matplotlib.image as mpimg
-        img = mpimg.imread(sio)
-        imgplot = plt.imshow(img, aspect='equal')
-        plt.show()
-else:
-    print('Couldn\'t comprehend input arguments\n\n')
-    exit()
-
-clear_errors()
+        command = lambda: globals()[options.command](options, infile, cache)
+
+    from errors import collecting
+    status = 0
+    with collecting() as diagnostics:
+        try:
+            if options.stats is None:
+                status = command()
+            else:
+                from tiny_stats import collect, stage, count
+                from errors import errors_count
+                with collect() as stats:
+                    try:
+                        with stage('total'):
+                            status = command()
+                    finally:
+                        count('errors', {'errors': errors_count()})
+                        if options.stats == '-':
+                            print(stats.to_json(), file=sys.stderr)
+                        else:
+                            with open(options.stats, 'w') as stats_out:
+                                stats_out.write(stats.to_json() + '\n')
+        finally:
+            diagnostics.emit(sys.stderr, options.errors)
+            infile.close()
+    return status
+
+
+if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        # Batch mode and server workers re-run the executable, PyInstaller builds need freeze_support
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,105 @@
+from tiny_ast import write_json, write_sexp, write_tree, TreeFile
+from tiny_parser import TinyParser, Kinds
+from tiny_gen import generate
+from errors import collecting
+import io
+import json
+import re
+import tempfile
+import webbrowser
+import main
+
+sources = ['', '{ only a comment }', 'write 1', 'x := ;\nif then write 1 end; read',
+           'read x;\nx := ' + '(' * 200 + 'x' + ' - 1)' * 200, 'repeat\n  if y < 2 then z := "q" end\nuntil @']
+sources += [generate(statements=150, seed=seed) for seed in range(4)]
+
+sexp_token = re.compile(r'\s*(\(|\)|"(?:[^"\\]|\\.)*"|-?[0-9]+|[a-z_]+)')
+
+
+def trees():
+    for source in sources:
+        with collecting():
+            yield TinyParser.parse(source)
+
+
+def nested(tree, root_id):
+    '''
+    (kind, value, line, children) of a tree, None for an empty one
+    '''
+
+    if not root_id:
+        return None
+    return (Kinds.names[tree.kind[root_id]], tree.value[root_id], tree.line[root_id],
+            [nested(tree, child_id) for child_id in tree.children(root_id)])
+
+
+def from_json(node):
+    if node is None:
+        return None
+    return node['kind'], node.get('value'), node['line'], [from_json(child) for child in node.get('children', [])]
+
+
+def from_sexp(text):
+    items, stack = [], []
+    for token in sexp_token.findall(text):
+        if token == '(':
+            stack.append(items)
+            items = []
+        elif token == ')':
+            node, items = items, stack.pop()
+            items.append(node)
+        else:
+            items.append(token if token[0].isalpha() else json.loads(token))
+    return from_items(items[0])
+
+
+def from_items(node):
+    if not node:
+        return None
+    # A value comes before the line when the kind is followed by two atoms
+    line_at = 2 if len(node) > 2 and not isinstance(node[2], list) else 1
+    return node[0], node[1] if line_at == 2 else None, node[line_at], [from_items(child) for child in node[line_at + 1:]]
+
+
+def test_json_round_trip():
+    for tree, root_id in trees():
+        out = io.StringIO()
+        write_json(tree, root_id, out, buffer_nodes=7)
+        assert from_json(json.loads(out.getvalue())) == nested(tree, root_id)
+
+
+def test_sexp_round_trip():
+    for tree, root_id in trees():
+        out = io.StringIO()
+        write_sexp(tree, root_id, out, buffer_nodes=7)
+        assert from_sexp(out.getvalue()) == nested(tree, root_id)
+
+
+def test_binary_round_trip(tmp_path):
+    path = str(tmp_path / 'tree.ast')
+    for tree, root_id in trees():
+        write_tree(tree, root_id, path)
+        with TreeFile(path) as nodes:
+            assert len(nodes) == len(list(tree.walk(root_id))) if root_id else len(nodes) == 0
+            assert [(depth, nodes.kind[node_id], nodes.value(node_id), nodes.line[node_id]) for node_id, depth in nodes.walk(nodes.root)] == \
+                [(depth, tree.kind[node_id], tree.value[node_id], tree.line[node_id]) for node_id, depth in tree.walk(root_id)]
+            loaded, loaded_root = nodes.to_tree()
+        assert nested(loaded, loaded_root) == nested(tree, root_id)
+        # The same tree gives the same file, from memory too
+        data = io.BytesIO()
+        write_tree(loaded, loaded_root, data)
+        with open(path, 'rb') as written:
+            assert data.getvalue() == written.read()
+        with TreeFile(data.getvalue()) as nodes:
+            assert nested(*nodes.to_tree()) == nested(tree, root_id)
+
+
+def test_shown_tree_is_named_for_its_format(tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'program.tny'
+    path.write_text('read x;\nwrite x\n')
+    opened = []
+    monkeypatch.setattr(webbrowser, 'open', opened.append)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    for format in ('svg', 'png', 'dot'):
+        assert main.main(['parse', str(path), '--format=' + format, '--no-cache']) == 0
+        assert opened.pop().endswith('.' + format)
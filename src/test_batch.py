@@ -0,0 +1,32 @@
+from tiny_batch import expand_inputs, compile_files
+import tiny_batch
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+
+def test_errors_are_reported_per_file_in_input_order(tmp_path):
+    paths = [write(tmp_path / 'b.txt', 'read x;\nwrite x'),
+             write(tmp_path / 'a.txt', 'read x;\nx := ;\nwrite x'),
+             str(tmp_path / 'missing.txt'),
+             write(tmp_path / 'c.txt', 'if x then\nwrite 1')]
+    for jobs in (1, 2):
+        results = list(compile_files(paths, '-p', jobs=jobs, chunksize=1))
+        assert [result.path for result in results] == paths
+        assert [bool(result.errors) for result in results] == [False, True, False, True]
+        assert [bool(result.failure) for result in results] == [False, False, True, False]
+        assert [message.split(':')[1] for message in results[1].messages] == ['2']
+        assert results[0].messages == [] and results[3].messages
+
+
+def test_out_dir_inside_an_input_directory_is_skipped(tmp_path, capsys):
+    source = write(tmp_path / 'src' / 'one.txt', 'read x;\nwrite x')
+    out_dir = str(tmp_path / 'src' / 'out')
+    for _ in range(2):
+        assert tiny_batch.main(['-s', str(tmp_path / 'src'), '-o', out_dir, '--no-cache', '-j', '1']) == 0
+        assert expand_inputs([str(tmp_path / 'src')], skip=out_dir) == [source]
+    assert (tmp_path / 'src' / 'out' / 'one.txt.tokens.txt').exists()
+    assert '1 file(s)' in capsys.readouterr().out
@@ -0,0 +1,20 @@
+import tiny_bench
+
+
+def test_missing_baseline_fails_in_ci_mode(tmp_path, capsys):
+    assert tiny_bench.main(['--sizes', '10', '--repeat', '1', '--baseline', str(tmp_path / 'missing.json'), '--ci']) == 2
+    assert 'no baseline' in capsys.readouterr().out
+
+
+def test_missing_baseline_is_skipped_outside_ci_mode(tmp_path, monkeypatch):
+    monkeypatch.delenv('CI', raising=False)
+    assert tiny_bench.main(['--sizes', '10', '--repeat', '1', '--stages', 'scan', '--baseline', str(tmp_path / 'missing.json')]) == 0
+
+
+def test_regressions():
+    old = {'scan/10': {'tokens_per_sec': 1000.0, 'nodes_per_sec': 0, 'peak_kib': 100}}
+    new = {'scan/10': {'tokens_per_sec': 700.0, 'nodes_per_sec': 0, 'peak_kib': 100},
+           'scan/20': {'tokens_per_sec': 1000.0, 'nodes_per_sec': 0, 'peak_kib': 100}}
+    assert tiny_bench.regressions(new, old, 0.25) == ['scan/10: tokens_per_sec 700 < 1,000']
+    assert tiny_bench.regressions(new, old, 0.25, strict=True)[-1] == 'scan/20: not in the baseline'
+    assert tiny_bench.regressions(new, old, 0.5) == []
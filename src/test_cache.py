@@ -0,0 +1,49 @@
+from tiny_cache import Cache, scan_file, scan_source, parse_source
+from tiny_scanner import TinyScanner
+from tiny_gen import generate
+from errors import collecting
+import os
+
+
+def tokens(batches):
+    return [token for batch in batches for token in batch]
+
+
+def entries(directory):
+    return sum(len(files) for folder, folders, files in os.walk(directory))
+
+
+def test_small_files_are_cached(tmp_path):
+    path = tmp_path / 'small.tny'
+    path.write_text(generate(statements=50, seed=1))
+    cache = Cache(str(tmp_path / 'cache'))
+    with open(path) as infile:
+        batches = scan_file(infile, cache)
+        assert isinstance(batches, list)
+        assert tokens(batches) == list(TinyScanner.tokenize(path.read_text()))
+    assert entries(cache.directory) == 1
+
+
+def test_large_files_are_streamed(tmp_path):
+    path = tmp_path / 'large.tny'
+    path.write_text(generate(statements=500, seed=2))
+    cache = Cache(str(tmp_path / 'cache'), stream_size=1024)
+    with open(path) as infile:
+        batches = scan_file(infile, cache)
+        assert not isinstance(batches, list)
+        assert tokens(batches) == list(TinyScanner.tokenize(path.read_text()))
+    assert entries(cache.directory) == 0
+
+
+def test_hits_replay_errors(tmp_path):
+    cache = Cache(str(tmp_path / 'cache'))
+    source = 'x := 1 +;\nwrite :x'
+    reported = []
+    for _ in range(2):
+        with collecting() as diagnostics:
+            batch = scan_source(source, cache)
+            parse_source(source, cache)
+        assert len(batch) == len(list(TinyScanner.tokenize(source)))
+        reported.append(diagnostics.lines())
+    assert reported[0] == reported[1]
+    assert len(reported[0]) == 4
@@ -0,0 +1,114 @@
+from tiny_dataflow import ControlFlowGraph, Dataflow, liveness, reaching_definitions, uninitialized_uses
+from tiny_parser import TinyParser, Kinds
+from tiny_gen import generate
+from errors import collecting
+
+
+def flow_of(source):
+    with collecting() as diagnostics:
+        tree, root_id = TinyParser.parse(source)
+    assert not diagnostics.count, diagnostics.lines()
+    return Dataflow(ControlFlowGraph.build(tree, root_id))
+
+
+def block_of(flow, kind, value=None):
+    '''
+    Block holding the first statement of a kind (and value)
+    '''
+
+    tree = flow.cfg.tree
+    for block, statements in enumerate(flow.cfg.statements):
+        for node_id in statements:
+            if tree.kind[node_id] == kind and value in (None, tree.value[node_id]):
+                return block
+
+
+def warnings(source):
+    return [(line, name) for node_id, line, name in uninitialized_uses(flow_of(source))]
+
+
+def test_if_without_else():
+    flow = flow_of('read c;\nif c < 1 then\n  y := 1\nend;\nwrite y')
+    cfg = flow.cfg
+    then_block, join = block_of(flow, Kinds.ASSIGN), block_of(flow, Kinds.WRITE)
+    # True goes to the then block, false straight to the join
+    assert cfg.successors[cfg.entry] == [then_block, join]
+    assert cfg.predecessors[join] == [then_block, cfg.entry]
+    assert cfg.tree.kind[cfg.conditions[cfg.entry]] == Kinds.OP and cfg.exit == join
+    assert warnings('read c;\nif c < 1 then\n  y := 1\nend;\nwrite y') == [(5, 'y')]
+    assert warnings('read c;\nif c < 1 then\n  y := 1\nelse\n  y := 2\nend;\nwrite y') == []
+
+    live_in, live_out = liveness(flow)
+    assert flow.variables(live_in[join]) == ['y']
+    # y isn't set when the test is false, so it's live before the if, from the program's start
+    assert sorted(flow.variables(live_in[cfg.entry])) == ['y']
+    assert flow.variables(live_in[then_block]) == []
+
+
+def test_reaching_definitions():
+    source = 'x := 1;\nread c;\nif c < 1 then\n  x := 2\nend;\nwrite x;\nx := 3'
+    flow = flow_of(source)
+    tree = flow.cfg.tree
+    reaching_in, reaching_out = reaching_definitions(flow)
+    join = block_of(flow, Kinds.WRITE)
+    assert sorted((tree.line[node_id], tree.value[node_id]) for node_id in flow.definition_nodes(reaching_in[join])) == [(1, 'x'), (2, 'c'), (4, 'x')]
+    assert sorted(tree.line[node_id] for node_id in flow.definition_nodes(reaching_out[join])) == [2, 7]
+
+    flow = flow_of('x := 1;\nread c;\nif c < 1 then\n  x := 2\nelse\n  x := 3\nend;\nwrite x')
+    tree = flow.cfg.tree
+    reaching_in, reaching_out = reaching_definitions(flow)
+    join = block_of(flow, Kinds.WRITE)
+    # Both branches define x, the first definition doesn't get through
+    assert sorted(tree.line[node_id] for node_id in flow.definition_nodes(reaching_in[join])) == [2, 4, 6]
+
+
+def test_repeat_body_using_a_variable_defined_after_the_loop():
+    source = 'i := 0;\nrepeat\n  write a;\n  i := i + 1\nuntil i = 3;\na := 5;\nwrite a'
+    flow = flow_of(source)
+    cfg = flow.cfg
+    body = block_of(flow, Kinds.WRITE)
+    after = block_of(flow, Kinds.ASSIGN, 'a')
+    # The test ends the body, true leaves the loop, false goes back
+    assert cfg.successors[body] == [after, body]
+    assert warnings(source) == [(3, 'a')]
+
+    live_in, live_out = liveness(flow)
+    assert sorted(flow.variables(live_in[body])) == ['a', 'i']
+    # The way back reads a again
+    assert sorted(flow.variables(live_out[body])) == ['a', 'i']
+    assert flow.variables(live_in[after]) == []
+
+    reaching_in, reaching_out = reaching_definitions(flow)
+    tree = cfg.tree
+    # The loop's own increment comes back around, the later a := 5 never does
+    assert sorted(tree.line[node_id] for node_id in flow.definition_nodes(reaching_in[body])) == [1, 4]
+
+
+def test_repeat_body_defining_a_variable_after_using_it():
+    # Set on the way back, but not before the first iteration
+    assert warnings('repeat\n  write b;\n  b := 1\nuntil b = 1') == [(2, 'b')]
+    assert warnings('b := 0;\nrepeat\n  write b;\n  b := 1\nuntil b = 1') == []
+    assert warnings('repeat\n  read b\nuntil b = 1;\nwrite b') == []
+
+
+def test_solutions_are_fixpoints():
+    for seed in range(6):
+        flow = flow_of(generate(statements=150, seed=seed))
+        cfg = flow.cfg
+        live_in, live_out = liveness(flow)
+        for block in cfg.postorder():
+            assert live_out[block] == _union(live_in[successor] for successor in cfg.successors[block])
+        reaching_in, reaching_out = reaching_definitions(flow)
+        for block in cfg.postorder():
+            if block != cfg.entry:
+                assert reaching_in[block] == _union(reaching_out[predecessor] for predecessor in cfg.predecessors[block])
+        # A variable live at the start is read on some path before it's set, so that read gets a warning
+        unset = {name for node_id, line, name in uninitialized_uses(flow)}
+        assert set(flow.variables(live_in[cfg.entry])) <= unset
+
+
+def _union(values):
+    result = 0
+    for value in values:
+        result |= value
+    return result
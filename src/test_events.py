@@ -0,0 +1,39 @@
+import time
+
+from errors import collecting
+from tiny_events import ENTER, EXIT, count, events
+from tiny_parser import Kinds
+
+
+def test_expression_events_in_pre_order():
+    assert list(events('write a - b * 2 < c')) == [
+        (ENTER, Kinds.STMT_SEQUENCE, None, 1), (ENTER, Kinds.WRITE, None, 1),
+        (ENTER, Kinds.OP, '<', 1),
+        (ENTER, Kinds.OP, '-', 1),
+        (ENTER, Kinds.ID, 'a', 1), (EXIT, Kinds.ID),
+        (ENTER, Kinds.OP, '*', 1),
+        (ENTER, Kinds.ID, 'b', 1), (EXIT, Kinds.ID), (ENTER, Kinds.CONST, 2, 1), (EXIT, Kinds.CONST),
+        (EXIT, Kinds.OP), (EXIT, Kinds.OP),
+        (ENTER, Kinds.ID, 'c', 1), (EXIT, Kinds.ID),
+        (EXIT, Kinds.OP),
+        (EXIT, Kinds.WRITE), (EXIT, Kinds.STMT_SEQUENCE)]
+
+
+def test_long_left_associative_chain():
+    terms = 40000
+    start = time.perf_counter()
+    kinds, deepest = count(events('x := ' + ' - '.join(['a', 'b'] * (terms // 2))))
+    assert time.perf_counter() - start < 5
+    assert kinds[Kinds.OP] == terms - 1 and kinds[Kinds.ID] == terms
+    assert deepest == terms + 2
+
+
+def test_errors_keep_events_balanced():
+    with collecting() as diagnostics:
+        kinds, _ = count(events('x := (a + ;\nwrite * 2'))
+    assert diagnostics.count > 0
+    depth = 0
+    for event in events('x := (a + ;\nwrite * 2'):
+        depth += 1 if event[0] == ENTER else -1
+        assert depth >= 0
+    assert depth == 0
@@ -0,0 +1,81 @@
+from tiny_incremental import IncrementalParser
+from tiny_parser import TinyParser
+from tiny_gen import generate
+from errors import collecting
+import random
+
+snippets = ['', ';', ':', '{', '}', ' ', 'end', '\n', '(', ':=', 'x', '1', 'x := 3;\n', ';\nwrite y', 'if x then ', 'repeat ',
+            '\n\n', 'until 1', 'else ', ' end;']
+
+
+def nodes(tree, root_id):
+    return [(depth, tree.kind[node_id], tree.value[node_id], tree.line[node_id]) for node_id, depth in tree.walk(root_id)]
+
+
+def parsed(source):
+    with collecting():
+        return nodes(*TinyParser.parse(source))
+
+
+def test_edits_match_a_full_parse():
+    chooser = random.Random(1)
+    for seed in range(10):
+        with collecting():
+            document = IncrementalParser(generate(statements=60, seed=seed))
+        for _ in range(30):
+            offset = chooser.randint(0, len(document.source))
+            removed = min(chooser.choice([0, 0, 1, 2, 5, 20]), len(document.source) - offset)
+            with collecting():
+                tree, root_id = document.edit(offset, removed, chooser.choice(snippets))
+            assert nodes(tree, root_id) == parsed(document.source), document.source
+
+
+def test_edits_in_nested_sequences_match_a_full_parse():
+    chooser = random.Random(2)
+    for seed in range(6):
+        body = generate(statements=40, seed=seed)
+        source = 'repeat\n' + body + '\nuntil x = 1' if seed % 2 else 'if a then\n' + body + '\nelse\n' + body + '\nend;\nwrite 1'
+        with collecting():
+            document = IncrementalParser(source)
+        for _ in range(30):
+            offset = chooser.randint(0, len(document.source))
+            removed = min(chooser.choice([0, 0, 1, 2, 5, 20]), len(document.source) - offset)
+            with collecting():
+                tree, root_id = document.edit(offset, removed, chooser.choice(snippets))
+            assert nodes(tree, root_id) == parsed(document.source), document.source
+
+
+def test_edit_in_a_loop_body_keeps_the_other_statements():
+    source = 'repeat\n' + ';\n'.join('x := x + {n}'.format(n=n) for n in range(100)) + '\nuntil x = 1'
+    document = IncrementalParser(source)
+    body = document.tree.first_child[document.root_id]
+    before = list(document.tree.children(body))
+    offset = source.index('x + 50')
+    tree, root_id = document.edit(offset, 1, 'y')
+    after = list(tree.children(tree.first_child[root_id]))
+    assert [after[index] == before[index] for index in (0, 49, 50, 51, 99)] == [True, True, False, True, True]
+    assert nodes(tree, root_id) == parsed(document.source)
+    assert tree.line[after[51]] == 53
+
+
+def test_end_added_in_a_nested_sequence():
+    source = 'if a then\n  x := 1;\n  y := 2\nend;\nwrite x'
+    document = IncrementalParser(source)
+    with collecting() as diagnostics:
+        tree, root_id = document.edit(source.index('y'), 0, 'end; ')
+    assert nodes(tree, root_id) == parsed(document.source)
+    with collecting() as expected:
+        TinyParser.parse(document.source)
+    # The incremental parser's tokens have no columns
+    assert [(entry.line, entry.message) for entry in diagnostics.entries] == [(entry.line, entry.message) for entry in expected.entries]
+
+
+def test_lines_move_after_edits():
+    source = 'read x;\nx := x + 1;\nwrite x'
+    document = IncrementalParser(source)
+    document.edit(0, 0, '\n\n')
+    tree, root_id = document.edit(len(document.source) - len('write x'), 0, '\n')
+    assert [tree.line[node_id] for node_id in tree.children(root_id)] == [3, 4, 6]
+    tree, root_id = document.edit(0, 2, '')
+    assert [tree.line[node_id] for node_id in tree.children(root_id)] == [1, 2, 4]
+    assert nodes(tree, root_id) == parsed(document.source)
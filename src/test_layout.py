@@ -0,0 +1,38 @@
+from tiny_layout import TreeLayout
+from tiny_parser import TinyParser
+from tiny_gen import generate
+from errors import collecting
+import struct
+import zlib
+
+
+def layouts():
+    sources = ['write 1', 'if x then repeat y := 1 until y < 2 end', 'x := (((1 + 2) * 3) - 4) / 5']
+    sources += [generate(statements=statements, seed=seed) for seed, statements in enumerate((5, 30, 200))]
+    sources.append('repeat\n' + generate(statements=40, seed=9) + '\nuntil x = 1;\nif a then ' + generate(statements=20, seed=10) + ' end')
+    for source in sources:
+        with collecting():
+            yield TreeLayout(*TinyParser.parse(source))
+
+
+def test_nodes_never_overlap():
+    for layout in layouts():
+        rows = {}
+        for v in range(1, len(layout.nodes)):
+            rows.setdefault(layout.y[v], []).append((layout.x[v] - layout.widths[v] / 2, layout.x[v] + layout.widths[v] / 2))
+        # Rows are a level gap apart, so only nodes at the same depth could touch
+        assert sorted(rows) == [layout.y[0] + depth * (layout.node_height + layout.level_gap) for depth in range(1, len(rows) + 1)]
+        for spans in rows.values():
+            spans.sort()
+            assert all(right + layout.sibling_gap <= left + 1e-6 for (_, right), (left, _) in zip(spans, spans[1:]))
+            assert spans[0][0] >= layout.margin - 1e-6 and spans[-1][1] <= layout.width - layout.margin + 1e-6
+
+
+def test_png_has_the_layout_size():
+    for layout in list(layouts())[:4]:
+        png = layout.to_png(scale=2)
+        assert png.startswith(b'\x89PNG\r\n\x1a\n')
+        width, height = struct.unpack('>II', png[16:24])
+        assert (width, height) == (layout.width * 2, layout.height * 2)
+        length = struct.unpack('>I', png[33:37])[0]
+        assert len(zlib.decompress(png[41:41 + length])) == (width * 3 + 1) * height
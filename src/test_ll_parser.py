@@ -0,0 +1,52 @@
+from tiny_parser import TinyParser
+from tiny_ll_parser import TinyLLParser
+from tiny_gen import generate
+from errors import collecting
+import random
+
+junk = ['then', 'end', 'until', 'else', ';', ')', '(', 'x', '3', ':=', 'if', 'repeat', '+', '<', 'read', 'write', '@', ':', '}']
+
+
+def parsed(engine, source):
+    with collecting() as diagnostics:
+        tree, root_id = engine.parse(source)
+    nodes = [(tree.label(node_id), tree.line[node_id], list(tree.children(node_id))) for node_id, depth in tree.walk(root_id)]
+    return nodes, diagnostics.lines()
+
+
+def corrupted(seed):
+    chooser = random.Random(seed)
+    words = generate(statements=chooser.randint(1, 40), seed=seed, comments=0.1).split(' ')
+    for _ in range(chooser.randint(1, 4)):
+        index = chooser.randrange(len(words))
+        if chooser.random() < 0.5:
+            words.insert(index, chooser.choice(junk))
+        else:
+            words[index] = chooser.choice(junk)
+    return ' '.join(words)
+
+
+def test_same_tree_as_tiny_parser():
+    for seed in range(20):
+        source = generate(statements=200, depth=4, seed=seed)
+        assert parsed(TinyLLParser, source) == parsed(TinyParser, source)
+
+
+def test_deep_nesting():
+    source = 'x := ' + '(' * 5000 + '1' + ')' * 5000
+    tree, root_id = TinyLLParser.parse(source)
+    assert tree.kind[root_id] == 4
+
+
+def test_same_diagnostics_in_the_same_order():
+    for seed in range(400):
+        source = corrupted(seed)
+        assert parsed(TinyLLParser, source) == parsed(TinyParser, source), source
+
+
+def test_scanner_errors_after_parse_errors():
+    # The scanner has read past `:x` when the missing `then` is reported
+    source = 'if x y := 1 end;\nz := 2 :x'
+    nodes, lines = parsed(TinyLLParser, source)
+    assert lines == parsed(TinyParser, source)[1]
+    assert lines[-1].startswith('ERROR @ LINE 2:')
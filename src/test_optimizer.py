@@ -0,0 +1,46 @@
+from tiny_optimizer import PassManager
+from tiny_parser import TinyParser, Kinds
+from tiny_ast import write_tree, TreeFile
+import io
+
+
+def optimized(source, disabled=()):
+    tree, root_id = TinyParser.parse(source)
+    return PassManager(disabled=list(disabled)).run(tree, root_id)
+
+
+def assigned(tree, root_id):
+    '''
+    {name: value node id} of a program of assignments
+    '''
+
+    statements = list(tree.children(root_id)) if tree.kind[root_id] == Kinds.STMT_SEQUENCE else [root_id]
+    return {tree.value[node_id]: next(tree.children(node_id)) for node_id in statements}
+
+
+def test_folded_constants_are_ints():
+    tree, root_id = optimized('x := 2 * (3 + 4) - 10 / 3; y := 1 < 2; z := (0 - 7) / 2 + 0')
+    values = {name: tree.value[node_id] for name, node_id in assigned(tree, root_id).items()}
+    assert values == {'x': 11, 'y': 1, 'z': -3}
+    assert all(type(value) is int for value in values.values())
+
+
+def test_division_by_zero_is_kept():
+    tree, root_id = optimized('x := 4 / (2 - 2)')
+    value_id = assigned(tree, root_id)['x']
+    assert tree.kind[value_id] == Kinds.OP and tree.value[value_id] == '/'
+    assert tree.value[tree.last_child[value_id]] == 0
+
+
+def test_folded_constants_stay_ints_in_tree_files():
+    tree, root_id = optimized('x := 6 * 7')
+    out = io.BytesIO()
+    write_tree(tree, root_id, out)
+    with TreeFile(out.getvalue()) as nodes:
+        loaded, loaded_root = nodes.to_tree()
+    assert loaded.value[assigned(loaded, loaded_root)['x']] == 42
+
+
+def test_dead_branches_and_repeats():
+    tree, root_id = optimized('if 1 < 2 then write 1 else write 2 end; repeat x := 3 until 1')
+    assert [(tree.kind[node_id], tree.value[node_id]) for node_id in tree.children(root_id)] == [(Kinds.WRITE, None), (Kinds.ASSIGN, 'x')]
@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import tiny_parallel
+from errors import collecting
+from tiny_gen import generate
+from tiny_parser import TinyParser
+
+
+def columns(tree):
+    return tree.kind, tree.value, tree.line, tree.first_child, tree.next_sibling, tree.last_child
+
+
+def test_short_programs_are_not_scanned(monkeypatch):
+    def scan(input):
+        raise AssertionError('scanned')
+    monkeypatch.setattr(tiny_parallel, 'scan', scan)
+    source = generate(statements=10)
+    assert len(source) < tiny_parallel.min_characters
+    tree, root_id = tiny_parallel.parse(source, jobs=4)
+    assert root_id == TinyParser.parse(source)[1]
+
+
+def test_same_tree_as_the_parser(monkeypatch):
+    monkeypatch.setattr(tiny_parallel, 'min_characters', 50)
+    monkeypatch.setattr(tiny_parallel, 'min_tokens', 50)
+    for seed in range(5):
+        source = generate(statements=60, seed=seed)
+        with ThreadPoolExecutor(2) as executor, collecting() as diagnostics:
+            tree, root_id = tiny_parallel.parse(source, executor=executor)
+        expected, expected_root = TinyParser.parse(source)
+        assert diagnostics.count == 0
+        assert root_id == expected_root
+        assert columns(tree) == columns(expected)
@@ -0,0 +1,54 @@
+import inspect
+import io
+
+import tiny_vm
+from errors import collecting
+from tiny_parser import Kinds, TinyParser
+from tiny_profile import Profile
+from tiny_vm import TinyCompiler, TinyVM
+
+source = 'read n;\ns := 0;\nrepeat\n  s := s + n;\n  n := n - 1\nuntil n = 0;\nwrite s'
+
+
+def run(profile=None):
+    tree, root_id = TinyParser.parse(source)
+    program = TinyCompiler.compile(tree, root_id)
+    output = io.StringIO()
+    variables = TinyVM.run(program, io.StringIO('4'), output, profile(program) if profile else None)
+    return tree, root_id, program, output.getvalue(), variables
+
+
+def test_profiled_run_gives_the_same_results():
+    assert run()[3:] == run(Profile)[3:] == ('10\n', {'n': 0, 's': 10})
+
+
+def test_statement_counts():
+    profile = []
+    tree, root_id, program, _, _ = run(lambda program: profile.append(Profile(program)) or profile[0])
+    entries = {(Kinds.names[entry.kind], entry.line): entry for entry in profile[0].statements(tree, root_id)}
+    assert entries['repeat', 3].count == 1 and entries['repeat', 3].iterations == 4
+    assert entries['assign', 4].count == 4
+    assert entries['write', 7].count == 1
+    assert sum(profile[0].counts) > 0 and profile[0].total > 0
+
+
+def test_errors_are_reported_by_both_loops():
+    program = TinyCompiler.compile(*TinyParser.parse('read x;\ny := 1 / x'))
+    for profile in (None, Profile(program)):
+        with collecting() as diagnostics:
+            TinyVM.run(program, io.StringIO('0'), io.StringIO(), profile)
+        assert diagnostics.lines() == ['ERROR @ LINE 2: Division by zero']
+
+
+def test_plain_loop_has_no_profiling_code():
+    code = tiny_vm.loop.__code__
+    assert 'perf_counter' not in code.co_names
+    assert not {'counts', 'times', 'taken', 'clock'} & set(code.co_varnames)
+    assert 'perf_counter' in tiny_vm.profiled_loop.__code__.co_names
+
+
+def test_profiled_loop_is_the_plain_loop_with_profiling_lines():
+    # Everything but the def line and the lines marked `# profile` must be the same
+    plain = inspect.getsource(tiny_vm.loop).splitlines()[1:]
+    profiled = inspect.getsource(tiny_vm.profiled_loop).splitlines()[1:]
+    assert [line for line in profiled if not line.endswith('  # profile')] == plain
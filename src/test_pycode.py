@@ -0,0 +1,76 @@
+from tiny_ll_parser import TinyLLParser
+from tiny_pycode import TinyPyCompiler, compile_source
+from tiny_vm import TinyCompiler, TinyVM
+from tiny_gen import generate
+from errors import collecting
+from collections import OrderedDict
+import io
+import tiny_pycode
+
+
+def run_both(source, input=''):
+    '''
+    (output, variables, errors) of source on the python backend and on the vm
+    '''
+
+    results = []
+    for backend in ('python', 'vm'):
+        output = io.StringIO()
+        with collecting() as diagnostics:
+            tree, root_id = TinyLLParser.parse(source)
+            if backend == 'python':
+                program = TinyPyCompiler.compile(tree, root_id)
+                variables = program.run(io.StringIO(input), output) if program else None
+            else:
+                variables = TinyVM.run(TinyCompiler.compile(tree, root_id), io.StringIO(input), output)
+        results.append((output.getvalue(), variables, diagnostics.lines()))
+    return results
+
+
+def test_generated_programs():
+    for seed in range(5):
+        source = generate(statements=150, seed=seed).replace('read', 'write')
+        python, vm = run_both(source)
+        assert python == vm
+
+
+def test_long_expressions():
+    python, vm = run_both('x := ' + ' + '.join(['1'] * 3000) + '; write x')
+    assert python == vm
+    assert python[0] == '3000\n'
+
+
+def test_deeply_nested_expressions():
+    for source in ('x := ' + '(' * 3000 + '2' + ' - 1)' * 3000, 'x := ' + '1 - (' * 3000 + '2' + ')' * 3000,
+                   'if ' + '1 + (' * 500 + '1' + ')' * 500 + ' < 3 then x := 1 else x := 2 end',
+                   'repeat x := x + 1 until ' + '(' * 500 + 'x' + ' - 1)' * 500 + ' = 3'):
+        python, vm = run_both(source + '; write x')
+        assert python == vm
+        assert not python[2]
+
+
+def test_divisions_fail_in_order():
+    # The division on line 1 comes first, the one on line 2 is nested deep enough to be computed apart
+    source = 'x := (1 / (0 * 1)) - ' + '(1 - ' * 300 + '\n2 / 0' + ')' * 300
+    python, vm = run_both(source)
+    assert python == vm
+    assert python[2] == ['ERROR @ LINE 1: Division by zero']
+
+
+def test_deeply_nested_statements():
+    python, vm = run_both('if 1 < 2 then ' * 3000 + 'write 1' + ' end' * 3000)
+    assert vm[0] == '1\n'
+    assert python[2] == ['ERROR @ LINE 1: Statements nested too deeply for the python backend, run it on the vm']
+
+
+def test_compiled_programs_are_bounded(monkeypatch):
+    monkeypatch.setattr(tiny_pycode, '_programs', OrderedDict())
+    first = compile_source('write 0')
+    for n in range(1, tiny_pycode.programs_size + 10):
+        compile_source('write {n}'.format(n=n))
+        # The first program stays in use, the others drop out oldest first
+        assert compile_source('write 0') is first
+    assert len(tiny_pycode._programs) == tiny_pycode.programs_size
+    output = io.StringIO()
+    compile_source('write 1').run(io.StringIO(), output)
+    assert output.getvalue() == '1\n'
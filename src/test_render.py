@@ -0,0 +1,29 @@
+from tiny_render import to_dot
+from tiny_parser import TinyParser, Kinds
+from tiny_gen import generate
+from errors import collecting
+import re
+
+node_line = re.compile(r'(\d+) \[pos=')
+edge_line = re.compile(r'(\d+) -> (\d+) \[(.*)\];')
+
+
+def test_dot_has_a_node_per_tree_node_and_an_edge_per_child():
+    for source in ('write 1', 'read x;\nif x < 1 then write x else x := 2 end;\nwrite 3', generate(statements=80, seed=4)):
+        with collecting():
+            tree, root_id = TinyParser.parse(source)
+        dot = to_dot(tree, root_id)
+        node_ids = [node_id for node_id, _ in tree.walk(root_id)]
+        assert sorted(int(node_id) for node_id in node_line.findall(dot)) == sorted(node_ids)
+
+        edges = edge_line.findall(dot)
+        visible = [(int(tail), int(head)) for tail, head, attributes in edges if 'invis' not in attributes]
+        hidden = [edge for edge in edges if 'invis' in edge[2]]
+        sequences = [node_id for node_id in node_ids if tree.kind[node_id] == Kinds.STMT_SEQUENCE]
+        # Every node hangs off one edge, visible unless it's a sequence, but the root and
+        # the first statement of a root sequence, and every sequence child also gets an
+        # invisible edge from its sequence
+        tops = {root_id, tree.first_child[root_id] if root_id in sequences else root_id}
+        heads = [node_id for node_id in node_ids if node_id not in tops and tree.kind[node_id] != Kinds.STMT_SEQUENCE]
+        assert sorted(head for _, head in visible) == sorted(heads)
+        assert len(hidden) == len(sequences) - (root_id in sequences) + sum(len(list(tree.children(node_id))) for node_id in sequences)
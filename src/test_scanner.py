@@ -0,0 +1,87 @@
+from tiny_scanner import TinyScanner, Names
+from tiny_gen import generate
+from errors import collecting
+from concurrent.futures import ThreadPoolExecutor
+import io
+import random
+import pytest
+
+sample = '''{ Sample program in TINY language - computes factorial
+}
+read x; {input an integer }
+if 0 < x then { don't compute if x <= 0 }
+fact := 1;
+repeat
+fact := fact * x;
+x := x - 1
+until x = 0;
+write fact { output factorial of x }
+end
+'''
+
+alphabet = ['if', 'then', 'x', 'ab', '12', '0', ':', ':=', '{', '}', ' ', '\n', '\t', ';', '+', '-', '*', '/', '=', '<',
+            '(', ')', '@', '\r', 'end', 'iff']
+
+
+def scanned(tokenize, source, **options):
+    with collecting() as diagnostics:
+        tokens = list(tokenize(source, **options))
+    return tokens, diagnostics.lines()
+
+
+def random_sources(count, seed=7):
+    chooser = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(chooser.choice(alphabet) for _ in range(chooser.randint(0, 40)))
+
+
+@pytest.mark.parametrize('columns', [False, True])
+def test_tokenize_fast_matches_tokenize(columns):
+    sources = [sample, generate(statements=300, seed=3), ':\nx y\n z'] + list(random_sources(500))
+    for source in sources:
+        assert scanned(TinyScanner.tokenize_fast, source, columns=columns) == scanned(TinyScanner.tokenize, source, columns=columns), source
+
+
+def test_tokenize_fast_interns_names():
+    source = generate(statements=200, seed=5)
+    slow, fast = Names(), Names()
+    assert scanned(TinyScanner.tokenize_fast, source, names=fast) == scanned(TinyScanner.tokenize, source, names=slow)
+    assert fast.names == slow.names
+
+
+def test_batches_across_windows():
+    source = generate(statements=200, seed=11)
+    expected = list(TinyScanner.tokenize(source))
+    for window in (1, 7, 64):
+        tokens = []
+        for batch in TinyScanner.tokenize_batches(source, window):
+            tokens.extend((batch.value(index), batch.types[index], batch.lines[index]) for index in range(len(batch)))
+        assert [(value, line) for value, _, line in expected] == [(value, line) for value, _, line in tokens]
+
+
+def test_unterminated_comment_after_bad_assign():
+    for source in (':x{', 'x := 1;\n:y { never closed', ':x\n{\n'):
+        expected = scanned(TinyScanner.tokenize, source, columns=True)
+        assert expected[1][-1].endswith('Unterminated comment')
+        assert scanned(TinyScanner.tokenize_fast, source, columns=True) == expected
+        for window in (1, 2, 64):
+            with collecting() as diagnostics:
+                list(TinyScanner.tokenize_batches(source, window))
+            assert diagnostics.lines() == expected[1]
+        with collecting() as diagnostics:
+            list(TinyScanner.tokenize_stream(io.StringIO(source), 2))
+        # Columns of lines starting in an earlier chunk are unknown to the stream
+        assert [entry.message for entry in diagnostics.entries] == ['Illegal character after `:`', 'Unterminated comment']
+
+
+def test_batches_in_threads():
+    # Comments aren't kept in the shared lexeme table, every thread scans them on its own
+    sources = [generate(statements=300, seed=seed).replace(';', '; {{ c{seed} }}\n'.format(seed=seed), 40) for seed in range(8)]
+
+    def scan(source):
+        return [(batch.types.tolist(), batch.starts.tolist(), batch.lines.tolist()) for batch in TinyScanner.tokenize_batches(source, 1 << 10)]
+
+    expected = list(map(scan, sources))
+    with ThreadPoolExecutor(8) as executor:
+        for _ in range(5):
+            assert list(executor.map(scan, sources)) == expected
@@ -0,0 +1,38 @@
+import tiny_server
+from tiny_client import INVALID_PARAMS, INTERNAL_ERROR, TIME_LIMIT_EXCEEDED
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def worker():
+    tiny_server._init_worker(None, 0.5)
+    yield
+    tiny_server._init_worker(None, None)
+
+
+def test_run():
+    result, failure = tiny_server.handle('run', {'source': 'read x; write x * 2', 'input': '21'})
+    assert failure is None
+    assert result['output'] == '42\n' and result['variables'] == {'x': 21}
+    assert result['errors'] == {'count': 0, 'errors': []}
+
+
+def test_invalid_params():
+    for method, params in (('run', {'source': 'write 1', 'speed': 3}), ('parse', {}), ('ping', {'source': ''}),
+                           ('run', {'source': 1}), ('parse', {'source': 'write 1', 'optimize': 'yes'})):
+        result, failure = tiny_server.handle(method, params)
+        assert result is None and failure[0] == INVALID_PARAMS, (method, params)
+
+
+def test_type_errors_inside_a_method_are_internal(monkeypatch):
+    monkeypatch.setitem(tiny_server.methods, 'ping', lambda: None + 1)
+    result, failure = tiny_server.handle('ping', {})
+    assert failure[0] == INTERNAL_ERROR and failure[1].startswith('TypeError')
+
+
+@pytest.mark.parametrize('backend', ['vm', 'python'])
+def test_endless_programs_are_stopped(backend):
+    result, failure = tiny_server.handle('run', {'source': 'x := 0; repeat x := x + 1 until 0', 'backend': backend})
+    assert failure[0] == TIME_LIMIT_EXCEEDED
+    # The worker goes on serving
+    assert tiny_server.handle('run', {'source': 'write 1', 'backend': backend})[0]['output'] == '1\n'
@@ -0,0 +1,125 @@
+from tiny_ssa import Ops, lower, propagate_constants, eliminate_dead_code
+from tiny_parser import TinyParser
+from tiny_vm import TinyCompiler, TinyVM
+from tiny_gen import ProgramGenerator
+from errors import collecting
+import io
+import re
+
+
+def parsed(source):
+    with collecting() as diagnostics:
+        tree, root_id = TinyParser.parse(source)
+    assert not diagnostics.count, diagnostics.lines()
+    return tree, root_id
+
+
+def vm_output(source, numbers):
+    output = io.StringIO()
+    with collecting() as diagnostics:
+        TinyVM.run(TinyCompiler.compile(*parsed(source)), io.StringIO(' '.join(map(str, numbers))), output)
+    assert not diagnostics.count, diagnostics.lines()
+    return output.getvalue()
+
+
+def execute(function, numbers):
+    '''
+    What function writes reading numbers, the IR run directly
+    '''
+
+    values, written, numbers = {}, [], iter(numbers)
+    block, came_from = 0, None
+    while True:
+        instructions = function.blocks[block]
+        # Phis take their values together, from the edge the block was entered by
+        phis = [value for value in instructions if function.op[value] == Ops.PHI]
+        if phis:
+            index = function.predecessors[block].index(came_from)
+            values.update([(value, values[function.phi_args[value][index]]) for value in phis])
+        target = None
+        for value in instructions[len(phis):]:
+            op, a, b = function.op[value], function.a[value], function.b[value]
+            if op == Ops.CONST:
+                values[value] = function.consts[a]
+            elif op == Ops.READ:
+                values[value] = next(numbers)
+            elif op == Ops.WRITE:
+                written.append('%d\n' % values[a])
+            elif op == Ops.BRANCH:
+                target = function.successors[block][0 if values[a] else 1]
+            elif op == Ops.JUMP:
+                target = function.successors[block][0]
+            elif op == Ops.HALT:
+                return ''.join(written)
+            elif op == Ops.DIV:
+                quotient = abs(values[a]) // abs(values[b])
+                values[value] = quotient if (values[a] < 0) == (values[b] < 0) else -quotient
+            else:
+                left, right = values[a], values[b]
+                values[value] = {Ops.ADD: left + right, Ops.SUB: left - right, Ops.MUL: left * right,
+                                 Ops.LESS: int(left < right), Ops.EQUAL: int(left == right)}[op]
+        assert target is not None, function.dump()
+        block, came_from = target, block
+
+
+def optimized(source):
+    function = lower(*parsed(source))
+    propagate_constants(function)
+    eliminate_dead_code(function)
+    function.compact()
+    return function
+
+
+def ops(function):
+    return [Ops.names[function.op[value]] for values in function.blocks for value in values]
+
+
+def test_loop_carried_phi():
+    source = 'read n;\ni := 0;\ns := 0;\nrepeat\n  s := s + i;\n  i := i + 1\nuntil n < i + 1;\nwrite s;\nwrite i'
+    for function in (lower(*parsed(source)), optimized(source)):
+        header = [block for block, values in enumerate(function.blocks) if len(function.predecessors[block]) == 2][0]
+        phis = [value for value in function.blocks[header] if function.op[value] == Ops.PHI]
+        assert sorted(function.names[function.variables[value]] for value in phis) == ['i', 's']
+        # One value from before the loop, one from its own body coming back
+        latch = function.predecessors[header][1]
+        assert header in function.successors[latch]
+        for value in phis:
+            assert function.op[function.phi_args[value][0]] == Ops.CONST
+            assert function.op[function.phi_args[value][1]] == Ops.ADD
+        for n in (1, 2, 5, 10):
+            assert execute(function, [n]) == vm_output(source, [n]) == '{s}\n{n}\n'.format(s=n * (n - 1) // 2, n=n)
+
+
+def test_constant_branch_is_folded():
+    source = 'x := 3;\nif x < 5 then\n  write x * 2\nelse\n  write 0 - 1\nend;\nread y;\nif y = 1 then write y end'
+    function = lower(*parsed(source))
+    assert ops(function).count('branch') == 2
+    folded = optimized(source)
+    # The first test is known to hold, its else block is gone and the write takes a constant
+    assert ops(folded).count('branch') == 1
+    assert ops(folded).count('write') == 2 and 'less' not in ops(folded) and 'mul' not in ops(folded)
+    assert sum(1 for values in folded.blocks if values) < sum(1 for values in function.blocks if values)
+    for y in (0, 1):
+        assert execute(function, [y]) == execute(folded, [y]) == vm_output(source, [y])
+
+
+def test_dead_code_is_removed():
+    source = 'x := 1 + 2;\ny := x * 7;\nread z;\nt := z * 2;\nu := t - y;\nd := z / 2;\nk := z / z;\nwrite z + 1'
+    function = optimized(source)
+    # Only the read, the division by z (it may fail) and what the write uses are left
+    assert sorted(ops(function)) == sorted(['read', 'div', 'const', 'add', 'write', 'halt'])
+    for z in (1, 4, -3):
+        assert execute(function, [z]) == vm_output(source, [z]) == '{0}\n'.format(z + 1)
+    assert eliminate_dead_code(function) == 0
+
+
+def test_generated_programs_match_the_vm():
+    for seed in range(6):
+        generator = ProgramGenerator(comments=0, seed=seed)
+        # As in test_vm: every variable is read first and every loop runs once, no divisions
+        body = re.sub(r'until .*?(;?)$', r'until 0 < 1\1', generator.program(120), flags=re.M).replace('/', '-')
+        source = ''.join('read {name};\n'.format(name=name) for name in generator.variables) + body
+        numbers = [(seed + 1) * (index % 7 - 3) + index for index in range(len(generator.variables) + 60)]
+        expected = vm_output(source, numbers)
+        assert execute(lower(*parsed(source)), numbers) == expected
+        assert execute(optimized(source), numbers) == expected
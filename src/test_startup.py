@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import tiny_bench
+
+# Backends the scanner alone must not load
+heavy = ('tiny_parser', 'tiny_cache', 'treelib', 'pydot', 'matplotlib', 'numpy', 'hashlib', 'tempfile')
+
+
+def imported(arguments):
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0, process.stderr
+    return {line.split('|')[2].strip() for line in process.stderr.splitlines() if line.startswith('import time:')}
+
+
+def test_scan_without_cache_loads_no_backend(tmp_path):
+    path = tmp_path / 'program.tny'
+    path.write_text('read x;\nwrite x\n')
+    modules = imported([tiny_bench.main_script, 'scan', '--no-cache', str(path)])
+    assert 'tiny_scanner' in modules
+    assert [name for name in heavy if name in modules] == []
+
+
+def test_parse_loads_the_parser(tmp_path):
+    path = tmp_path / 'program.tny'
+    path.write_text('read x;\nwrite x\n')
+    assert 'tiny_parser' in imported([tiny_bench.main_script, 'parse', '--no-cache', str(path)])
+
+
+
+def test_bare_stats_after_the_file(tmp_path):
+    path = tmp_path / 'program.tny'
+    path.write_text('read x;\nwrite x\n')
+    process = subprocess.run([sys.executable, tiny_bench.main_script, 'scan', '--no-cache', str(path), '--stats'],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0, process.stderr
+    assert '"scan"' in process.stderr
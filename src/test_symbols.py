@@ -0,0 +1,24 @@
+from tiny_parser import TinyParser
+from tiny_symbols import SymbolTable, build
+
+source = 'read x;\ny := x + z;\nwrite x'
+
+
+def test_table_filled_while_parsing():
+    symbols = SymbolTable()
+    TinyParser.parse(source, symbols=symbols)
+    assert symbols.definitions('x') == [(1, 1)]
+    assert [line for _, line in symbols.uses('x')] == [2, 3]
+    assert symbols.never_read() == ['y']
+    assert symbols.never_defined() == ['z']
+    assert list(symbols) == ['x', 'y', 'z']
+
+
+def test_build_matches_the_parser():
+    symbols = SymbolTable()
+    tree, root_id = TinyParser.parse(source, symbols=symbols)
+    built = build(tree, root_id)
+    for name in symbols:
+        assert built.definitions(name) == symbols.definitions(name)
+        assert built.uses(name) == symbols.uses(name)
+    assert built.never_read() == symbols.never_read()
@@ -0,0 +1,67 @@
+from tiny_parser import TinyParser
+from tiny_pycode import TinyPyCompiler
+from tiny_vm import TinyCompiler, TinyVM
+from tiny_gen import ProgramGenerator
+from errors import collecting
+import io
+import random
+import re
+
+factorial = '''read x;
+if 0 < x then
+  fact := 1;
+  repeat
+    fact := fact * x;
+    x := x - 1
+  until x = 0;
+  write fact
+end'''
+
+
+def run(source, input='', backend='vm'):
+    '''
+    (output, variables, errors) of source on the vm or the python backend
+    '''
+
+    output = io.StringIO()
+    with collecting() as diagnostics:
+        tree, root_id = TinyParser.parse(source)
+        assert not diagnostics.count, diagnostics.lines()
+        if backend == 'vm':
+            variables = TinyVM.run(TinyCompiler.compile(tree, root_id), io.StringIO(input), output)
+        else:
+            variables = TinyPyCompiler.compile(tree, root_id).run(io.StringIO(input), output)
+    return output.getvalue(), variables, diagnostics.lines()
+
+
+def test_factorial():
+    assert run(factorial, '5\n') == ('120\n', {'x': 0, 'fact': 120}, [])
+    assert run(factorial, '0') == ('', {'x': 0, 'fact': 0}, [])
+
+
+def test_generated_programs_match_the_python_backend():
+    chooser = random.Random(3)
+    for seed in range(8):
+        generator = ProgramGenerator(comments=0, seed=seed)
+        # Every variable is read first and every loop runs once so the programs end, half of them
+        # without divisions so they don't stop at the first one by zero
+        body = re.sub(r'until .*?(;?)$', r'until 0 < 1\1', generator.program(150), flags=re.M)
+        if seed % 2:
+            body = body.replace('/', '-')
+        source = ''.join('read {name};\n'.format(name=name) for name in generator.variables) + body
+        numbers = [chooser.choice([-1, 1]) * chooser.randint(1, 50) for _ in range(len(generator.variables) + 60)]
+        input = '\n'.join(' '.join(map(str, numbers[start:start + 3])) for start in range(0, len(numbers), 3))
+        vm = run(source, input)
+        assert vm == run(source, input, 'python'), source
+
+
+def test_division_truncates_toward_zero():
+    assert run('write (0 - 7) / 2; write 7 / (0 - 2); write (0 - 7) / (0 - 2); write 7 / 2')[0] == '-3\n-3\n3\n3\n'
+
+
+def test_errors_stop_the_program():
+    assert run('read x;\nwrite x;\nread y;\nwrite y', '4') == ('4\n', {'x': 4, 'y': 0}, ['ERROR @ LINE 3: Nothing left to read'])
+    assert run('write 1;\nread x', 'a1') == ('1\n', {'x': 0}, ['ERROR @ LINE 2: Read a non integer value `a1`'])
+    assert run('x := 1;\nwrite x / (x - 1);\nwrite 2') == ('', {'x': 1}, ['ERROR @ LINE 2: Division by zero'])
+    for source, input in (('read x;\nwrite x;\nread y', '4'), ('write 1;\nread x', 'a1'), ('x := 1;\nwrite x / (x - 1)', '')):
+        assert run(source, input) == run(source, input, 'python')
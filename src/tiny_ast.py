@@ -0,0 +1,342 @@
+'''
+Syntax tree files
+
+Inputs:
+    Syntax tree (ParseTree) and its root node id
+
+Output:
+    The tree as JSON, as an S-expression or in the binary .ast format, loaded back without parsing
+
+Usage:
+    python tiny_ast.py in_file.ext [--format json|sexp|bin] [-o out_file]
+    write_json(tree, root_id, out_file)         # text files
+    write_sexp(tree, root_id, out_file)
+    write_tree(tree, root_id, 'out.ast')        # a path or a seekable binary file
+    with TreeFile('out.ast') as nodes:
+        nodes.kind[nodes.root], nodes.value(nodes.root), list(nodes.children(nodes.root))
+        tree, root_id = nodes.to_tree()
+
+JSON nodes are {"kind": ..., "value": ..., "line": ..., "children": [...]}, without value when the
+node has none (stmt_sequence, if, repeat, write) and without children for leaves; an empty program
+is null. S-expressions are (kind value line children...), string values quoted the JSON way. Both are
+written in pre-order with an explicit stack, buffer_nodes nodes at a time, whatever the tree's depth.
+
+Tree files (.ast, little-endian):
+    header  : magic b'TINYAST\\0', version (u16), words per record (u16), string count (u32),
+              root node id (u32), node count (u64, sentinel node 0 included), string table offset (u64),
+              string table size (u64)
+    records : a record of 5 u32 per node right after the header, kind, value, line, first child and
+              next sibling node ids (0 for none)
+    strings : string count + 1 u32 offsets into the UTF-8 text of every distinct value that follows
+
+Nodes are numbered in pre-order from 1, only the nodes under the root are written. A value is an
+index into the string table, with the high bit set for an integer (its decimal text), 0xFFFFFFFF for
+none. TreeFile maps the file with mmap and reads the columns as strided memoryviews, no object is
+made per node until asked for; to_tree() copies the columns into a ParseTree at C speed.
+'''
+
+from tiny_parser import ParseTree, Kinds
+from array import array
+from itertools import accumulate
+import argparse
+import json
+import mmap
+import struct
+import sys
+
+ast_magic = b'TINYAST\0'
+ast_version = 1
+ast_header = struct.Struct('<8sHHIIQQQ')
+ast_record_words = 5
+no_value = 0xFFFFFFFF
+int_value = 0x80000000
+
+
+def write_json(tree, root_id, out, buffer_nodes=1 << 12):
+    '''
+    Writes the tree to the text file out as a JSON document
+    '''
+
+    kinds, values, lines, first_child, next_sibling = tree.kind, tree.value, tree.line, tree.first_child, tree.next_sibling
+    names, dumps = Kinds.names, json.dumps
+    if not root_id:
+        out.write('null\n')
+        return
+
+    pieces = []
+    stack = [root_id]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            pieces.append(item)
+            continue
+        value = values[item]
+        piece = '{"kind": "' + names[kinds[item]] + '", '
+        if value is not None:
+            piece += '"value": ' + dumps(value) + ', '
+        piece += '"line": ' + str(lines[item])
+        child_id = first_child[item]
+        if child_id:
+            pieces.append(piece + ', "children": [')
+            stack.append(']}')
+            children = []
+            while child_id:
+                children.append(child_id)
+                child_id = next_sibling[child_id]
+            stack.append(children.pop())
+            while children:
+                stack.append(', ')
+                stack.append(children.pop())
+        else:
+            pieces.append(piece + '}')
+            if len(pieces) >= buffer_nodes:
+                out.write(''.join(pieces))
+                pieces = []
+    pieces.append('\n')
+    out.write(''.join(pieces))
+
+
+def write_sexp(tree, root_id, out, buffer_nodes=1 << 12):
+    '''
+    Writes the tree to the text file out as an S-expression
+    '''
+
+    kinds, values, lines, first_child, next_sibling = tree.kind, tree.value, tree.line, tree.first_child, tree.next_sibling
+    names, dumps = Kinds.names, json.dumps
+    if not root_id:
+        out.write('()\n')
+        return
+
+    pieces = []
+    stack = [root_id]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            pieces.append(item)
+            continue
+        value = values[item]
+        piece = '(' + names[kinds[item]]
+        if value is not None:
+            piece += ' ' + dumps(value)
+        piece += ' ' + str(lines[item])
+        child_id = first_child[item]
+        if child_id:
+            pieces.append(piece)
+            stack.append(')')
+            children = []
+            while child_id:
+                children.append(child_id)
+                child_id = next_sibling[child_id]
+            while children:
+                stack.append(children.pop())
+                stack.append(' ')
+        else:
+            pieces.append(piece + ')')
+            if len(pieces) >= buffer_nodes:
+                out.write(''.join(pieces))
+                pieces = []
+    pieces.append('\n')
+    out.write(''.join(pieces))
+
+
+def write_tree(tree, root_id, out):
+    '''
+    Writes the tree to a .ast file, out is a path or a seekable binary file
+    '''
+
+    own = not hasattr(out, 'write')
+    out = open(out, 'wb') if own else out
+    try:
+        order = [node_id for node_id, depth in tree.walk(root_id)]
+        count = len(order) + 1
+        # Pre-order ids, the sentinel keeps 0
+        ids = array('l', [0]) * len(tree.kind)
+        for new_id, node_id in enumerate(order, 1):
+            ids[node_id] = new_id
+
+        # Values interned in order of appearance, the same tree gives the same file
+        strings = {}
+        words = array('I', [no_value]) * count
+        values = tree.value
+        for new_id, node_id in enumerate(order, 1):
+            value = values[node_id]
+            if value is None:
+                continue
+            text = str(value)
+            index = strings.get(text)
+            if index is None:
+                index = strings[text] = len(strings)
+            words[new_id] = index | int_value if isinstance(value, int) else index
+
+        records = array('I', [0]) * (count * ast_record_words)
+        records[ast_record_words::ast_record_words] = array('I', map(tree.kind.__getitem__, order))
+        records[1::ast_record_words] = words
+        records[ast_record_words + 2::ast_record_words] = array('I', map(tree.line.__getitem__, order))
+        records[ast_record_words + 3::ast_record_words] = array('I', map(ids.__getitem__, map(tree.first_child.__getitem__, order)))
+        records[ast_record_words + 4::ast_record_words] = array('I', map(ids.__getitem__, map(tree.next_sibling.__getitem__, order)))
+
+        encoded = [string.encode('utf-8', 'surrogatepass') for string in strings]
+        offsets = array('I', accumulate(map(len, encoded), initial=0))
+        if sys.byteorder == 'big':
+            records.byteswap()
+            offsets.byteswap()
+        table = offsets.tobytes() + b''.join(encoded)
+        strings_offset = ast_header.size + count * ast_record_words * 4
+        out.write(ast_header.pack(ast_magic, ast_version, ast_record_words, len(encoded), ids[root_id] if root_id else 0,
+                                  count, strings_offset, len(table)))
+        out.write(records.tobytes())
+        out.write(table)
+    finally:
+        if own:
+            out.close()
+
+
+class TreeFile(object):
+    '''
+    Nodes of a .ast file (a path or a bytes-like object)
+
+    kind, line, first_child and next_sibling are strided memoryviews of the mapping indexed by node id
+    like the columns of a ParseTree, value(node_id) decodes a value, distinct strings once.
+    '''
+
+    def __init__(self, source):
+        self.map = None
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            data = memoryview(source)
+        else:
+            with open(source, 'rb') as infile:
+                self.map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            data = memoryview(self.map)
+        self.data = data
+        if len(data) < ast_header.size:
+            raise ValueError('Not a tree file')
+        magic, version, words, string_count, root, count, strings_offset, strings_size = ast_header.unpack_from(data)
+        if magic != ast_magic:
+            raise ValueError('Not a tree file')
+        if version != ast_version or words != ast_record_words:
+            raise ValueError('Unsupported tree file version {version}'.format(version=version))
+        if strings_offset + strings_size > len(data) or ast_header.size + count * words * 4 > strings_offset or root >= max(count, 1):
+            raise ValueError('Truncated tree file')
+
+        table_size = (string_count + 1) * 4
+        records = data[ast_header.size:ast_header.size + count * words * 4]
+        offsets = data[strings_offset:strings_offset + table_size]
+        if sys.byteorder == 'big':
+            # Copied, swapped to native order
+            records, offsets = array('I', records), array('I', offsets)
+            records.byteswap()
+            offsets.byteswap()
+            records, offsets = memoryview(records), memoryview(offsets)
+        else:
+            records, offsets = records.cast('I'), offsets.cast('I')
+        self.records, self.offsets = records, offsets
+        self.text = data[strings_offset + table_size:strings_offset + strings_size]
+        self.root = root
+        self.kind = records[0::words]
+        self.values = records[1::words]
+        self.line = records[2::words]
+        self.first_child = records[3::words]
+        self.next_sibling = records[4::words]
+        self.strings = {}
+
+    def __len__(self):
+        return len(self.kind) - 1
+
+    def string(self, index):
+        return bytes(self.text[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8', 'surrogatepass')
+
+    def value_of(self, word):
+        value = self.strings.get(word)
+        if value is None and word != no_value:
+            text = self.string(word & ~int_value)
+            value = self.strings[word] = int(text) if word & int_value else text
+        return value
+
+    def value(self, node_id):
+        return self.value_of(self.values[node_id])
+
+    def children(self, node_id):
+        child_id = self.first_child[node_id]
+        next_sibling = self.next_sibling
+        while child_id:
+            yield child_id
+            child_id = next_sibling[child_id]
+
+    def walk(self, root_id):
+        '''
+        Pre-order (node_id, depth) pairs, like ParseTree.walk
+        '''
+
+        return ParseTree.walk(self, root_id)
+
+    def to_tree(self):
+        '''
+        (ParseTree, root_id) of the nodes, for the passes that change trees
+        '''
+
+        tree = ParseTree()
+        tree.kind = array('B', self.kind)
+        tree.line = array('l', self.line)
+        tree.first_child = array('l', self.first_child)
+        tree.next_sibling = array('l', self.next_sibling)
+        decoded = {word: self.value_of(word) for word in set(self.values)}
+        tree.value = list(map(decoded.__getitem__, self.values))
+        last_child = array('l', [0]) * len(self.kind)
+        next_sibling = tree.next_sibling
+        for node_id, child_id in enumerate(tree.first_child):
+            if child_id:
+                while next_sibling[child_id]:
+                    child_id = next_sibling[child_id]
+                last_child[node_id] = child_id
+        tree.last_child = last_child
+        return tree, self.root
+
+    def close(self):
+        self.strings = {}
+        for view in (self.kind, self.values, self.line, self.first_child, self.next_sibling, self.records, self.offsets, self.text, self.data):
+            view.release()
+        if self.map is not None:
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def write(tree, root_id, format, out):
+    '''
+    Writes the tree in format (json, sexp or bin) to out, a path or a file (binary for bin)
+    '''
+
+    if format == 'bin':
+        write_tree(tree, root_id, out)
+        return
+    writer = write_json if format == 'json' else write_sexp
+    if hasattr(out, 'write'):
+        writer(tree, root_id, out)
+    else:
+        with open(out, 'w') as outfile:
+            writer(tree, root_id, outfile)
+
+
+def main(argv):
+    from tiny_parser import TinyParser
+    parser = argparse.ArgumentParser(prog='tiny_ast', description='Syntax tree of a TINY program as JSON, an S-expression or a .ast file')
+    parser.add_argument('infile')
+    parser.add_argument('--format', choices=('json', 'sexp', 'bin'), default='json')
+    parser.add_argument('-o', '--out', help='output file, stdout by default')
+    args = parser.parse_args(argv)
+    with open(args.infile, 'r') as infile:
+        tree, root_id = TinyParser.parse(infile.read())
+    if args.out:
+        write(tree, root_id, args.format, args.out)
+    else:
+        write(tree, root_id, args.format, sys.stdout.buffer if args.format == 'bin' else sys.stdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
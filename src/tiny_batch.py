@@ -0,0 +1,188 @@
+'''
+Batch compilation
+
+Inputs:
+    TINY source files, directories holding them or glob patterns
+
+Output:
+    A report line per file followed by its errors, in input order. With an output directory,
+    the token list (-s) or tree image (-p, PNG, SVG or DOT) of every file, laid out like the inputs.
+
+Usage:
+    tinycompiler batch -s|-p <file|directory|glob>... [-o out_dir] [--image png|svg|dot] [-O] [-j jobs] [--pattern *.txt] [--no-cache]
+    for result in compile_files(paths, '-p', out_dir):
+        ...
+
+Files are spread over a process pool in chunks, every worker collects the errors of each file in
+its own Diagnostics (and captures anything else printed to stderr), so each file gets its own report.
+
+Exit status:
+    0 : every file compiled without errors
+    1 : some files have compilation errors
+    2 : some files couldn't be read or their output couldn't be written
+'''
+
+from tiny_cache import Cache, scan_file, parse_source, image_source
+from errors import collecting
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import fnmatch
+import glob
+import io
+import os
+import sys
+
+FileResult = namedtuple('FileResult', ['path', 'errors', 'messages', 'failure'])
+
+output_suffixes = {'-s': '.tokens.txt', 'png': '.png', 'svg': '.svg', 'dot': '.dot'}
+
+# One cache per worker process and directory, so its size is only measured once
+_caches = {}
+
+
+def expand_inputs(arguments, pattern='*.txt', skip=None):
+    '''
+    Files named by arguments: files as they are, every file matching pattern under a directory
+    and the files a glob matches, sorted
+
+    The directory skip (the output directory) isn't walked, so earlier outputs aren't picked up as inputs.
+    '''
+
+    skipped = os.path.realpath(skip) if skip else None
+    paths = []
+    for argument in arguments:
+        if os.path.isdir(argument):
+            for folder, folders, files in os.walk(argument):
+                folders[:] = sorted(name for name in folders if os.path.realpath(os.path.join(folder, name)) != skipped)
+                paths.extend(os.path.join(folder, name) for name in sorted(fnmatch.filter(files, pattern)))
+        elif any(c in argument for c in '*?['):
+            paths.extend(sorted(path for path in glob.glob(argument, recursive=True) if os.path.isfile(path)))
+        else:
+            paths.append(argument)
+    return paths
+
+
+def output_paths(paths, kind, out_dir):
+    '''
+    Output file of every input, the inputs' folders are mirrored under out_dir, kind is -s or an image format
+    '''
+
+    if not out_dir:
+        return [None] * len(paths)
+    folders = [os.path.dirname(os.path.abspath(path)) for path in paths]
+    root = os.path.commonpath(folders) if folders else ''
+    return [os.path.join(out_dir, os.path.relpath(os.path.abspath(path), root)) + output_suffixes[kind] for path in paths]
+
+
+def compile_file(path, mode, out_path=None, cache_dir=None, image_format='png', optimize=False):
+    '''
+    Scans (-s) or parses (-p) a single file, writing the token list or the (optimized) tree image
+    to out_path, through the cache in cache_dir if there's one
+    '''
+
+    cache = None
+    if cache_dir is not None:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = Cache(cache_dir)
+    stderr = io.StringIO()
+    failure = None
+    with collecting() as diagnostics:
+        try:
+            with contextlib.redirect_stderr(stderr):
+                if out_path:
+                    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+                if mode == '-s':
+                    with open(path, 'r') as infile:
+                        batches = scan_file(infile, cache)
+                        outfile = open(out_path, 'w') if out_path else None
+                        try:
+                            for batch in batches:
+                                if outfile:
+                                    for elm in batch:
+                                        outfile.write(str(elm[0]) + ', ' + str(elm[1]) + '\n')
+                        finally:
+                            if outfile:
+                                outfile.close()
+                else:
+                    with open(path, 'r') as infile:
+                        source = infile.read()
+                    if out_path:
+                        image = image_source(source, image_format, cache, optimize)
+                        with open(out_path, 'wb') as image_file:
+                            image_file.write(image)
+                    else:
+                        parse_source(source, cache, optimize)
+        except Exception as e:
+            failure = '{kind}: {msg}'.format(kind=type(e).__name__, msg=e)
+
+    messages = diagnostics.lines() + stderr.getvalue().splitlines()
+    return FileResult(path, diagnostics.count, messages, failure)
+
+
+def _compile_task(task):
+    return compile_file(*task)
+
+
+def compile_files(paths, mode, out_dir=None, jobs=None, chunksize=None, cache_dir=None, image_format='png', optimize=False):
+    '''
+    Yields a FileResult per path, in the order of paths, using the cache in cache_dir if given
+
+    jobs worker processes (all cores by default) get chunksize files at a time, by default
+    enough chunks to give every worker about 8 of them.
+    '''
+
+    count = len(paths)
+    out_paths = output_paths(paths, mode if mode == '-s' else image_format, out_dir)
+    tasks = list(zip(paths, [mode] * count, out_paths, [cache_dir] * count, [image_format] * count, [optimize] * count))
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) < 2:
+        yield from map(_compile_task, tasks)
+        return
+    if not chunksize:
+        chunksize = max(1, len(tasks) // (jobs * 8))
+    with ProcessPoolExecutor(min(jobs, len(tasks))) as executor:
+        yield from executor.map(_compile_task, tasks, chunksize=chunksize)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tinycompiler batch', description='Scan or parse many TINY files at once')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('-s', dest='mode', action='store_const', const='-s', help='work as a scanner')
+    mode.add_argument('-p', dest='mode', action='store_const', const='-p', help='work as a parser')
+    parser.add_argument('inputs', nargs='+', help='files, directories or glob patterns')
+    parser.add_argument('-o', '--out-dir', help='write token lists / tree images under this directory')
+    parser.add_argument('--image', choices=('png', 'svg', 'dot'), default='png', help='tree image format (default: png)')
+    parser.add_argument('-O', dest='optimize', action='store_true', help='optimize the trees before drawing them')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes, all cores by default')
+    parser.add_argument('--chunksize', type=int, help='files handed to a worker at a time')
+    parser.add_argument('--pattern', default='*.txt', help='files to pick from directories (default: *.txt)')
+    parser.add_argument('--cache-dir', help='cache directory, $TINY_CACHE_DIR or ~/.cache/tinycompiler by default')
+    parser.add_argument('--no-cache', action='store_true', help='compile every file from scratch')
+    args = parser.parse_args(argv)
+    cache_dir = None if args.no_cache else Cache(args.cache_dir).directory
+
+    paths = expand_inputs(args.inputs, args.pattern, args.out_dir)
+    if not paths:
+        print('No input files', file=sys.stderr)
+        return 2
+
+    files_with_errors = failed = 0
+    for result in compile_files(paths, args.mode, args.out_dir, args.jobs, args.chunksize, cache_dir, args.image, args.optimize):
+        if result.failure:
+            failed += 1
+            print('{path}: FAILED {failure}'.format(path=result.path, failure=result.failure))
+        elif result.errors:
+            files_with_errors += 1
+            print('{path}: {count} error(s)'.format(path=result.path, count=result.errors))
+        else:
+            print('{path}: ok'.format(path=result.path))
+        for message in result.messages:
+            print('    ' + message)
+
+    print('{total} file(s), {errors} with errors, {failed} failed'.format(total=len(paths), errors=files_with_errors, failed=failed))
+    if failed:
+        return 2
+    return 1 if files_with_errors else 0
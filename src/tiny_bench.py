@@ -0,0 +1,253 @@
+'''
+Throughput benchmarks
+
+Inputs:
+    Program sizes (statement counts) to sweep, generated by tiny_gen with a fixed seed
+
+Output:
+    Time, tokens/sec, nodes/sec and peak memory of scanning, parsing and rendering every size,
+    checked against a stored baseline
+
+Usage:
+    python tiny_bench.py [--sizes 100,1000,10000] [--stages scan,parse,render] [--repeat 3]
+                         [--baseline bench_baseline.json] [--save-baseline] [--tolerance 0.25] [--json out.json] [--ci]
+    python tiny_bench.py --startup [--budget-ms 25] [--repeat 3]
+
+Stages:
+    scan   : TinyScanner.tokenize over the whole program
+    parse  : TinyParser.parse
+    render : the main.py -p path without an output file, image_source to SVG without the cache
+
+Times are the best of --repeat runs, peak memory is measured by tracemalloc in one more run so it
+doesn't slow the timed ones. A result regresses when its tokens/sec or nodes/sec fall, or its
+peak memory grows, by more than --tolerance against the baseline. Without a baseline nothing is
+checked, unless in CI mode (--ci, or $CI set): there a missing baseline is an error, found before
+anything runs, and so is a result the baseline has no entry for.
+
+--startup runs main.py commands on a small program under `python -X importtime` and adds up the
+import time of every module a bare interpreter doesn't load. `scan --no-cache` must stay within
+--budget-ms, the other commands are reported only.
+
+Exit status:
+    0 : no regressions (or no baseline to compare to outside CI mode), startup within budget
+    1 : some results regressed, startup over budget
+    2 : no baseline in CI mode
+'''
+
+from tiny_scanner import TinyScanner
+from tiny_parser import TinyParser
+from tiny_gen import generate
+from errors import clear_errors
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+# Commands timed by --startup, the first one is held to the budget
+startup_commands = (['scan', '--no-cache'], ['scan'], ['parse', '--no-cache'], ['run', '--no-cache'])
+startup_budget_ms = 25
+
+
+def scan(source):
+    return len(list(TinyScanner.tokenize(source)))
+
+
+def parse(source):
+    return len(TinyParser.parse(source)[0])
+
+
+def render(source):
+    from tiny_cache import image_source
+    return image_source(source, 'svg')
+
+
+stages = {'scan': scan, 'parse': parse, 'render': render}
+
+
+def measure(function, source, repeat):
+    '''
+    (best time, peak memory in bytes, result) of function(source)
+    '''
+
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(source)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def run(sizes, stage_names, repeat=3, seed=0):
+    '''
+    {'stage/size': metrics} for every stage and size
+    '''
+
+    results = {}
+    for size in sizes:
+        source = generate(statements=size, seed=seed)
+        tokens = scan(source)
+        nodes = parse(source)
+        for name in stage_names:
+            seconds, peak, result = measure(stages[name], source, repeat)
+            clear_errors()
+            metrics = {'statements': size, 'bytes': len(source), 'tokens': tokens, 'nodes': nodes,
+                       'seconds': seconds, 'peak_kib': peak // 1024}
+            metrics['tokens_per_sec'] = tokens / seconds if seconds else 0
+            metrics['nodes_per_sec'] = nodes / seconds if seconds else 0
+            results['{stage}/{size}'.format(stage=name, size=size)] = metrics
+    return results
+
+
+def regressions(results, baseline, tolerance, strict=False):
+    '''
+    Messages of the results that regressed against baseline, strict counts a result missing from
+    baseline as one
+    '''
+
+    messages = []
+    for key, metrics in sorted(results.items()):
+        old = baseline.get(key)
+        if old is None:
+            if strict:
+                messages.append('{key}: not in the baseline'.format(key=key))
+            continue
+        for rate in ('tokens_per_sec', 'nodes_per_sec'):
+            if old[rate] and metrics[rate] < old[rate] * (1 - tolerance):
+                messages.append('{key}: {rate} {new:,.0f} < {old:,.0f}'.format(key=key, rate=rate, new=metrics[rate], old=old[rate]))
+        if old['peak_kib'] and metrics['peak_kib'] > old['peak_kib'] * (1 + tolerance):
+            messages.append('{key}: peak memory {new:,} KiB > {old:,} KiB'.format(key=key, new=metrics['peak_kib'], old=old['peak_kib']))
+    return messages
+
+
+def import_times(arguments):
+    '''
+    {module: cumulative import time in microseconds} of the top level imports of python arguments
+    '''
+
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        name = parts[2][1:].rstrip()
+        # Nested imports are indented under the module importing them
+        if name == name.lstrip() and parts[1].strip().isdigit():
+            times[name] = int(parts[1])
+    return times
+
+
+def startup(repeat=3):
+    '''
+    {command: (import ms, slowest modules)} of startup_commands, best of repeat runs
+    '''
+
+    bare = set(import_times(['-c', 'pass']))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'program.tny')
+        with open(path, 'w') as source:
+            source.write(generate(statements=10))
+        env_cache = os.environ.get('TINY_CACHE_DIR')
+        os.environ['TINY_CACHE_DIR'] = os.path.join(directory, 'cache')
+        try:
+            results = {}
+            for command in startup_commands:
+                best = None
+                for _ in range(repeat):
+                    times = {name: time for name, time in import_times([main_script] + command + [path]).items() if name not in bare}
+                    if best is None or sum(times.values()) < sum(best.values()):
+                        best = times
+                slowest = sorted(best.items(), key=lambda item: -item[1])[:5]
+                results[' '.join(command)] = (sum(best.values()) / 1000, [(name, time / 1000) for name, time in slowest])
+        finally:
+            if env_cache is None:
+                del os.environ['TINY_CACHE_DIR']
+            else:
+                os.environ['TINY_CACHE_DIR'] = env_cache
+    return results
+
+
+def report(results, out=sys.stdout):
+    out.write('{0:<16}{1:>10}{2:>10}{3:>10}{4:>14}{5:>14}{6:>12}\n'.format('benchmark', 'tokens', 'nodes', 'ms', 'tokens/s', 'nodes/s', 'peak KiB'))
+    for key, metrics in results.items():
+        out.write('{0:<16}{tokens:>10}{nodes:>10}{ms:>10.1f}{tokens_per_sec:>14,.0f}{nodes_per_sec:>14,.0f}{peak_kib:>12,}\n'.format(
+            key, ms=metrics['seconds'] * 1000, **metrics))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tiny_bench', description='Benchmark the scanner, parser and renderer')
+    parser.add_argument('--sizes', default='100,1000,10000', help='statement counts, comma separated')
+    parser.add_argument('--stages', default='scan,parse,render', help='stages to run, comma separated')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark, the best one counts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=default_baseline, help='baseline results (default: bench_baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown / memory growth (default: 0.25)')
+    parser.add_argument('--ci', action='store_true', default=bool(os.environ.get('CI')),
+                        help='fail without a baseline or with results missing from it (the default when $CI is set)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--startup', action='store_true', help='measure the import time of main.py commands instead')
+    parser.add_argument('--budget-ms', type=float, default=startup_budget_ms,
+                        help='import time allowed for `scan --no-cache` (default: {ms})'.format(ms=startup_budget_ms))
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = startup(max(1, args.repeat))
+        for command, (milliseconds, slowest) in results.items():
+            modules = ', '.join('{name} {ms:.1f}'.format(name=name, ms=ms) for name, ms in slowest)
+            print('{command:<20}{ms:>8.1f} ms  ({modules})'.format(command=command, ms=milliseconds, modules=modules))
+        budgeted = ' '.join(startup_commands[0])
+        if results[budgeted][0] > args.budget_ms:
+            print('REGRESSION {command}: imports take {ms:.1f} ms > {budget:.1f} ms'.format(command=budgeted, ms=results[budgeted][0], budget=args.budget_ms))
+            return 1
+        return 0
+
+    stage_names = args.stages.split(',')
+    for name in stage_names:
+        if name not in stages:
+            parser.error('unknown stage ' + name)
+    if args.ci and not args.save_baseline and not os.path.exists(args.baseline):
+        print('ERROR no baseline at ' + args.baseline + ', store one with --save-baseline on the reference machine')
+        return 2
+    results = run([int(size) for size in args.sizes.split(',')], stage_names, max(1, args.repeat), args.seed)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+        print('Baseline saved to ' + args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline at ' + args.baseline + ', run with --save-baseline to store one')
+        return 0
+    with open(args.baseline, 'r') as infile:
+        baseline = json.load(infile)
+    messages = regressions(results, baseline, args.tolerance, args.ci)
+    for message in messages:
+        print('REGRESSION ' + message)
+    return 1 if messages else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,331 @@
+'''
+Content-addressed compilation cache
+
+Inputs:
+    TINY language snippet code
+
+Output:
+    Token arrays, syntax trees, DOT text and rendered images, computed once per distinct source
+
+Usage:
+    cache = Cache()                 # $TINY_CACHE_DIR or ~/.cache/tinycompiler
+    batch = scan_source(source, cache)
+    batches = scan_file(infile, cache)      # streamed past cache.stream_size bytes
+    tree, root_id = parse_source(source, cache)
+    tree, root_id = parse_source(source, cache, optimize=True)
+    tree, root_id = parse_source(source, cache, jobs=4)     # see tiny_parallel
+    dot_text = dot_source(source, cache)
+    svg_text = svg_source(source, cache)
+    png = render_source(source, cache)
+
+Entries are keyed by the SHA-256 of the source, the compiler version, the kind of entry and its
+options (optimized trees and the images drawn from them are separate entries), and hold the errors
+reported while computing them, replayed on every hit. Entries are written to a temporary file and
+renamed into place, so processes sharing the directory never see a partial entry. Hits refresh an
+entry's mtime, the least recently used entries are removed once the directory grows past max_size.
+'''
+
+from version import __version__
+from errors import Diagnostics, replay_errors, collecting, current_diagnostics
+from tiny_scanner import TinyScanner, TokenBatch
+from tiny_stats import enabled, stage, count, count_tokens, count_tree
+from array import array
+import contextlib
+import hashlib
+import io
+import json
+import os
+import stat
+import struct
+import sys
+
+# Arrays are stored in native layout, entries from another platform get other keys
+platform_tag = '{order}/{long}'.format(order=sys.byteorder, long=array('l').itemsize)
+
+
+class Cache(object):
+
+    def __init__(self, directory=None, max_size=256 << 20, stream_size=4 << 20):
+        self.directory = directory or os.environ.get('TINY_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'tinycompiler')
+        self.max_size = max_size
+        self.stream_size = stream_size
+        self.size = None
+
+    def key(self, kind, source, options=()):
+        digest = hashlib.sha256()
+        for part in (__version__, platform_tag, kind) + tuple(options):
+            digest.update(str(part).encode('utf-8') + b'\0')
+        digest.update(source.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def load(self, key):
+        '''
+        (messages, payload) stored under key, None on a miss
+        '''
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry:
+                data = entry.read()
+        except OSError:
+            return None
+        if len(data) < 4:
+            return None
+        size = struct.unpack_from('<I', data)[0]
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return data[4:4 + size].decode('utf-8'), data[4 + size:]
+
+    def store(self, key, messages, payload):
+        import tempfile
+        path = self.path(key)
+        messages = messages.encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as entry:
+                    entry.write(struct.pack('<I', len(messages)))
+                    entry.write(messages)
+                    entry.write(payload)
+                os.replace(temp_path, path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(temp_path)
+                raise
+        except OSError:
+            # A read-only or full cache directory only costs the speedup
+            return
+
+        if self.size is None:
+            self.size = self.disk_usage()[0]
+        else:
+            self.size += 4 + len(messages) + len(payload)
+        if self.size > self.max_size:
+            self.evict()
+
+    def disk_usage(self):
+        '''
+        Total size and (mtime, size, path) of every entry
+        '''
+
+        entries, total = [], 0
+        for folder, folders, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(folder, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+                total += status.st_size
+        return total, entries
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache takes up 3/4 of max_size
+        '''
+
+        total, entries = self.disk_usage()
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size * 3 // 4:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
+        self.size = total
+
+
+def cached(cache, kind, source, compute, options=()):
+    '''
+    compute() -> bytes, unless the cache already holds it, errors it reports are stored along
+    '''
+
+    if cache is None:
+        return compute()
+    key = cache.key(kind, source, options)
+    with stage('cache'):
+        entry = cache.load(key)
+    if entry is not None:
+        count('cache', {kind + '_hits': 1})
+        messages, payload = entry
+        replay_errors(messages)
+        return payload
+    count('cache', {kind + '_misses': 1})
+
+    outer = current_diagnostics()
+    diagnostics = Diagnostics(outer.limit if outer else 100)
+    try:
+        with collecting(diagnostics):
+            payload = compute()
+    finally:
+        replay_errors(diagnostics.dumps())
+    with stage('cache'):
+        cache.store(key, diagnostics.dumps(), payload)
+    return payload
+
+
+def dump_tokens(batches):
+    columns = (array('B'), array('q'), array('q'), array('q'))
+    for batch in batches:
+        for column, part in zip(columns, (batch.types, batch.starts, batch.ends, batch.lines)):
+            column.extend(part)
+    return struct.pack('<Q', len(columns[0])) + b''.join(column.tobytes() for column in columns)
+
+
+def load_tokens(source, data):
+    count = struct.unpack_from('<Q', data)[0]
+    columns, pos = [], 8
+    for typecode in 'Bqqq':
+        column = array(typecode)
+        column.frombytes(data[pos:pos + count * column.itemsize])
+        pos += count * column.itemsize
+        columns.append(column)
+    return TokenBatch(source, *columns)
+
+
+def dump_tree(tree, root_id):
+    links = (tree.line, tree.first_child, tree.next_sibling, tree.last_child)
+    values = json.dumps(tree.value).encode('utf-8')
+    return (struct.pack('<QQQ', len(tree.kind), root_id, len(values)) + values + tree.kind.tobytes()
+            + b''.join(column.tobytes() for column in links))
+
+
+def load_tree(data):
+    from tiny_parser import ParseTree
+    count, root_id, size = struct.unpack_from('<QQQ', data)
+    tree, pos = ParseTree(), 24
+    tree.value = json.loads(data[pos:pos + size].decode('utf-8'))
+    pos += size
+    for name in ('kind', 'line', 'first_child', 'next_sibling', 'last_child'):
+        column = array(getattr(tree, name).typecode)
+        column.frombytes(data[pos:pos + count * column.itemsize])
+        pos += count * column.itemsize
+        setattr(tree, name, column)
+    return tree, root_id
+
+
+def scan_source(source, cache=None):
+    '''
+    All the tokens of source as a single TokenBatch
+    '''
+
+    def compute():
+        with stage('scan'):
+            return dump_tokens(TinyScanner.tokenize_batches(source))
+
+    return load_tokens(source, cached(cache, 'tokens', source, compute))
+
+
+def scan_file(infile, cache=None):
+    '''
+    TokenBatch objects of the open text file infile
+
+    Regular files up to cache.stream_size go through the cache, larger ones (and pipes) are scanned a
+    chunk at a time like without a cache, they're never held in memory whole.
+    '''
+
+    if cache is not None:
+        try:
+            status = os.fstat(infile.fileno())
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            status = None
+        if status is not None and stat.S_ISREG(status.st_mode) and status.st_size <= cache.stream_size:
+            with stage('read'):
+                source = infile.read()
+            return [scan_source(source, cache)]
+    return TinyScanner.tokenize_stream(infile)
+
+
+def tree_options(optimize):
+    return ('optimized',) if optimize else ()
+
+
+def parse_source(source, cache=None, optimize=False, jobs=None):
+    '''
+    Syntax tree of source, run through every optimization pass if optimize is set, the top level
+    statements are parsed by jobs worker processes if jobs is more than 1
+    '''
+
+    from tiny_parser import TinyParser
+
+    def compute():
+        if jobs and jobs > 1:
+            from tiny_parallel import parse
+            with stage('parse'):
+                tree, root_id = parse(source, jobs)
+        else:
+            if enabled():
+                # Tokens are scanned up front to time the stages apart
+                with stage('scan'):
+                    tokens = list(TinyScanner.tokenize(source, columns=True))
+                count_tokens(tokens)
+            else:
+                tokens = source
+            with stage('parse'):
+                tree, root_id = TinyParser.parse(tokens)
+        if optimize:
+            from tiny_optimizer import PassManager
+            optimizer = PassManager()
+            with stage('optimize'):
+                tree, root_id = optimizer.run(tree, root_id)
+            for name, values in optimizer.stats.items():
+                count('optimizer_' + name, values)
+        return tree, root_id
+
+    if cache is None:
+        tree, root_id = compute()
+    else:
+        tree, root_id = load_tree(cached(cache, 'tree', source, lambda: dump_tree(*compute()), tree_options(optimize)))
+    count_tree(tree, root_id)
+    return tree, root_id
+
+
+def dot_source(source, cache=None, optimize=False, jobs=None):
+    '''
+    Graphviz DOT text of the syntax tree of source
+    '''
+
+    from tiny_render import to_dot
+    return cached(cache, 'dot', source, lambda: to_dot(*parse_source(source, cache, optimize, jobs)).encode('utf-8'),
+                  tree_options(optimize)).decode('utf-8')
+
+
+def svg_source(source, cache=None, optimize=False, jobs=None):
+    '''
+    SVG image of the syntax tree of source
+    '''
+
+    from tiny_layout import write_svg
+
+    def compute():
+        out = io.StringIO()
+        write_svg(*parse_source(source, cache, optimize, jobs), out)
+        return out.getvalue().encode('utf-8')
+    return cached(cache, 'svg', source, compute, tree_options(optimize)).decode('utf-8')
+
+
+def render_source(source, cache=None, scale=2, optimize=False, jobs=None):
+    '''
+    PNG image of the syntax tree of source
+    '''
+
+    from tiny_layout import render_png
+    return cached(cache, 'png', source, lambda: render_png(*parse_source(source, cache, optimize, jobs), scale),
+                  (scale,) + tree_options(optimize))
+
+
+def image_source(source, image_format, cache=None, optimize=False, jobs=None):
+    '''
+    Image of the syntax tree of source as bytes, image_format is png, svg or dot
+    '''
+
+    if image_format == 'png':
+        return render_source(source, cache, optimize=optimize, jobs=jobs)
+    if image_format == 'svg':
+        return svg_source(source, cache, optimize, jobs).encode('utf-8')
+    return dot_source(source, cache, optimize, jobs).encode('utf-8')
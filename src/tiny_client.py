@@ -0,0 +1,76 @@
+'''
+Compile server client
+
+Inputs:
+    Requests for a compile server (tiny_server) listening on a Unix socket
+
+Output:
+    Their results, as dicts
+
+Usage:
+    client = TinyClient()                                   # $TINY_SERVER_SOCKET by default
+    result = client.call('parse', source='read x', optimize=True)
+    client.close()
+
+Kept apart from the server so the thin client mode of main.py doesn't import asyncio or the
+process pool.
+
+Errors:
+    RPCError(code, message) for an error response, OSError when there's no server to connect to
+'''
+
+import json
+import os
+import socket
+import tempfile
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# Server defined
+TIME_LIMIT_EXCEEDED = -32000
+
+
+def default_socket():
+    return os.environ.get('TINY_SERVER_SOCKET') or os.path.join(tempfile.gettempdir(), 'tinycompiler-{uid}.sock'.format(uid=os.getuid()))
+
+
+class RPCError(Exception):
+
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+class TinyClient(object):
+    '''
+    Blocking client, one request at a time
+    '''
+
+    def __init__(self, path=None):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(path or default_socket())
+        except OSError:
+            self.socket.close()
+            raise
+        self.reader = self.socket.makefile('rb')
+        self.next_id = 0
+
+    def call(self, method, **params):
+        self.next_id += 1
+        request = {'jsonrpc': '2.0', 'id': self.next_id, 'method': method, 'params': params}
+        self.socket.sendall(json.dumps(request).encode('utf-8', 'surrogatepass') + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('The server closed the connection')
+        response = json.loads(line)
+        if 'error' in response:
+            raise RPCError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
@@ -0,0 +1,334 @@
+'''
+Control flow graph and dataflow analyses
+
+Inputs:
+    Syntax tree (ParseTree) of a TINY program and its root node id
+
+Output:
+    Basic blocks of the program, the variables live at each block, the definitions reaching it and the
+    uses of variables that may not have been given a value yet
+
+Usage:
+    python tiny_dataflow.py in_file.ext
+    flow = Dataflow(ControlFlowGraph.build(tree, root_id))
+    live_in, live_out = liveness(flow)                  # bitsets of flow.names ids per block
+    reaching_in, reaching_out = reaching_definitions(flow)  # bitsets of flow.definitions indexes
+    flow.variables(live_in[block]), flow.definition_nodes(reaching_in[block])
+    for node_id, line, name in uninitialized_uses(flow):
+        ...
+
+A basic block is a run of assign, read and write statements, ended by the test of an if statement or
+of a repeat loop (its condition) when there is one. if statements branch to their then and else blocks
+that join in a new block, repeat loops go back from their test to the first block of their body.
+Block 0 is the entry, the graph is built with an explicit stack like the VM compiler.
+
+Sets of variables and of definitions are Python integers used as bitsets, bit i standing for the
+variable of id i (or definition i), so a union, intersection or difference over thousands of variables
+is a single C level operation on machine words. solve() is a worklist solver for any analysis of the
+form out = gen | (in & ~kill), forward or backward, meeting with union (may) or intersection (must).
+Blocks are visited in reverse postorder (postorder for backward analyses) and only enqueued again
+when a neighbour changes, structured programs settle in a few passes over the blocks.
+'''
+
+from tiny_scanner import Names
+from tiny_parser import TinyParser, Kinds
+from array import array
+from collections import deque
+import argparse
+import sys
+
+
+class ControlFlowGraph(object):
+    '''
+    Basic blocks stored as parallel lists indexed by block id
+
+    statements holds the assign, read and write node ids of every block in order, conditions the node
+    id of the test ending it (0 for none), successors and predecessors the block ids around it. A block
+    ending in a test goes to its first successor when the test is true (not 0), to the second otherwise.
+    '''
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.statements = []
+        self.conditions = array('l')
+        self.successors = []
+        self.predecessors = []
+        self.entry = self.add_block()
+        self.exit = self.entry
+
+    def __len__(self):
+        return len(self.statements)
+
+    def add_block(self):
+        self.statements.append([])
+        self.conditions.append(0)
+        self.successors.append([])
+        self.predecessors.append([])
+        return len(self.statements) - 1
+
+    def add_edge(self, source, target):
+        self.successors[source].append(target)
+        self.predecessors[target].append(source)
+
+    def postorder(self):
+        '''
+        Block ids reachable from the entry, every block after the blocks it leads to (back edges aside)
+        '''
+
+        order, seen = [], bytearray(len(self))
+        seen[self.entry] = 1
+        stack = [(self.entry, iter(self.successors[self.entry]))]
+        while stack:
+            block, successors = stack[-1]
+            for successor in successors:
+                if not seen[successor]:
+                    seen[successor] = 1
+                    stack.append((successor, iter(self.successors[successor])))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        return order
+
+    @staticmethod
+    def build(tree, root_id):
+        cfg = ControlFlowGraph(tree)
+        current = [cfg.entry]
+
+        def branch(condition_id):
+            # The test ends the current block, what follows starts a new one
+            block = current[0]
+            cfg.conditions[block] = condition_id
+            current[0] = cfg.add_block()
+            cfg.add_edge(block, current[0])
+            return block
+
+        def join(*blocks):
+            current[0] = cfg.add_block()
+            for block in blocks:
+                cfg.add_edge(block, current[0])
+
+        stack = [root_id] if root_id else []
+        while stack:
+            item = stack.pop()
+            if callable(item):
+                item()
+                continue
+            kind = tree.kind[item]
+            children = list(tree.children(item))
+            if kind == Kinds.STMT_SEQUENCE:
+                stack.extend(reversed(children))
+            elif kind in (Kinds.ASSIGN, Kinds.READ, Kinds.WRITE):
+                cfg.statements[current[0]].append(item)
+            elif kind == Kinds.IF:
+                test = branch(children[0])
+                if len(children) > 2:
+                    def then_end(test=test, else_id=children[2]):
+                        then_block = current[0]
+                        current[0] = cfg.add_block()
+                        cfg.add_edge(test, current[0])
+                        stack.extend((lambda: join(then_block, current[0]), else_id))
+                    stack.extend((then_end, children[1]))
+                else:
+                    stack.extend((lambda test=test: join(current[0], test), children[1]))
+            elif kind == Kinds.REPEAT:
+                join(current[0])
+                body = current[0]
+
+                def until(body=body, condition_id=children[1]):
+                    test = current[0]
+                    cfg.conditions[test] = condition_id
+                    join(test)
+                    cfg.add_edge(test, body)
+                stack.extend((until, children[0]))
+        cfg.exit = current[0]
+        return cfg
+
+
+class Dataflow(object):
+    '''
+    Definitions and uses of every step (statement or test) of the blocks of a ControlFlowGraph
+
+    steps[block] holds a (node id, variable id defined or -1, [(variable id, id node id), ...] read)
+    tuple per step. Variables get dense ids in names in order of appearance, definitions (assign and
+    read nodes, listed in definitions) dense indexes in block order.
+    '''
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.names = Names()
+        self.definitions = array('l')
+        self.definition_variables = array('l')
+        self.steps = []
+        tree = cfg.tree
+        for block in range(len(cfg)):
+            steps = []
+            for node_id in cfg.statements[block]:
+                kind = tree.kind[node_id]
+                defined = -1
+                if kind in (Kinds.ASSIGN, Kinds.READ):
+                    defined = self.names.id(tree.value[node_id])
+                    self.definitions.append(node_id)
+                    self.definition_variables.append(defined)
+                expression_id = tree.first_child[node_id] if kind != Kinds.READ else 0
+                steps.append((node_id, defined, self.reads(expression_id)))
+            if cfg.conditions[block]:
+                steps.append((cfg.conditions[block], -1, self.reads(cfg.conditions[block])))
+            self.steps.append(steps)
+
+    def reads(self, expression_id):
+        tree, ids = self.cfg.tree, self.names.id
+        return [(ids(tree.value[node_id]), node_id) for node_id, depth in tree.walk(expression_id) if tree.kind[node_id] == Kinds.ID]
+
+    def variables(self, bits):
+        '''
+        Names of the variables in a bitset
+        '''
+
+        return [self.names[index] for index in _indexes(bits)]
+
+    def definition_nodes(self, bits):
+        '''
+        Assign and read node ids of the definitions in a bitset
+        '''
+
+        return [self.definitions[index] for index in _indexes(bits)]
+
+
+def _indexes(bits):
+    return [index for index, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
+
+
+def solve(cfg, gen, kill, forward=True, must=False, boundary=0, universe=0):
+    '''
+    (ins, outs) bitsets per block of the analysis out = gen | (in & ~kill) (in = gen | (out & ~kill) backward)
+
+    Blocks meet the values of their predecessors (successors backward) with union, or intersection if
+    must is set, then every value starts from universe. The entry (exit backward) starts from boundary.
+    '''
+
+    count = len(cfg)
+    start = universe if must else 0
+    ins, outs = [start] * count, [start] * count
+    order = cfg.postorder()
+    if forward:
+        order.reverse()
+        sources, targets, first = cfg.predecessors, cfg.successors, cfg.entry
+        before, after = ins, outs
+    else:
+        sources, targets, first = cfg.successors, cfg.predecessors, cfg.exit
+        before, after = outs, ins
+
+    worklist, queued = deque(order), bytearray(count)
+    for block in order:
+        queued[block] = 1
+    while worklist:
+        block = worklist.popleft()
+        queued[block] = 0
+        if block == first:
+            value = boundary
+        else:
+            values = [after[source] for source in sources[block]]
+            if not values:
+                value = start
+            elif must:
+                value = values[0]
+                for other in values[1:]:
+                    value &= other
+            else:
+                value = 0
+                for other in values:
+                    value |= other
+        before[block] = value
+        result = gen[block] | (value & ~kill[block])
+        if result != after[block]:
+            after[block] = result
+            for target in targets[block]:
+                if not queued[target]:
+                    queued[target] = 1
+                    worklist.append(target)
+    return ins, outs
+
+
+def liveness(flow):
+    '''
+    Variables live at the start and at the end of every block
+    '''
+
+    gen, kill = [], []
+    for steps in flow.steps:
+        used = defined = 0
+        for node_id, variable, reads in steps:
+            for read, id_node in reads:
+                if not defined >> read & 1:
+                    used |= 1 << read
+            if variable >= 0:
+                defined |= 1 << variable
+        gen.append(used)
+        kill.append(defined)
+    return solve(flow.cfg, gen, kill, forward=False)
+
+
+def reaching_definitions(flow):
+    '''
+    Definitions (indexes into flow.definitions) reaching the start and the end of every block
+    '''
+
+    masks = [0] * len(flow.names)
+    for index, variable in enumerate(flow.definition_variables):
+        masks[variable] |= 1 << index
+
+    gen, kill, index = [], [], 0
+    for steps in flow.steps:
+        generated = killed = 0
+        for node_id, variable, reads in steps:
+            if variable >= 0:
+                generated = (generated & ~masks[variable]) | (1 << index)
+                killed |= masks[variable]
+                index += 1
+        gen.append(generated)
+        kill.append(killed)
+    return solve(flow.cfg, gen, kill)
+
+
+def uninitialized_uses(flow):
+    '''
+    (id node id, line, name) of every read of a variable that isn't given a value on every path to it
+    '''
+
+    gen = []
+    for steps in flow.steps:
+        defined = 0
+        for node_id, variable, reads in steps:
+            if variable >= 0:
+                defined |= 1 << variable
+        gen.append(defined)
+    universe = (1 << len(flow.names)) - 1
+    ins, outs = solve(flow.cfg, gen, [0] * len(gen), must=True, universe=universe)
+
+    uses, tree = [], flow.cfg.tree
+    for block in flow.cfg.postorder()[::-1]:
+        assigned = ins[block]
+        for node_id, variable, reads in flow.steps[block]:
+            for read, id_node in reads:
+                if not assigned >> read & 1:
+                    uses.append((id_node, tree.line[id_node], flow.names[read]))
+            if variable >= 0:
+                assigned |= 1 << variable
+    uses.sort()
+    return uses
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tiny_dataflow', description='Variables read before they are given a value in a TINY program')
+    parser.add_argument('infile')
+    args = parser.parse_args(argv)
+    with open(args.infile, 'r') as infile:
+        tree, root_id = TinyParser.parse(infile.read())
+    for node_id, line, name in uninitialized_uses(Dataflow(ControlFlowGraph.build(tree, root_id))):
+        print('WARNING @ LINE {line}: `{name}` may be read before it is given a value'.format(line=line, name=name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
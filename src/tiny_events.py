@@ -0,0 +1,265 @@
+'''
+Event parser
+
+Inputs:
+    TINY language snippet code, or a path, file object or mmap to scan a chunk at a time
+
+Output:
+    (ENTER, kind, value, lineno) and (EXIT, kind) events for every node, kinds are the Kinds of
+    tiny_parser, no tree is built
+
+Usage:
+    python tiny_events.py [--counts] in_file.ext...
+    for event in events(input):           # or file_events(path)
+        if event[0] == ENTER:
+            ...
+    kinds, depth = count(file_events(path))   # nodes of every kind, deepest nesting
+
+Events come in the order of a pre-order walk of the tree TinyParser.parse builds, with one difference:
+every statement sequence is reported, one holding a single statement too (the tree leaves those out),
+so that a statement never has to be held back until the next token shows whether a `;` follows.
+Statements are parsed by the LL(1) table and explicit stack of tiny_ll_parser and their events given out
+as soon as their first token is read, an expression's events are given out once it's complete. Tokens
+are scanned lazily by the bulk scanner; memory is the parse stack (the nesting depth) and the events of
+the expression being parsed.
+
+Errors:
+    The errors of TinyParser, with the same panic mode recovery; events stay balanced. They are
+    reported as the tokens are read, so a scanner error can come before parse errors on earlier lines
+'''
+
+from tiny_scanner import TinyScanner, TokenCursor
+from tiny_parser import Kinds
+from tiny_ll_parser import TinyLLParser, Symbols, T, build_table, precedences, operators, error_names
+from errors import collecting
+from collections import Counter
+import argparse
+import sys
+
+ENTER = 1
+EXIT = 2
+
+
+class EventSymbols(Symbols):
+    # Actions giving out events, run when popped off the parse stack
+    ENTER_SEQUENCE = 210
+    ENTER_IF = 211
+    ENTER_REPEAT = 212
+    ENTER_ASSIGN = 213
+    ENTER_WRITE = 214
+    READ_NODE = 215
+    EXIT = 216
+
+
+S = EventSymbols
+
+grammar = {
+    S.PROGRAM       : [[S.STMT_SEQUENCE]],
+    S.STMT_SEQUENCE : [[S.ENTER_SEQUENCE, S.STATEMENT, S.SEQ_TAIL, S.EXIT]],
+    S.SEQ_TAIL      : [[T['SEMI'], S.STATEMENT, S.SEQ_TAIL], []],
+    S.STATEMENT     : [[S.IF_STMT], [S.REPEAT_STMT], [S.ASSIGN_STMT], [S.READ_STMT], [S.WRITE_STMT]],
+    S.IF_STMT       : [[S.ENTER_IF, T['IF'], S.EXP, T['THEN'], S.STMT_SEQUENCE, S.ELSE_PART, T['END'], S.EXIT]],
+    S.ELSE_PART     : [[T['ELSE'], S.STMT_SEQUENCE], []],
+    S.REPEAT_STMT   : [[S.ENTER_REPEAT, T['REPEAT'], S.STMT_SEQUENCE, T['UNTIL'], S.EXP, S.EXIT]],
+    S.ASSIGN_STMT   : [[S.ENTER_ASSIGN, T['IDENTIFIER'], T['ASSIGN'], S.EXP, S.EXIT]],
+    S.READ_STMT     : [[S.MARK, T['READ'], S.READ_NODE, T['IDENTIFIER']]],
+    S.WRITE_STMT    : [[S.ENTER_WRITE, T['WRITE'], S.EXP, S.EXIT]],
+}
+
+table, defaults = build_table(grammar)
+
+entered = {S.ENTER_SEQUENCE: Kinds.STMT_SEQUENCE, S.ENTER_IF: Kinds.IF, S.ENTER_REPEAT: Kinds.REPEAT,
+           S.ENTER_ASSIGN: Kinds.ASSIGN, S.ENTER_WRITE: Kinds.WRITE}
+
+
+class TinyEventParser(TinyLLParser):
+
+    def __init__(self, batches):
+        '''
+        batches is an iterable of TokenBatch objects
+        '''
+
+        self.cursor = TokenCursor(batches)
+        self.recovering = False
+
+    def seq_tail(self, top_level):
+        production = TinyLLParser.seq_tail(self, top_level)
+        if len(production) > 1:
+            # A statement with its `;` missing
+            return (S.SEQ_TAIL, S.STATEMENT)
+        return production
+
+    def pro_exp(self):
+        '''
+        Events of an EXP, by precedence climbing like TinyLLParser.pro_exp
+
+        An operator's ENTER comes before its left operand, so the events wait until the whole EXP
+        is parsed: operands are kept as linked nodes, an operator as [ENTER event, left, right] and
+        a factor as the tuple of its events, joined in constant time and given out by one walk.
+        '''
+
+        cursor = self.cursor
+        lparen, rparen, number, identifier = T['LPAREN'], T['RPAREN'], T['NUMBER'], T['IDENTIFIER']
+        pending = []            # ([ENTER event, left], precedence), None marks an open parenthesis
+        comparisons = [False]
+
+        while True:
+            code = cursor.code
+            if code == lparen:
+                cursor.advance()
+                pending.append(None)
+                comparisons.append(False)
+                continue
+            if code == number or code == identifier:
+                kind = Kinds.CONST if code == number else Kinds.ID
+                operand = ((ENTER, kind, cursor.value(), cursor.line), (EXIT, kind))
+                cursor.advance()
+            else:
+                self.report('factor')
+                operand = ()
+
+            while True:
+                code = cursor.code
+                precedence = precedences.get(code)
+                if precedence is not None and not (precedence == 0 and comparisons[-1]):
+                    while pending and pending[-1] is not None and pending[-1][1] >= precedence:
+                        node = pending.pop()[0]
+                        node.append(operand)
+                        operand = node
+                    pending.append(([(ENTER, Kinds.OP, operators[code], cursor.line), operand], precedence))
+                    if precedence == 0:
+                        comparisons[-1] = True
+                    cursor.advance()
+                    break
+
+                while pending and pending[-1] is not None:
+                    node = pending.pop()[0]
+                    node.append(operand)
+                    operand = node
+                if not pending:
+                    return _flatten(operand)
+                pending.pop()
+                comparisons.pop()
+                self.expect(rparen)
+
+    def events(self):
+        '''
+        Yields the events of the program
+        '''
+
+        cursor = self.cursor
+        stack = [S.PROGRAM]
+        kinds, marks = [], []
+
+        while stack:
+            symbol = stack.pop()
+
+            if symbol < S.PROGRAM:
+                self.expect(symbol)
+
+            elif symbol < S.MARK:
+                if symbol == S.EXP:
+                    yield from self.pro_exp()
+                    continue
+                production = table[symbol].get(cursor.code)
+                if production is None:
+                    if symbol == S.SEQ_TAIL:
+                        production = self.seq_tail(len(stack) == 1)
+                    else:
+                        production = defaults.get(symbol)
+                if production is not None:
+                    stack.extend(production)
+                else:
+                    self.report(error_names[symbol])
+
+            elif symbol in entered:
+                kind = entered[symbol]
+                kinds.append(kind)
+                yield ENTER, kind, cursor.value() if kind == Kinds.ASSIGN else None, cursor.line
+            elif symbol == S.EXIT:
+                yield EXIT, kinds.pop()
+            elif symbol == S.MARK:
+                marks.append(cursor.line)
+            elif symbol == S.READ_NODE:
+                # Named after the token following `read`, an identifier or not
+                yield ENTER, Kinds.READ, cursor.value(), marks.pop()
+                yield EXIT, Kinds.READ
+
+
+exit_op = ((EXIT, Kinds.OP),)
+
+
+def _flatten(operand):
+    '''
+    Events of an operand of TinyEventParser.pro_exp, in pre-order
+    '''
+
+    events = []
+    stack = [operand]
+    while stack:
+        node = stack.pop()
+        if node.__class__ is list:
+            events.append(node[0])
+            stack += (exit_op, node[2], node[1])
+        else:
+            events.extend(node)
+    return events
+
+
+def events(input):
+    '''
+    Events of the program text input
+    '''
+
+    return TinyEventParser(TinyScanner.tokenize_batches(input)).events()
+
+
+def file_events(source):
+    '''
+    Events of a path, file object or mmap, scanned a chunk at a time
+    '''
+
+    return TinyEventParser(TinyScanner.tokenize_stream(source)).events()
+
+
+def count(events):
+    '''
+    (Counter of the kinds entered, deepest nesting) of events
+    '''
+
+    kinds, depth, deepest = Counter(), 0, 0
+    for event in events:
+        if event[0] == ENTER:
+            kinds[event[1]] += 1
+            depth += 1
+            if depth > deepest:
+                deepest = depth
+        else:
+            depth -= 1
+    return kinds, deepest
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tiny_events', description='Check that TINY files parse, without building their trees')
+    parser.add_argument('inputs', nargs='+')
+    parser.add_argument('--counts', action='store_true', help='print the number of nodes of every kind and the deepest nesting')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for path in args.inputs:
+        with collecting() as diagnostics:
+            kinds, deepest = count(file_events(path))
+        report = '{path}: {result}'.format(path=path, result='{count} error(s)'.format(count=diagnostics.count) if diagnostics.count else 'ok')
+        if args.counts:
+            report += ' ' + ' '.join('{kind}={count}'.format(kind=Kinds.names[kind], count=kinds[kind]) for kind in sorted(kinds))
+            report += ' depth={depth}'.format(depth=deepest)
+        print(report)
+        for line in diagnostics.lines():
+            print('    ' + line)
+        if diagnostics.count:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+'''
+Synthetic TINY program generator
+
+Inputs:
+    Knobs: statement count, nesting depth, expression width, comment density, identifier length, seed
+
+Output:
+    A syntactically valid TINY program following the grammar of tiny_parser
+
+Usage:
+    python tiny_gen.py [--statements 1000] [--depth 3] [--width 4] [--comments 0.1] [--identifier-length 3] [--seed 0]
+    source = generate(statements=1000, depth=3)
+
+statements counts every statement, the ones nested in if and repeat statements included.
+width is the number of operands of every simple expression, some get a parenthesized subexpression.
+comments is the chance of a comment after each statement. The same knobs and seed give the same program.
+'''
+
+from tiny_parser import TinyParser
+import argparse
+import random
+import string
+import sys
+
+keywords = set(TinyParser.symbols)
+
+
+class ProgramGenerator(object):
+
+    def __init__(self, depth=3, width=4, comments=0.1, identifier_length=3, variables=16, seed=0):
+        self.random = random.Random(seed)
+        self.depth = depth
+        self.width = max(1, width)
+        self.comments = comments
+        self.variables = []
+        while len(self.variables) < variables:
+            name = ''.join(self.random.choice(string.ascii_letters) for _ in range(max(1, identifier_length)))
+            if name not in keywords and name not in self.variables:
+                self.variables.append(name)
+
+    def operand(self, nesting):
+        r = self.random.random()
+        if nesting < 2 and r < 0.1:
+            return '(' + self.simple_expression(nesting + 1, max(1, self.width // 2)) + ')'
+        if r < 0.55:
+            return self.random.choice(self.variables)
+        return str(self.random.randint(0, 999))
+
+    def simple_expression(self, nesting=0, width=None):
+        parts = [self.operand(nesting)]
+        for _ in range((width or self.width) - 1):
+            parts.append(self.random.choice('+-*/'))
+            parts.append(self.operand(nesting))
+        return ' '.join(parts)
+
+    def expression(self, comparison=False):
+        if comparison or self.random.random() < 0.2:
+            return self.simple_expression() + ' ' + self.random.choice('<=') + ' ' + self.simple_expression()
+        return self.simple_expression()
+
+    def comment(self):
+        words = self.random.randint(1, 8)
+        return '{ ' + ' '.join(self.random.choice(self.variables) for _ in range(words)) + ' }'
+
+    def sequence(self, budget, level, out, indent=''):
+        '''
+        Appends the lines of a stmt_sequence of budget statements to out
+        '''
+
+        while budget > 0:
+            budget -= 1
+            r = self.random.random()
+            if level < self.depth and budget and r < 0.2:
+                # A compound statement takes a part of the remaining budget for its bodies
+                inner = self.random.randint(1, min(budget, max(1, budget // 4)))
+                budget -= inner
+                if r < 0.12:
+                    out.append(indent + 'if ' + self.expression(True) + ' then')
+                    if inner > 1 and r < 0.06:
+                        then = self.random.randint(1, inner - 1)
+                        self.sequence(then, level + 1, out, indent + '  ')
+                        out.append(indent + 'else')
+                        self.sequence(inner - then, level + 1, out, indent + '  ')
+                    else:
+                        self.sequence(inner, level + 1, out, indent + '  ')
+                    out.append(indent + 'end')
+                else:
+                    out.append(indent + 'repeat')
+                    self.sequence(inner, level + 1, out, indent + '  ')
+                    out.append(indent + 'until ' + self.expression(True))
+            elif r < 0.3:
+                out.append(indent + 'read ' + self.random.choice(self.variables))
+            elif r < 0.4:
+                out.append(indent + 'write ' + self.expression())
+            else:
+                out.append(indent + self.random.choice(self.variables) + ' := ' + self.expression())
+            if budget:
+                out[-1] += ';'
+            if self.comments and self.random.random() < self.comments:
+                out[-1] += ' ' + self.comment()
+
+    def program(self, statements):
+        out = []
+        self.sequence(max(1, statements), 0, out)
+        return '\n'.join(out) + '\n'
+
+
+def generate(statements=1000, depth=3, width=4, comments=0.1, identifier_length=3, seed=0):
+    return ProgramGenerator(depth, width, comments, identifier_length, seed=seed).program(statements)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tiny_gen', description='Generate a valid TINY program')
+    parser.add_argument('--statements', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=3, help='deepest nesting of if/repeat statements')
+    parser.add_argument('--width', type=int, default=4, help='operands of a simple expression')
+    parser.add_argument('--comments', type=float, default=0.1, help='chance of a comment after a statement')
+    parser.add_argument('--identifier-length', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='output file, stdout by default')
+    args = parser.parse_args(argv)
+    source = generate(args.statements, args.depth, args.width, args.comments, args.identifier_length, args.seed)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            outfile.write(source)
+    else:
+        sys.stdout.write(source)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,616 @@
+'''
+Incremental re-parsing
+
+Inputs:
+    TINY language snippet code, then text edits made to it
+
+Output:
+    Syntax tree (ParseTree) of the edited code, the same tree TinyParser.parse builds for it
+
+Usage:
+    document = IncrementalParser(input)
+    tree, root_id = document.edit(offset, removed_length, inserted_text)
+
+An edit only re-scans the text from the token before it until the new tokens line up with the old ones
+again, and only re-parses the statements of the innermost sequence holding the damaged tokens (the top
+level one, or the body of an if, else or repeat), from the one holding them until the next statement
+that starts on an unchanged token. When the new statements don't end where the sequence did (an `end`
+added or removed), the statement holding the sequence is re-parsed in its own sequence, and so on out.
+The other statements keep their nodes, the time an edit takes depends on the statements it touches,
+not on the size of the program or of the statements around them.
+Token offsets, token lines and statement positions after an edit are moved lazily, an edit only pays
+for the ones between it and the previous edit, in the sequences holding it. Node lines are moved on
+read: an edit that adds or removes lines is only recorded, a statement applies the edits made since
+its nodes were last read. The edited tree reuses the nodes of the previous one and is rebuilt once more
+than half of its nodes are dead.
+
+Errors:
+    Same as TinyScanner and TinyParser, for the re-scanned and re-parsed code only
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+from operator import add
+import sys
+from tiny_scanner import TinyScanner, Tokens, TokenBatch
+from tiny_parser import TinyParser, ParseTree, Kinds
+from errors import collecting, error
+
+
+class _Positions(object):
+    '''
+    A sorted array of offsets, line numbers or token indexes
+
+    Items from index gap on are stored less delta: adding to every item after some index only
+    updates the items between it and the gap, edits next to each other stay cheap.
+    '''
+
+    def __init__(self, items):
+        self.items = items
+        self.gap = len(items)
+        self.delta = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if index >= self.gap:
+            return self.items[index] + self.delta
+        return self.items[index]
+
+    def move_gap(self, index):
+        items, gap, delta = self.items, self.gap, self.delta
+        if delta and index != gap:
+            low, high = min(index, gap), max(index, gap)
+            items[low:high] = array(items.typecode, map(add, items[low:high], repeat(delta if index > gap else -delta)))
+        self.gap = index
+
+    def shift(self, index, delta):
+        '''
+        Adds delta to the items from index on
+        '''
+
+        if delta:
+            self.move_gap(index)
+            self.delta += delta
+
+    def splice(self, low, high, items):
+        '''
+        Replaces the items from low to high (exclusive) with items
+        '''
+
+        self.move_gap(high)
+        self.items[low:high] = items
+        self.gap = low + len(items)
+
+    def bisect_left(self, value):
+        items, gap = self.items, self.gap
+        if gap < len(items) and items[gap] + self.delta < value:
+            return bisect_left(items, value - self.delta, gap + 1)
+        return bisect_left(items, value, 0, gap)
+
+    def bisect_right(self, value):
+        items, gap = self.items, self.gap
+        if gap < len(items) and items[gap] + self.delta <= value:
+            return bisect_right(items, value - self.delta, gap + 1)
+        return bisect_right(items, value, 0, gap)
+
+    def flat(self):
+        self.move_gap(len(self.items))
+        return self.items
+
+
+class _NodeLines(object):
+    '''
+    Line column of an edited tree, node lines are moved on read
+
+    Every node is owned by the statement it's in, but for the nodes of a repeat test, owned by the
+    test, and stmt_sequence nodes, owning themselves (owner 0 for the top level one, its line is set
+    as it is): the nodes of an owner are all on the same side of any re-parsed code. An edit that adds or removes lines only records its first line and its line delta,
+    a statement catches up with the edits made since it was last read the first time one of its nodes
+    is read again: the edits from a line at or before its own move it. The edits are dropped with the
+    tree when it's compacted.
+    '''
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.owners = array('l', [0]) * len(lines)
+        self.shifts = array('l', [0]) * len(lines)
+        self.applied = array('l', [0]) * len(lines)
+        self.edits = []
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.lines)))
+
+    def __getitem__(self, node_id):
+        root_id = self.owners[node_id]
+        if root_id and self.applied[root_id] != len(self.edits):
+            self.catch_up(root_id)
+        return self.lines[node_id] + self.shifts[root_id]
+
+    def __setitem__(self, node_id, line):
+        root_id = self.owners[node_id]
+        if root_id and self.applied[root_id] != len(self.edits):
+            self.catch_up(root_id)
+        self.lines[node_id] = line - self.shifts[root_id]
+
+    def append(self, line):
+        self.lines.append(line)
+        self.owners.append(0)
+        self.shifts.append(0)
+        self.applied.append(len(self.edits))
+
+    def catch_up(self, root_id):
+        line = self.lines[root_id] + self.shifts[root_id]
+        for first_line, delta in self.edits[self.applied[root_id]:]:
+            if line >= first_line:
+                line += delta
+        self.shifts[root_id] = line - self.lines[root_id]
+        self.applied[root_id] = len(self.edits)
+
+    def own(self, root_id, low, high):
+        '''
+        Makes root_id the owner of nodes low to high (exclusive)
+        '''
+
+        self.owners[low:high] = array('l', [root_id]) * (high - low)
+
+    def shift(self, first_line, delta):
+        '''
+        Adds delta to the lines of the statements from first_line on
+        '''
+
+        self.edits.append((first_line, delta))
+
+
+class _Misaligned(Exception):
+    '''
+    Raised by a _TokenFeed asked for a token past its limit
+    '''
+
+
+class _TokenFeed(object):
+    '''
+    (tokenvalue, tokentype, lineno) tuples of a document from token index on,
+    current is the index of the last token handed out, no token after limit is handed out
+    '''
+
+    def __init__(self, document, index, limit=sys.maxsize):
+        self.document = document
+        self.index = index
+        self.current = index
+        self.limit = limit
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        document, index = self.document, self.index
+        if index > self.limit:
+            raise _Misaligned()
+        if index >= len(document.types):
+            self.current = index
+            raise StopIteration
+        self.index, self.current = index + 1, index
+        code = document.types[index]
+        text = document.source[document.starts[index]:document.ends[index]]
+        return int(text) if code == Tokens.NUMBER else text, Tokens.names[code], document.lines[index]
+
+
+class _Sequence(object):
+    '''
+    A statement sequence of the document
+
+    A slot per statement, as TinyParser.pro_stmt_sequence counts them: the statement node (0 when
+    none was parsed), its first token and its node count (the nodes of the sequences nested in it
+    included). Token indexes are relative to the first token of the sequence (start), whose own index
+    is relative to the first token of the statement holding it (parent_id; both are 0 at the top level);
+    end is the token that closed a nested sequence. An edit only moves the indexes of the sequences
+    it's in. node_id is the stmt_sequence node, made once there are two slots.
+    '''
+
+    __slots__ = ('start', 'end', 'tokens', 'statements', 'sizes', 'node_id', 'parent_id')
+
+    def __init__(self, start, statements, first_tokens, sizes, end=None):
+        self.start = start
+        self.end = end
+        self.tokens = _Positions(array('q', [first - start for first in first_tokens]))
+        self.statements = statements
+        self.sizes = sizes
+        self.node_id = 0
+        self.parent_id = 0
+
+    @property
+    def root_id(self):
+        return self.node_id or self.statements[0]
+
+
+class _Parser(TinyParser):
+    '''
+    TinyParser recording the statement sequences it parses into its document, and the owners of the
+    node lines of every statement
+    '''
+
+    def __init__(self, document, feed):
+        TinyParser.__init__(self, feed, document.tree)
+        self.document = document
+        self.feed = feed
+        self.made = []
+
+    def pro_statement(self):
+        first, size, made = self.feed.current, len(self.tree), len(self.made)
+        root_id = TinyParser.pro_statement(self)
+        if root_id:
+            self.document.add_statement(root_id, first, size, self.made[made:])
+        del self.made[made:]
+        return root_id
+
+    def pro_stmt_sequence(self, top_level=False):
+        start = self.feed.current
+        statements, first_tokens, sizes, _ = self.document.parse_slots(self, top_level)
+        sequence = _Sequence(start, statements, first_tokens, sizes, self.feed.current - start)
+        self.document.link(sequence, start, 0, len(statements))
+        self.made.append(sequence)
+        return sequence.root_id
+
+
+expression_kinds = (Kinds.OP, Kinds.CONST, Kinds.ID)
+opening_codes = (Tokens.codes['THEN'], Tokens.codes['ELSE'], Tokens.codes['REPEAT'])
+
+
+class IncrementalParser(object):
+
+    rescan_window = 1 << 10
+
+    def __init__(self, input):
+        self.source = input
+        self.parse_all()
+
+    @property
+    def tokens(self):
+        return TokenBatch(self.source, self.types, self.starts.flat(), self.ends.flat(), self.lines.flat())
+
+    def parse_all(self):
+        '''
+        Scans and parses the whole document from scratch
+        '''
+
+        types, starts, ends, lines = array('B'), array('q'), array('q'), array('q')
+        for batch in TinyScanner.tokenize_batches(self.source):
+            types.extend(batch.types)
+            starts.extend(batch.starts)
+            ends.extend(batch.ends)
+            lines.extend(batch.lines)
+        self.types, self.starts, self.ends, self.lines = types, _Positions(starts), _Positions(ends), _Positions(lines)
+
+        self.tree, self.nested, self.garbage, self.top = ParseTree(), {}, 0, None
+        self.tree.line = _NodeLines(self.tree.line)
+        parser = _Parser(self, _TokenFeed(self, 0))
+        self.top = _Sequence(0, *self.parse_slots(parser, True)[:3])
+        self.link(self.top, 0, 0, len(self.top.statements))
+        return self.tree, self.root_id
+
+    def parse_slots(self, parser, top_level, reuse=None):
+        '''
+        Parses the statements of a sequence from the parser's token on, the loop of
+        TinyParser.pro_stmt_sequence
+
+        Stops at the end of the sequence or, once reuse (new token index -> old statement position or None)
+        finds one, at a statement that's already parsed. Returns the statement nodes, their first
+        token indexes, their node counts and the position of the statement to go on with.
+        '''
+
+        feed, tree = parser.feed, self.tree
+        statements, first_tokens, sizes = [], [], []
+        while True:
+            first_tokens.append(feed.current)
+            size = len(tree)
+            statements.append(parser.pro_statement())
+            sizes.append(len(tree) - size)
+            while not parser.accept(';'):
+                kind = parser.token[1]
+                if not kind or (not top_level and kind in parser.sync_tokens):
+                    return statements, first_tokens, sizes, None
+                parser.report('stmt_sequence')
+                if kind in parser.statement_tokens:
+                    # A statement with its `;` missing
+                    break
+                parser.synchronize(top_level)
+            if reuse is not None:
+                position = reuse(feed.current)
+                if position is not None:
+                    return statements, first_tokens, sizes, position
+
+    def add_statement(self, root_id, first, size, sequences):
+        '''
+        Records a statement parsed from token first on, its nodes from size + 1 on and the sequences
+        nested in it
+        '''
+
+        tree = self.tree
+        if sequences:
+            for sequence in sequences:
+                sequence.start -= first
+                sequence.parent_id = root_id
+            self.nested[root_id] = sequences
+        # Every statement owns its nodes but for the nested statements, the test of a repeat (after
+        # its body) owns its own
+        kind = tree.kind[root_id]
+        if kind == Kinds.IF:
+            tree.line.own(root_id, size + 1, root_id + 1)
+        elif kind == Kinds.REPEAT:
+            tree.line.own(root_id, root_id, root_id + 1)
+            test_id = tree.last_child[root_id]
+            if tree.kind[test_id] in expression_kinds:
+                tree.line.own(test_id, root_id + 1, len(tree) + 1)
+        else:
+            tree.line.own(root_id, size + 1, len(tree) + 1)
+
+    def link(self, sequence, base, low, high):
+        '''
+        Chains the statements of sequence (first token base) again after statements[low:high] were
+        replaced, making or dropping its stmt_sequence node, and links its root into the statement
+        holding it
+        '''
+
+        tree, statements = self.tree, sequence.statements
+        if len(statements) > 1:
+            if not sequence.node_id:
+                sequence.node_id = tree.add_node(Kinds.STMT_SEQUENCE)
+                if sequence is not self.top:
+                    tree.line.own(sequence.node_id, sequence.node_id, sequence.node_id + 1)
+                low, high = 0, len(statements)
+            sequence_id = sequence.node_id
+            tree.line[sequence_id] = self.lines[base] if base < len(self.lines) else 0
+            next_sibling = tree.next_sibling
+            previous = 0
+            for position in range(low - 1, -1, -1):
+                if statements[position]:
+                    previous = statements[position]
+                    break
+            for position in range(low, len(statements)):
+                node_id = statements[position]
+                if node_id:
+                    if previous:
+                        next_sibling[previous] = node_id
+                    previous = node_id
+                    if position >= high:
+                        break
+            else:
+                if previous:
+                    next_sibling[previous] = 0
+            tree.first_child[sequence_id] = next((node_id for node_id in statements if node_id), 0)
+            tree.last_child[sequence_id] = next((node_id for node_id in reversed(statements) if node_id), 0)
+        elif sequence.node_id:
+            sequence.node_id = 0
+            self.garbage += 1
+
+        if sequence is self.top:
+            self.root_id = sequence.root_id
+        elif sequence.parent_id:
+            self.link_parent(sequence.parent_id)
+
+    def link_parent(self, statement_id):
+        '''
+        Links the roots of the sequences nested in an if or repeat statement again
+        '''
+
+        tree = self.tree
+        roots = [sequence.root_id for sequence in self.nested[statement_id]]
+        if tree.kind[statement_id] == Kinds.IF:
+            test_id = tree.first_child[statement_id]
+            children = [test_id if tree.kind[test_id] in expression_kinds else 0] + roots
+        else:
+            test_id = tree.last_child[statement_id]
+            children = roots + [test_id if tree.kind[test_id] in expression_kinds else 0]
+        tree.first_child[statement_id] = tree.last_child[statement_id] = 0
+        for child_id in children:
+            if child_id:
+                tree.next_sibling[child_id] = 0
+                tree.add_child(statement_id, child_id)
+
+    def locate(self, low, high):
+        '''
+        Path from the top level sequence to the innermost one holding the old tokens low to high
+        (exclusive): [sequence, index of its first token, position of the statement holding low]
+        '''
+
+        sequence, base = self.top, 0
+        path = []
+        while True:
+            position = max(sequence.tokens.bisect_right(low - base) - 1, 0)
+            path.append([sequence, base, position])
+            nested = self.nested.get(sequence.statements[position])
+            if not nested:
+                return path
+            first = base + sequence.tokens[position]
+            for inner in nested:
+                inner_base = first + inner.start
+                if inner_base <= low and high <= inner_base + inner.end:
+                    sequence, base = inner, inner_base
+                    break
+            else:
+                return path
+
+    def backoff(self, path):
+        '''
+        Moves the statement the path ends at back (out to the statement holding its sequence, if need
+        be) until no statement kept before it ends on its first line, runs into it for want of a `;` or,
+        for the first statement of a nested sequence, holds the tokens before it
+        '''
+
+        types, lines, semi = self.types, self.lines, Tokens.codes['SEMI']
+        while True:
+            sequence, base, position = path[-1]
+            first = base + sequence.tokens[position]
+            if position:
+                if first < len(types) and types[first - 1] == semi and lines[first - 1] != lines[first]:
+                    return
+                path[-1][2] -= 1
+            elif len(path) == 1 or (first < len(types) and types[first - 1] in opening_codes and lines[first - 1] != lines[first]):
+                return
+            else:
+                path.pop()
+
+    def reparse(self, path, shift, tail):
+        '''
+        Parses the statements of the sequence path ends at again, from the statement the path ends at
+        to the next one starting on an unchanged token, returns False when the new statements don't
+        line up with the old ones before the sequence ends
+        '''
+
+        sequence, base, position = path[-1]
+        tree, top_level = self.tree, len(path) == 1
+        # The token closing a nested sequence, when unchanged
+        limit = sys.maxsize if top_level else base + sequence.end + shift
+        feed = _TokenFeed(self, base + sequence.tokens[position], limit)
+        tokens = sequence.tokens
+
+        def reuse(index):
+            if index < tail:
+                return None
+            old = tokens.bisect_left(index - shift - base)
+            if old < len(tokens) and tokens[old] == index - shift - base:
+                return old
+            return None
+
+        size = len(tree)
+        try:
+            with collecting(limit=sys.maxsize) as diagnostics:
+                statements, first_tokens, sizes, end = self.parse_slots(_Parser(self, feed), top_level, reuse)
+        except _Misaligned:
+            self.garbage += len(tree) - size
+            return False
+        if end is None:
+            if not top_level and feed.current != limit:
+                self.garbage += len(tree) - size
+                return False
+            end = len(tokens)
+        for entry in diagnostics.entries:
+            error(entry.line, entry.message, entry.source, entry.column)
+
+        replaced = sum(sequence.sizes[position:end])
+        self.garbage += replaced
+        sequence.statements[position:end] = statements
+        tokens.splice(position, end, array('q', [first - base for first in first_tokens]))
+        tokens.shift(position + len(statements), shift)
+        sequence.sizes[position:end] = sizes
+        if not top_level:
+            sequence.end += shift
+        had_node = bool(sequence.node_id)
+        self.link(sequence, base, position, position + len(statements))
+        grown = sum(sizes) - replaced + bool(sequence.node_id) - had_node
+
+        # The sequences holding it end later, and so do the ones after it in the same statements
+        for depth in range(len(path) - 1):
+            outer, _, outer_position = path[depth]
+            outer.tokens.shift(outer_position + 1, shift)
+            if depth:
+                outer.end += shift
+            outer.sizes[outer_position] += grown
+            nested = self.nested[outer.statements[outer_position]]
+            for inner in nested[nested.index(path[depth + 1][0]) + 1:]:
+                inner.start += shift
+        return True
+
+    def edit(self, offset, removed, inserted):
+        '''
+        Replaces removed characters at offset by the inserted text, returns the new (tree, root_id)
+        '''
+
+        source = self.source
+        self.source = source[:offset] + inserted + source[offset + removed:]
+        types, starts, ends, lines = self.types, self.starts, self.ends, self.lines
+        count = len(types)
+        if not count:
+            return self.parse_all()
+        delta, inserted_end = len(inserted) - removed, offset + len(inserted)
+
+        # The first token the edit can touch, scanning starts right after the one before it
+        low = ends.bisect_left(offset)
+        pos, line = (ends[low - 1], lines[low - 1]) if low else (0, 1)
+
+        # Re-scan until a new token is an old one moved by delta
+        new_types, new_starts, new_ends, new_lines = array('B'), array('q'), array('q'), array('q')
+        high, line_delta = count, 0
+        for batch in TinyScanner.tokenize_batches(self.source, self.rescan_window, pos, line):
+            size = len(batch)
+            for index in range(size):
+                start = batch.starts[index]
+                if start < inserted_end:
+                    continue
+                old = starts.bisect_left(start - delta)
+                if (old < count and starts[old] == start - delta and ends[old] == batch.ends[index] - delta
+                        and types[old] == batch.types[index]):
+                    high, line_delta, size = old, batch.lines[index] - lines[old], index
+                    break
+            new_types.extend(batch.types[:size])
+            new_starts.extend(batch.starts[:size])
+            new_ends.extend(batch.ends[:size])
+            new_lines.extend(batch.lines[:size])
+            if high < count:
+                break
+
+        # The statement to re-parse from, in the innermost sequence holding the replaced tokens
+        path = self.locate(low, high)
+        self.backoff(path)
+        sequence, base, position = path[-1]
+        first_line = lines[base + sequence.tokens[position]]
+
+        types[low:high] = new_types
+        starts.splice(low, high, new_starts)
+        ends.splice(low, high, new_ends)
+        lines.splice(low, high, new_lines)
+        tail, shift = low + len(new_types), len(new_types) - (high - low)
+        starts.shift(tail, delta)
+        ends.shift(tail, delta)
+        lines.shift(tail, line_delta)
+        if line_delta:
+            # Every statement from first_line on is either dead or after the edit
+            self.tree.line.shift(first_line, line_delta)
+
+        # Out a sequence at a time while the new statements don't fit in the old sequence
+        while not self.reparse(path, shift, tail):
+            path.pop()
+            self.backoff(path)
+
+        if self.garbage * 2 > len(self.tree):
+            self.compact()
+        return self.tree, self.root_id
+
+    def compact(self):
+        '''
+        Copies the live nodes to a new tree
+        '''
+
+        old, tree = self.tree, ParseTree()
+        tree.line = _NodeLines(tree.line)
+        moved = array('l', [0]) * len(old.kind)
+        owners, new_owners = old.line.owners, tree.line.owners
+        parents = []
+        for node_id, depth in old.walk(self.root_id):
+            new_id = tree.add_node(old.kind[node_id], old.value[node_id], old.line[node_id])
+            moved[node_id] = new_id
+            # Owners come before the nodes they own
+            new_owners[new_id] = moved[owners[node_id]]
+            del parents[depth:]
+            if parents:
+                tree.add_child(parents[-1], new_id)
+            parents.append(new_id)
+
+        nested, sequences = {}, [self.top]
+        while sequences:
+            sequence = sequences.pop()
+            for statement_id in sequence.statements:
+                inner = self.nested.get(statement_id)
+                if inner:
+                    nested[moved[statement_id]] = inner
+                    sequences.extend(inner)
+            sequence.statements = [moved[statement_id] for statement_id in sequence.statements]
+            sequence.node_id, sequence.parent_id = moved[sequence.node_id], moved[sequence.parent_id]
+        self.tree, self.nested, self.garbage = tree, nested, 0
+        self.root_id = moved[self.root_id]
@@ -0,0 +1,430 @@
+'''
+Native tree layout
+
+Inputs:
+    Syntax tree (ParseTree) and its root node id
+
+Output:
+    The tree drawn as an SVG or PNG image, no Graphviz involved
+
+Usage:
+    layout = TreeLayout(tree, root_id)
+    layout.write_svg(out_file)
+    png = layout.to_png(scale=2)
+    write_svg(tree, root_id, out_file)
+    png = render_png(tree, root_id)
+
+Statements of a stmt_sequence are drawn side by side, the first one hangs off the parent and each of
+the others off the statement before it, like the DOT renderer lays them out. Subtrees are placed by
+Reingold-Tilford tidy tree rules, with Buchheim, Junger and Leipert's linear time version of Walker's
+algorithm. Nodes at the same depth share a colour with the DOT renderer.
+
+Everything is plain Python, so big trees take a while: a 30 statement program (311 nodes, a 9554x824
+image) comes out as PNG in about 0.19 s, 0.09 s of it in zlib. A 184k node tree (19000 generated
+statements) takes 0.7 to 1.3 s to lay out, depending on how often the garbage collector walks the
+growing heap, and 0.8 s to write as SVG. Trees that big are only drawn as SVG, to_png refuses images
+over 64M pixels.
+'''
+
+from tiny_parser import Kinds
+from tiny_render import level_color
+from tiny_stats import stage
+import html
+import math
+import struct
+import zlib
+
+
+class TreeLayout(object):
+    '''
+    Positions of the drawn nodes of a tree
+
+    Display node 0 is an invisible root over the top level statements, display node d stands for tree
+    node nodes[d], x[d]/y[d] is its center, chained[d] tells if it hangs off its left sibling.
+    '''
+
+    char_width = 6
+    line_height = 10
+    padding = 4
+    sibling_gap = 10
+    level_gap = 24
+    margin = 10
+
+    def __init__(self, tree, root_id):
+        self.tree = tree
+        self.node_height = 2 * self.line_height + 2 * self.padding
+        nodes, children, parent, chained, depth = [0], [[]], [-1], [False], [-1]
+        labels, widths = [()], [0]
+        # Label lines and width by (kind, value), most labels repeat
+        shapes = {}
+        kind, value = tree.kind, tree.value
+
+        order = [0]
+        pending = [(0, self.expand(root_id, True))]
+        for display_id, members in pending:
+            for node_id, is_chained in members:
+                child = len(nodes)
+                nodes.append(node_id)
+                children.append([])
+                parent.append(display_id)
+                chained.append(is_chained)
+                depth.append(depth[display_id] + 1)
+                key = (kind[node_id], value[node_id])
+                shape = shapes.get(key)
+                if shape is None:
+                    lines = tuple(tree.label(node_id).split('\n'))
+                    shape = shapes[key] = (lines, max(map(len, lines)) * self.char_width + 2 * self.padding)
+                labels.append(shape[0])
+                widths.append(shape[1])
+                children[display_id].append(child)
+                order.append(child)
+                pending.append((child, self.expand(node_id)))
+
+        self.nodes, self.children, self.parent, self.chained = nodes, children, parent, chained
+        self.depth, self.labels, self.widths = depth, labels, widths
+        self.order = order
+        self.place()
+
+    def expand(self, node_id, is_root=False):
+        '''
+        (child node id, chained) of the drawn children of a node, the statements of a stmt_sequence
+        child take its place
+        '''
+
+        tree = self.tree
+        members = []
+        for child_id in ((node_id,) if is_root else tree.children(node_id)):
+            if child_id and tree.kind[child_id] == Kinds.STMT_SEQUENCE:
+                members.extend((statement_id, index > 0) for index, statement_id in enumerate(tree.children(child_id)))
+            elif child_id:
+                members.append((child_id, False))
+        return members
+
+    def place(self):
+        '''
+        Buchheim's first walk bottom up (breadth first order reversed), then the second walk top down
+        '''
+
+        count = len(self.nodes)
+        children, parent, widths = self.children, self.parent, self.widths
+        gap = self.sibling_gap
+        prelim, mod, shift, change = [0.0] * count, [0.0] * count, [0.0] * count, [0.0] * count
+        thread, ancestor, number = [-1] * count, list(range(count)), [0] * count
+        midpoint = [0.0] * count
+        for kids in children:
+            for index, child in enumerate(kids):
+                number[child] = index
+
+        def next_left(v):
+            return children[v][0] if children[v] else thread[v]
+
+        def next_right(v):
+            return children[v][-1] if children[v] else thread[v]
+
+        def distance(left, right):
+            return (widths[left] + widths[right]) / 2 + gap
+
+        def move_subtree(wl, wr, amount):
+            subtrees = number[wr] - number[wl]
+            change[wr] -= amount / subtrees
+            shift[wr] += amount
+            change[wl] += amount / subtrees
+            prelim[wr] += amount
+            mod[wr] += amount
+
+        def apportion(v, default_ancestor):
+            if not number[v]:
+                return default_ancestor
+            siblings = children[parent[v]]
+            vir = vor = v
+            vil = siblings[number[v] - 1]
+            vol = siblings[0]
+            sir = sor = mod[v]
+            sil, sol = mod[vil], mod[vol]
+            while next_right(vil) >= 0 and next_left(vir) >= 0:
+                vil, vir = next_right(vil), next_left(vir)
+                vol, vor = next_left(vol), next_right(vor)
+                ancestor[vor] = v
+                amount = (prelim[vil] + sil) - (prelim[vir] + sir) + distance(vil, vir)
+                if amount > 0:
+                    wl = ancestor[vil] if parent[ancestor[vil]] == parent[v] else default_ancestor
+                    move_subtree(wl, v, amount)
+                    sir += amount
+                    sor += amount
+                sil += mod[vil]
+                sir += mod[vir]
+                sol += mod[vol]
+                sor += mod[vor]
+            if next_right(vil) >= 0 and next_right(vor) < 0:
+                thread[vor] = next_right(vil)
+                mod[vor] += sil - sor
+            if next_left(vir) >= 0 and next_left(vol) < 0:
+                thread[vol] = next_left(vir)
+                mod[vol] += sir - sol
+                default_ancestor = v
+            return default_ancestor
+
+        for v in reversed(self.order):
+            kids = children[v]
+            if not kids:
+                continue
+            default_ancestor = kids[0]
+            for index, w in enumerate(kids):
+                if index:
+                    left = kids[index - 1]
+                    prelim[w] = prelim[left] + distance(left, w)
+                    if children[w]:
+                        mod[w] = prelim[w] - midpoint[w]
+                else:
+                    prelim[w] = midpoint[w]
+                default_ancestor = apportion(w, default_ancestor)
+            amount = total = 0.0
+            for w in reversed(kids):
+                prelim[w] += amount
+                mod[w] += amount
+                total += change[w]
+                amount += shift[w] + total
+            midpoint[v] = (prelim[kids[0]] + prelim[kids[-1]]) / 2
+        prelim[0] = midpoint[0]
+
+        self.number = number
+        x, modsum = [0.0] * count, [0.0] * count
+        for v in self.order:
+            x[v] = prelim[v] + modsum[v]
+            for w in children[v]:
+                modsum[w] = modsum[v] + mod[v]
+
+        left = min((x[v] - widths[v] / 2 for v in range(1, count)), default=0)
+        right = max((x[v] + widths[v] / 2 for v in range(1, count)), default=0)
+        self.x = [value - left + self.margin for value in x]
+        step = self.node_height + self.level_gap
+        self.y = [d * step + self.node_height / 2 + self.margin for d in self.depth]
+        self.width = int(math.ceil(right - left)) + 2 * self.margin
+        self.height = (max(self.depth) + 1) * step - self.level_gap + 2 * self.margin if count > 1 else 2 * self.margin
+
+    def edges(self):
+        '''
+        (x1, y1, x2, y2) of every edge, from the bottom of a parent or the right side of a left sibling
+        '''
+
+        x, y, widths, half = self.x, self.y, self.widths, self.node_height / 2
+        for v in range(1, len(self.nodes)):
+            p = self.parent[v]
+            if self.chained[v]:
+                left = self.children[p][self.number[v] - 1]
+                yield x[left] + widths[left] / 2, y[left], x[v] - widths[v] / 2, y[v]
+            elif p:
+                yield x[p], y[p] + half, x[v], y[v] - half
+
+    def is_leaf_kind(self, v):
+        return self.tree.kind[self.nodes[v]] in self.tree.leaf_kinds
+
+    def write_svg(self, out):
+        '''
+        Writes the SVG image to the text file out
+        '''
+
+        lines = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">\n' % (self.width, self.height, self.width, self.height),
+                 '<rect width="100%" height="100%" fill="white"/>\n',
+                 '<g stroke="black" stroke-width="1">\n']
+        for x1, y1, x2, y2 in self.edges():
+            lines.append('<line x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f"/>\n' % (x1, y1, x2, y2))
+        lines.append('</g>\n<g stroke="black" font-family="Courier" font-size="10" text-anchor="middle">\n')
+
+        half_height = self.node_height / 2
+        colors = [level_color(depth) for depth in range(max(self.depth) + 1)]
+        escaped = {}
+        for v in range(1, len(self.nodes)):
+            cx, cy, half_width = self.x[v], self.y[v], self.widths[v] / 2
+            color = colors[self.depth[v]]
+            if self.is_leaf_kind(v):
+                lines.append('<ellipse cx="%.1f" cy="%.1f" rx="%.1f" ry="%.1f" fill="%s"/>\n' % (cx, cy, half_width, half_height, color))
+            else:
+                lines.append('<rect x="%.1f" y="%.1f" width="%.1f" height="%d" fill="%s"/>\n' % (cx - half_width, cy - half_height, 2 * half_width, self.node_height, color))
+            label = self.labels[v]
+            texts = escaped.get(label)
+            if texts is None:
+                texts = escaped[label] = [html.escape(text) for text in label]
+            top = cy - len(label) * self.line_height / 2 + self.line_height - 2
+            spans = ''.join('<tspan x="%.1f" y="%.1f">%s</tspan>' % (cx, top + row * self.line_height, text)
+                            for row, text in enumerate(texts))
+            lines.append('<text fill="white" stroke="none">%s</text>\n' % spans)
+            if len(lines) > 4096:
+                out.write(''.join(lines))
+                lines.clear()
+        lines.append('</g>\n</svg>\n')
+        out.write(''.join(lines))
+
+    def to_png(self, scale=2, max_pixels=1 << 26):
+        '''
+        PNG image of the tree, scale pixels per layout unit
+        '''
+
+        width, height = self.width * scale, self.height * scale
+        if width * height > max_pixels:
+            raise ValueError('Tree too large for a PNG image ({w}x{h}), write SVG instead'.format(w=width, h=height))
+        canvas = _Canvas(width, height)
+        for x1, y1, x2, y2 in self.edges():
+            canvas.line(x1 * scale, y1 * scale, x2 * scale, y2 * scale, scale)
+
+        half_height = self.node_height / 2
+        colors = [bytes.fromhex(level_color(depth)[1:]) for depth in range(max(self.depth) + 1)]
+        for v in range(1, len(self.nodes)):
+            cx, cy, half_width = self.x[v] * scale, self.y[v] * scale, self.widths[v] / 2 * scale
+            color = colors[self.depth[v]]
+            fill = canvas.ellipse if self.is_leaf_kind(v) else canvas.rect
+            fill(cx, cy, half_width, half_height * scale, b'\0\0\0')
+            fill(cx, cy, half_width - scale, (half_height - 1) * scale, color)
+            labels = self.labels[v]
+            top = cy - (len(labels) * self.line_height / 2 - 1.5) * scale
+            for row, text in enumerate(labels):
+                left = cx - (len(text) * self.char_width - 1) / 2 * scale
+                canvas.text(left, top + row * self.line_height * scale, text, scale)
+        return canvas.png()
+
+
+class _Canvas(object):
+    '''
+    RGB pixels on a white background
+
+    Shapes are filled a pixel row at a time with one slice assignment, text is ORed into the rows
+    from masks made once per label and scale, white being all bits set.
+    '''
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.pixels = bytearray(b'\xff') * (width * height * 3)
+        self.masks = {}
+
+    def span(self, y, x1, x2, color):
+        y, x1, x2 = int(y), max(int(x1), 0), min(int(x2), self.width)
+        if 0 <= y < self.height and x1 < x2:
+            start = (y * self.width + x1) * 3
+            self.pixels[start:start + (x2 - x1) * 3] = color * (x2 - x1)
+
+    def rect(self, cx, cy, half_width, half_height, color):
+        x1, x2 = max(int(cx - half_width), 0), min(int(cx + half_width), self.width)
+        if x1 >= x2:
+            return
+        pixels, stride, row = self.pixels, self.width * 3, color * (x2 - x1)
+        for y in range(max(int(cy - half_height), 0), min(int(cy + half_height), self.height)):
+            start = y * stride + x1 * 3
+            pixels[start:start + len(row)] = row
+
+    def ellipse(self, cx, cy, half_width, half_height, color):
+        pixels, width, stride = self.pixels, self.width, self.width * 3
+        for y in range(max(int(cy - half_height), 0), min(int(cy + half_height), self.height)):
+            dy = (y + 0.5 - cy) / half_height
+            if dy * dy < 1:
+                dx = half_width * math.sqrt(1 - dy * dy)
+                x1, x2 = max(int(cx - dx), 0), min(int(cx + dx), width)
+                if x1 < x2:
+                    start = y * stride + x1 * 3
+                    pixels[start:start + (x2 - x1) * 3] = color * (x2 - x1)
+
+    def line(self, x1, y1, x2, y2, thickness):
+        # The squares drawn along the line cover one run of columns per row, each row gets a single span
+        steps = int(max(abs(x2 - x1), abs(y2 - y1))) + 1
+        half = thickness // 2
+        runs = {}
+        for step in range(steps + 1):
+            x = x1 + (x2 - x1) * step / steps - half
+            y = y1 + (y2 - y1) * step / steps - half
+            left, right = int(x), int(x + thickness)
+            for row in range(thickness):
+                key = int(y + row)
+                run = runs.get(key)
+                if run is None:
+                    runs[key] = [left, right]
+                else:
+                    if left < run[0]:
+                        run[0] = left
+                    if right > run[1]:
+                        run[1] = right
+        pixels, width, stride = self.pixels, self.width, self.width * 3
+        for y, (left, right) in runs.items():
+            left, right = max(left, 0), min(right, width)
+            if 0 <= y < self.height and left < right:
+                start = y * stride + left * 3
+                pixels[start:start + (right - left) * 3] = b'\0\0\0' * (right - left)
+
+    def mask(self, text, scale):
+        '''
+        Pixel rows of the white glyphs of text as integers, all bits set where a glyph is lit
+        '''
+
+        key = (text, scale)
+        rows = self.masks.get(key)
+        if rows is None:
+            width = len(text) * 6 * scale
+            bits = [bytearray(width * 3) for _ in range(7)]
+            lit = b'\xff' * (scale * 3)
+            for index, c in enumerate(text):
+                for column, glyph_bits in enumerate(_font.get(c, _font['?'])):
+                    start = (index * 6 + column) * scale * 3
+                    for row in range(7):
+                        if glyph_bits >> row & 1:
+                            bits[row][start:start + len(lit)] = lit
+            rows = self.masks[key] = [int.from_bytes(bits[row // scale], 'big') for row in range(7 * scale)]
+        return rows
+
+    def text(self, left, top, text, scale):
+        rows = self.mask(text, scale)
+        x1, y1 = int(left), int(top)
+        size = len(text) * 6 * scale * 3
+        if x1 < 0 or x1 * 3 + size > self.width * 3:
+            # Clipped at the sides, one glyph pixel at a time
+            for index, c in enumerate(text):
+                for column, bits in enumerate(_font.get(c, _font['?'])):
+                    x0 = left + (index * 6 + column) * scale
+                    for row in range(7 * scale):
+                        if bits >> (row // scale) & 1:
+                            self.span(top + row, x0, x0 + scale, b'\xff\xff\xff')
+            return
+        pixels, stride = self.pixels, self.width * 3
+        for row, bits in enumerate(rows):
+            y = y1 + row
+            if bits and 0 <= y < self.height:
+                start = y * stride + x1 * 3
+                pixels[start:start + size] = (int.from_bytes(pixels[start:start + size], 'big') | bits).to_bytes(size, 'big')
+
+    def png(self):
+        stride = self.width * 3
+        raw = b''.join(b'\0' + self.pixels[y * stride:(y + 1) * stride] for y in range(self.height))
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b''))
+
+
+# 5x7 glyphs, one byte per column, bit 0 on top
+_font = {chr(32 + index): bytes.fromhex(glyph) for index, glyph in enumerate((
+    '0000000000', '00005f0000', '0007000700', '147f147f14', '242a7f2a12', '2313086462', '3649552250', '0005030000',
+    '001c224100', '0041221c00', '082a1c2a08', '08083e0808', '0050300000', '0808080808', '0060600000', '2010080402',
+    '3e5149453e', '00427f4000', '4261514946', '2141454b31', '1814127f10', '2745454539', '3c4a494930', '0171090503',
+    '3649494936', '064949291e', '0036360000', '0056360000', '0008142241', '1414141414', '4122140800', '0201510906',
+    '324979413e', '7e1111117e', '7f49494936', '3e41414122', '7f4141221c', '7f49494941', '7f09090101', '3e41415132',
+    '7f0808087f', '00417f4100', '2040413f01', '7f08142241', '7f40404040', '7f0204027f', '7f0408107f', '3e4141413e',
+    '7f09090906', '3e4151215e', '7f09192946', '4649494931', '01017f0101', '3f4040403f', '1f2040201f', '7f2018207f',
+    '6314081463', '0304780403', '6151494543', '00007f4141', '0204081020', '41417f0000', '0402010204', '4040404040',
+    '0001020400', '2054545478', '7f48444438', '3844444420', '384444487f', '3854545418', '087e090102', '081454543c',
+    '7f08040478', '00447d4000', '2040443d00', '007f102844', '00417f4000', '7c04180478', '7c08040478', '3844444438',
+    '7c14141408', '081414187c', '7c08040408', '4854545420', '043f444020', '3c4040207c', '1c2040201c', '3c4030403c',
+    '4428102844', '0c5050503c', '4464544c44', '0008364100', '00007f0000', '0041360800', '0201020402',
+))}
+
+
+def write_svg(tree, root_id, out):
+    with stage('layout'):
+        layout = TreeLayout(tree, root_id)
+    with stage('svg'):
+        layout.write_svg(out)
+
+
+def render_png(tree, root_id, scale=2):
+    with stage('layout'):
+        layout = TreeLayout(tree, root_id)
+    with stage('png'):
+        return layout.to_png(scale)
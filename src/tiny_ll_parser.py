@@ -0,0 +1,332 @@
+'''
+A non-recursive parser
+
+Inputs:
+    TINY language snippet code
+
+Output:
+    Syntax tree (ParseTree), node for node the same tree TinyParser.parse builds
+
+Usage:
+    tree, root_id = TinyLLParser.parse(input)
+
+Statements are parsed by an LL(1) table built from the grammar in tiny_parser (rewritten below
+without left recursion), driven by an explicit stack. Expressions are parsed by precedence climbing
+over an explicit operator stack. Nesting depth is only limited by memory.
+
+Grammar:
+    PROGRAM       → STMT_SEQUENCE
+    STMT_SEQUENCE → STATEMENT SEQ_TAIL
+    SEQ_TAIL      → SEMI STATEMENT SEQ_TAIL
+                  | ε
+    STATEMENT     → IF_STMT
+                  | REPEAT_STMT
+                  | ASSIGN_STMT
+                  | READ_STMT
+                  | WRITE_STMT
+    IF_STMT       → IF EXP THEN STMT_SEQUENCE ELSE_PART END
+    ELSE_PART     → ELSE STMT_SEQUENCE
+                  | ε
+    REPEAT_STMT   → REPEAT STMT_SEQUENCE UNTIL EXP
+    ASSIGN_STMT   → IDENTIFIER ASSIGN EXP
+    READ_STMT     → READ IDENTIFIER
+    WRITE_STMT    → WRITE EXP
+    EXP           → precedence climbing, COMPARISON_OP < ADD_OP < MUL_OP, one COMPARISON_OP at most
+
+Errors:
+    Same as TinyParser, with the same panic mode recovery, reported in order of position once the
+    program is parsed
+'''
+
+from tiny_scanner import TinyScanner, Tokens, TokenCursor
+from tiny_parser import TinyParser, ParseTree, Kinds
+from errors import error, collecting
+import sys
+
+
+class Symbols(object):
+    # Nonterminals
+    PROGRAM = 100
+    STMT_SEQUENCE = 101
+    SEQ_TAIL = 102
+    STATEMENT = 103
+    IF_STMT = 104
+    ELSE_PART = 105
+    REPEAT_STMT = 106
+    ASSIGN_STMT = 107
+    READ_STMT = 108
+    WRITE_STMT = 109
+    EXP = 110
+
+    # Actions, run when popped off the parse stack
+    MARK = 200
+    SEQ_MORE = 201
+    SEQ_END = 202
+    ATTACH = 203
+    MAKE_IF = 204
+    MAKE_REPEAT = 205
+    MAKE_ASSIGN = 206
+    MAKE_READ = 207
+    MAKE_WRITE = 208
+
+
+T = Tokens.codes
+S = Symbols
+
+grammar = {
+    S.PROGRAM       : [[S.STMT_SEQUENCE]],
+    S.STMT_SEQUENCE : [[S.MARK, S.STATEMENT, S.SEQ_TAIL, S.SEQ_END]],
+    S.SEQ_TAIL      : [[T['SEMI'], S.SEQ_MORE, S.STATEMENT, S.ATTACH, S.SEQ_TAIL], []],
+    S.STATEMENT     : [[S.IF_STMT], [S.REPEAT_STMT], [S.ASSIGN_STMT], [S.READ_STMT], [S.WRITE_STMT]],
+    S.IF_STMT       : [[S.MARK, T['IF'], S.EXP, S.MAKE_IF, T['THEN'], S.STMT_SEQUENCE, S.ATTACH, S.ELSE_PART, T['END']]],
+    S.ELSE_PART     : [[T['ELSE'], S.STMT_SEQUENCE, S.ATTACH], []],
+    S.REPEAT_STMT   : [[S.MARK, T['REPEAT'], S.STMT_SEQUENCE, S.MAKE_REPEAT, T['UNTIL'], S.EXP, S.ATTACH]],
+    S.ASSIGN_STMT   : [[S.MARK, T['IDENTIFIER'], S.MAKE_ASSIGN, T['ASSIGN'], S.EXP, S.ATTACH]],
+    S.READ_STMT     : [[S.MARK, T['READ'], S.MARK, T['IDENTIFIER'], S.MAKE_READ]],
+    S.WRITE_STMT    : [[S.MARK, T['WRITE'], S.EXP, S.MAKE_WRITE]],
+}
+first_exp = {T['LPAREN'], T['NUMBER'], T['IDENTIFIER']}
+sync_codes = {T[name] for name in TinyParser.sync_tokens}
+statement_codes = {T[name] for name in TinyParser.statement_tokens}
+
+# Names the recursive parser uses in its error messages
+error_names = {T[name]: symbol for symbol, name in TinyParser.symbols.items()}
+error_names.update({S.STATEMENT: 'statement'})
+
+precedences = {T['LESS']: 0, T['EQUAL']: 0, T['PLUS']: 1, T['MINUS']: 1, T['TIMES']: 2, T['DIVIDE']: 2}
+operators = {T['LESS']: '<', T['EQUAL']: '=', T['PLUS']: '+', T['MINUS']: '-', T['TIMES']: '*', T['DIVIDE']: '/'}
+
+
+def first_sets(grammar):
+    '''
+    FIRST set and nullability of every nonterminal, actions are transparent
+    '''
+
+    first = {nonterminal: set() for nonterminal in grammar}
+    first[S.EXP] = set(first_exp)
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for nonterminal, productions in grammar.items():
+            for production in productions:
+                for symbol in production:
+                    if symbol >= S.MARK:
+                        continue
+                    symbol_first = first[symbol] if symbol in first else {symbol}
+                    if not symbol_first <= first[nonterminal]:
+                        first[nonterminal] |= symbol_first
+                        changed = True
+                    if symbol not in nullable:
+                        break
+                else:
+                    if nonterminal not in nullable:
+                        nullable.add(nonterminal)
+                        changed = True
+    return first, nullable
+
+
+def build_table(grammar):
+    '''
+    {nonterminal: {token code: production}} and the production to fall back to on any other token:
+    the empty one of a nullable nonterminal, the only one of a nonterminal without alternatives (like
+    a recursive descent parser, it reports the error further down). Productions are stored reversed,
+    ready to be pushed on the parse stack.
+    '''
+
+    first, nullable = first_sets(grammar)
+    table = {}
+    for nonterminal, productions in grammar.items():
+        row = table[nonterminal] = {}
+        for production in productions:
+            for symbol in production:
+                if symbol >= S.MARK:
+                    continue
+                for code in (first[symbol] if symbol in first else {symbol}):
+                    if code in row:
+                        raise ValueError('Grammar is not LL(1) at %d/%d' % (nonterminal, code))
+                    row[code] = tuple(reversed(production))
+                if symbol not in nullable:
+                    break
+    defaults = {}
+    for nonterminal, productions in grammar.items():
+        if nonterminal in nullable:
+            defaults[nonterminal] = ()
+        elif len(productions) == 1:
+            defaults[nonterminal] = tuple(reversed(productions[0]))
+    return table, defaults
+
+
+table, defaults = build_table(grammar)
+
+
+class TinyLLParser(object):
+
+    def __init__(self, input):
+        self.cursor = TokenCursor(TinyScanner.tokenize_batches(input))
+        self.tree = ParseTree()
+        self.recovering = False
+
+    def expect(self, code):
+        cursor = self.cursor
+        if cursor.code == code:
+            if code in sync_codes:
+                self.recovering = False
+            cursor.advance()
+            return True
+        self.report('expect ' + error_names[code])
+        return False
+
+    def report(self, context):
+        if self.recovering:
+            return
+        self.recovering = True
+        error(self.cursor.line, 'Unexpected symbol.', context, self.cursor.column())
+
+    def seq_tail(self, top_level):
+        '''
+        Production for SEQ_TAIL when the current token isn't `;`, like TinyParser.pro_stmt_sequence
+        '''
+
+        cursor = self.cursor
+        if not cursor.code or (not top_level and cursor.code in sync_codes):
+            return ()
+        self.report('stmt_sequence')
+        if cursor.code in statement_codes:
+            # A statement with its `;` missing
+            return (S.SEQ_TAIL, S.ATTACH, S.STATEMENT, S.SEQ_MORE)
+        while cursor.code and cursor.code != T['SEMI']:
+            if not top_level and cursor.code in sync_codes:
+                break
+            cursor.advance()
+        return (S.SEQ_TAIL,)
+
+    def pro_exp(self):
+        '''
+        EXP by precedence climbing
+
+        An operator node is created as soon as its operator is read, once its left operand is complete,
+        and gets its right operand when an operator of lower or equal precedence (or the end of the
+        expression) shows up. That's the order TinyParser creates and fills nodes in.
+        '''
+
+        cursor, tree = self.cursor, self.tree
+        lparen, rparen, number, identifier = T['LPAREN'], T['RPAREN'], T['NUMBER'], T['IDENTIFIER']
+        pending = []            # (node_id, precedence), None marks an open parenthesis
+        comparisons = [False]   # one per parenthesis level, a level holds a single comparison
+
+        while True:
+            code = cursor.code
+            if code == lparen:
+                cursor.advance()
+                pending.append(None)
+                comparisons.append(False)
+                continue
+            if code == number or code == identifier:
+                operand = tree.add_node(Kinds.CONST if code == number else Kinds.ID, cursor.value(), cursor.line)
+                cursor.advance()
+            else:
+                self.report('factor')
+                operand = 0
+
+            while True:
+                code = cursor.code
+                precedence = precedences.get(code)
+                if precedence is not None and not (precedence == 0 and comparisons[-1]):
+                    while pending and pending[-1] is not None and pending[-1][1] >= precedence:
+                        tree.add_child(pending[-1][0], operand)
+                        operand = pending.pop()[0]
+                    node_id = tree.add_node(Kinds.OP, operators[code], cursor.line)
+                    tree.add_child(node_id, operand)
+                    pending.append((node_id, precedence))
+                    if precedence == 0:
+                        comparisons[-1] = True
+                    cursor.advance()
+                    break
+
+                while pending and pending[-1] is not None:
+                    tree.add_child(pending[-1][0], operand)
+                    operand = pending.pop()[0]
+                if not pending:
+                    return operand
+                pending.pop()
+                comparisons.pop()
+                self.expect(rparen)
+
+    def pro_program(self):
+        cursor, tree = self.cursor, self.tree
+        stack = [S.PROGRAM]
+        values = []
+
+        while stack:
+            symbol = stack.pop()
+
+            if symbol < S.PROGRAM:
+                self.expect(symbol)
+
+            elif symbol < S.MARK:
+                if symbol == S.EXP:
+                    values.append(self.pro_exp())
+                    continue
+                production = table[symbol].get(cursor.code)
+                if production is None:
+                    if symbol == S.SEQ_TAIL:
+                        # The sequence closing the program is the only one left below
+                        production = self.seq_tail(len(stack) == 1)
+                    else:
+                        production = defaults.get(symbol)
+                if production is not None:
+                    stack.extend(production)
+                else:
+                    self.report(error_names[symbol])
+                    values.append(0)
+
+            elif symbol == S.MARK:
+                values.append((cursor.value(), cursor.line))
+            elif symbol == S.ATTACH:
+                child_id = values.pop()
+                tree.add_child(values[-1], child_id)
+            elif symbol == S.SEQ_MORE:
+                root_id = values[-1]
+                if tree.kind[root_id] != Kinds.STMT_SEQUENCE:
+                    values[-1] = tree.add_node(Kinds.STMT_SEQUENCE, None, values[-2][1])
+                    tree.add_child(values[-1], root_id)
+            elif symbol == S.SEQ_END:
+                root_id = values.pop()
+                values[-1] = root_id
+            elif symbol == S.MAKE_IF or symbol == S.MAKE_REPEAT:
+                child_id = values.pop()
+                values[-1] = tree.add_node(Kinds.IF if symbol == S.MAKE_IF else Kinds.REPEAT, None, values[-1][1])
+                tree.add_child(values[-1], child_id)
+            elif symbol == S.MAKE_ASSIGN:
+                values[-1] = tree.add_node(Kinds.ASSIGN, *values[-1])
+            elif symbol == S.MAKE_READ:
+                text = values.pop()[0]
+                values[-1] = tree.add_node(Kinds.READ, text, values[-1][1])
+            elif symbol == S.MAKE_WRITE:
+                child_id = values.pop()
+                values[-1] = tree.add_node(Kinds.WRITE, None, values[-1][1])
+                tree.add_child(values[-1], child_id)
+
+        return values.pop()
+
+    @staticmethod
+    def parse(input):
+        # The scanner runs a window ahead of the parser, its errors are put back in order of position
+        with collecting(limit=sys.maxsize) as diagnostics:
+            parser = TinyLLParser(input)
+            root_id = parser.pro_program()
+        for entry in sorted(diagnostics.entries, key=position):
+            error(entry.line, entry.message, entry.source, entry.column)
+        return parser.tree, root_id
+
+
+def position(entry):
+    '''
+    Sort key of a Diagnostic, an error without a column comes last on its line and one past the end
+    of the input (line '') last of all
+    '''
+
+    if not isinstance(entry.line, int):
+        return sys.maxsize, sys.maxsize
+    return entry.line, sys.maxsize if entry.column is None else entry.column
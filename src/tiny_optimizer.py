@@ -0,0 +1,256 @@
+'''
+Syntax tree optimizer
+
+Inputs:
+    Syntax tree (ParseTree) and its root node id
+
+Output:
+    Root id of the optimized tree, nodes that were optimized away are left unreachable
+    (copied out when compacting)
+
+Usage:
+    optimizer = PassManager()                       # every pass
+    optimizer = PassManager(disabled=['simplify'])
+    tree, root_id = optimizer.run(tree, root_id)
+    optimizer.stats                                 # {pass name or 'total': {counter: n}}
+
+Passes:
+    fold_constants   : op nodes over two constants become a constant, divisions by zero are kept
+    simplify         : x * 1, 1 * x, x + 0, 0 + x, x - 0 and x / 1 become x
+    dead_branches    : if statements with a constant condition become the branch that's taken
+    collapse_repeats : repeat loops until a true constant become their body, it runs once
+
+The tree is rewritten in a single post-order pass, every enabled pass looks at a node once its
+children are done, so a fold can make a branch dead in the same run. Statements replacing another
+one are chained through next_sibling and spliced in place, a stmt_sequence left with a single
+statement becomes that statement, one left empty only stays where a statement is required.
+'''
+
+from tiny_parser import Kinds, ParseTree
+from collections import Counter
+
+
+def _divide(dividend, divisor):
+    quotient = abs(dividend) // abs(divisor)
+    return quotient if (dividend < 0) == (divisor < 0) else -quotient
+
+
+operations = {
+    '+': lambda left, right: left + right,
+    '-': lambda left, right: left - right,
+    '*': lambda left, right: left * right,
+    '/': _divide,
+    '<': lambda left, right: int(left < right),
+    '=': lambda left, right: int(left == right),
+}
+
+# (operator, constant, side of the constant) that leave the other operand as it is
+identities = {('*', 1, 0), ('*', 1, 1), ('+', 0, 0), ('+', 0, 1), ('-', 0, 1), ('/', 1, 1)}
+
+
+def constant(tree, node_id):
+    '''
+    Value of a const node, None for other nodes
+    '''
+
+    if tree.kind[node_id] == Kinds.CONST:
+        return int(tree.value[node_id])
+    return None
+
+
+def fold_constants(tree, node_id, stats):
+    if tree.kind[node_id] != Kinds.OP:
+        return None
+    operands = list(tree.children(node_id))
+    if len(operands) != 2:
+        return None
+    left, right = constant(tree, operands[0]), constant(tree, operands[1])
+    if left is None or right is None or (tree.value[node_id] == '/' and not right):
+        return None
+    tree.kind[node_id] = Kinds.CONST
+    tree.value[node_id] = operations[tree.value[node_id]](left, right)
+    tree.first_child[node_id] = tree.last_child[node_id] = 0
+    stats['folded'] += 1
+    return node_id, node_id
+
+
+def simplify(tree, node_id, stats):
+    if tree.kind[node_id] != Kinds.OP:
+        return None
+    operands = list(tree.children(node_id))
+    if len(operands) != 2:
+        return None
+    for side, operand_id in enumerate(operands):
+        if (tree.value[node_id], constant(tree, operand_id), side) in identities:
+            stats['simplified'] += 1
+            other_id = operands[1 - side]
+            return other_id, other_id
+    return None
+
+
+def dead_branches(tree, node_id, stats):
+    if tree.kind[node_id] != Kinds.IF:
+        return None
+    children = list(tree.children(node_id))
+    condition = constant(tree, children[0]) if len(children) > 1 else None
+    if condition is None:
+        return None
+    stats['removed_branches'] += 1
+    if condition:
+        return statements(tree, children[1])
+    return statements(tree, children[2]) if len(children) > 2 else (0, 0)
+
+
+def collapse_repeats(tree, node_id, stats):
+    if tree.kind[node_id] != Kinds.REPEAT:
+        return None
+    children = list(tree.children(node_id))
+    if len(children) != 2 or not constant(tree, children[1]):
+        # A false constant loops forever, that's left as written
+        return None
+    stats['collapsed_loops'] += 1
+    return statements(tree, children[0])
+
+
+def statements(tree, node_id):
+    '''
+    (first, last) chain of the statements of a statement or stmt_sequence node
+    '''
+
+    if tree.kind[node_id] == Kinds.STMT_SEQUENCE:
+        return tree.first_child[node_id], tree.last_child[node_id]
+    return node_id, node_id
+
+
+def link(tree, parent_id, child_ids):
+    '''
+    Makes child_ids the children of parent_id, in order
+    '''
+
+    tree.first_child[parent_id] = tree.last_child[parent_id] = 0
+    for child_id in child_ids:
+        tree.next_sibling[child_id] = 0
+        tree.add_child(parent_id, child_id)
+
+
+def compact(tree, root_id):
+    '''
+    Copies the nodes reachable from root_id to a new tree
+    '''
+
+    new_tree, new_root_id, parents = ParseTree(), 0, []
+    for node_id, depth in tree.walk(root_id):
+        new_id = new_tree.add_node(tree.kind[node_id], tree.value[node_id], tree.line[node_id])
+        del parents[depth:]
+        if parents:
+            new_tree.add_child(parents[-1], new_id)
+        else:
+            new_root_id = new_id
+        parents.append(new_id)
+    return new_tree, new_root_id
+
+
+class PassManager(object):
+
+    passes = (
+        ('fold_constants', fold_constants),
+        ('simplify', simplify),
+        ('dead_branches', dead_branches),
+        ('collapse_repeats', collapse_repeats),
+    )
+
+    def __init__(self, enabled=None, disabled=()):
+        names = [name for name, visit in self.passes]
+        for name in list(enabled or ()) + list(disabled):
+            if name not in names:
+                raise ValueError('Unknown optimization pass `{name}`'.format(name=name))
+        self.enabled = [(name, visit) for name, visit in self.passes
+                        if (enabled is None or name in enabled) and name not in disabled]
+        self.stats = {}
+
+    def run(self, tree, root_id, compact_tree=True):
+        '''
+        Optimizes the tree in place, returns (tree, root_id), a compacted copy of the tree unless compact_tree is False
+        '''
+
+        self.stats = {name: Counter() for name, visit in self.enabled}
+        nodes = 0
+        # (first, last) statement chain or expression node replacing every finished node
+        results = {}
+        stack = [(root_id, False)] if root_id else []
+        while stack:
+            node_id, expanded = stack.pop()
+            if not expanded:
+                stack.append((node_id, True))
+                stack.extend((child_id, False) for child_id in reversed(list(tree.children(node_id))))
+                continue
+            nodes += 1
+            kind = tree.kind[node_id]
+            children = [results.pop(child_id) for child_id in tree.children(node_id)]
+
+            if kind == Kinds.STMT_SEQUENCE:
+                results[node_id] = self.chain(tree, children)
+                continue
+            if kind in (Kinds.IF, Kinds.REPEAT):
+                bodies = [1, 2] if kind == Kinds.IF else [0]
+                original = list(tree.children(node_id))
+                for index in bodies:
+                    if index < len(children):
+                        children[index] = (self.statement(tree, children[index], original[index], tree.line[node_id]),) * 2
+                if kind == Kinds.IF and len(children) > 2 and self.is_empty(tree, children[2][0]):
+                    del children[2]
+            link(tree, node_id, [first for first, last in children])
+
+            result = None
+            for name, visit in self.enabled:
+                result = visit(tree, node_id, self.stats[name])
+                if result is not None:
+                    break
+            results[node_id] = result or (node_id, node_id)
+
+        if root_id:
+            root_id = self.statement(tree, results.pop(root_id), root_id, tree.line[root_id])
+        if compact_tree:
+            tree, root_id = compact(tree, root_id)
+            remaining = len(tree)
+        else:
+            remaining = sum(1 for node in tree.walk(root_id))
+        self.stats['total'] = Counter(nodes_before=nodes, nodes_after=remaining)
+        return tree, root_id
+
+    @staticmethod
+    def chain(tree, chains):
+        '''
+        Joins statement chains into one
+        '''
+
+        first = last = 0
+        for chain_first, chain_last in chains:
+            if not chain_first:
+                continue
+            if last:
+                tree.next_sibling[last] = chain_first
+            else:
+                first = chain_first
+            last = chain_last
+        if last:
+            tree.next_sibling[last] = 0
+        return first, last
+
+    @staticmethod
+    def statement(tree, chain, original_id, line):
+        '''
+        A single node standing for a statement chain, the stmt_sequence it came from if there was one
+        '''
+
+        first, last = chain
+        if first and first == last:
+            return first
+        if tree.kind[original_id] != Kinds.STMT_SEQUENCE:
+            original_id = tree.add_node(Kinds.STMT_SEQUENCE, None, line)
+        tree.first_child[original_id], tree.last_child[original_id] = first, last
+        return original_id
+
+    @staticmethod
+    def is_empty(tree, node_id):
+        return tree.kind[node_id] == Kinds.STMT_SEQUENCE and not tree.first_child[node_id]
@@ -0,0 +1,192 @@
+'''
+Parallel parsing
+
+Inputs:
+    TINY language snippet code
+
+Output:
+    Syntax tree (ParseTree), the same tree (node ids included) TinyParser.parse builds for it
+
+Usage:
+    tree, root_id = parse(input, jobs=4)
+    tinycompiler -p -j 4 in_file.ext out_file.svg
+
+The statements of the top level sequence can be parsed apart. The tokens are scanned once, then cut
+at top level `;` tokens, found by counting `if`/`end` and `repeat`/`until` pairs, into about 4 chunks
+per worker. Every worker parses a chunk as a list of statements into a tree of its own; the trees are
+appended to the first statement in chunk order, their node ids moved by C level passes, and their
+statements linked under the top level stmt_sequence node. Node ids come out in the order the
+recursive parser hands them out, node lines are token lines so they need no change.
+
+A cut is only wrong when the program has errors: then a chunk doesn't parse alone without errors
+(or the scanner reported some), and the program is parsed again by TinyParser.parse, whose panic
+mode recovery decides what the errors are. Programs under min_tokens tokens are parsed serially, and
+so are programs under min_characters characters, without scanning them first to count their tokens.
+
+Errors:
+    Same as TinyParser.parse
+'''
+
+from tiny_scanner import TinyScanner, Tokens, TokenBatch
+from tiny_parser import TinyParser, ParseTree, Kinds
+from errors import collecting
+from array import array
+from itertools import repeat
+from operator import add, mul, truth
+import os
+import re
+
+min_tokens = 1 << 15
+# Generated and hand written programs take a little over 3 characters a token, shorter ones would
+# rarely reach min_tokens
+min_characters = 3 * min_tokens
+chunks_per_job = 4
+
+_opening = (Tokens.codes['IF'], Tokens.codes['REPEAT'])
+_closing = (Tokens.codes['END'], Tokens.codes['UNTIL'])
+_semi = Tokens.codes['SEMI']
+_structure = re.compile(b'[' + re.escape(bytes(_opening + _closing + (_semi,))) + b']')
+
+
+def scan(input):
+    '''
+    Every token of input as a single TokenBatch, None if the scanner reports errors
+    '''
+
+    types, starts, ends, lines = array('B'), array('q'), array('q'), array('q')
+    with collecting() as diagnostics:
+        for batch in TinyScanner.tokenize_batches(input):
+            types.extend(batch.types)
+            starts.extend(batch.starts)
+            ends.extend(batch.ends)
+            lines.extend(batch.lines)
+    if diagnostics.count:
+        return None
+    return TokenBatch(input, types, starts, ends, lines)
+
+
+def top_level_semis(types):
+    '''
+    Indexes of the `;` tokens outside any if or repeat statement
+    '''
+
+    semis = []
+    depth = 0
+    for match in _structure.finditer(types.tobytes() if isinstance(types, array) else bytes(types)):
+        code = types[match.start()]
+        if code == _semi:
+            if not depth:
+                semis.append(match.start())
+        elif code in _opening:
+            depth += 1
+        else:
+            depth -= 1
+    return semis
+
+
+def split(batch, count):
+    '''
+    Cuts batch at top level `;` tokens into the first statement and up to count chunks of about the
+    same number of tokens, the `;` between them are dropped
+    '''
+
+    semis = top_level_semis(batch.types)
+    if not semis:
+        return [batch]
+    size = len(batch.types)
+    step = max(1, (size - semis[0]) // count)
+    cuts = [semis[0]]
+    for semi in semis[1:]:
+        if semi - cuts[-1] >= step:
+            cuts.append(semi)
+    bounds = zip([0] + [cut + 1 for cut in cuts], cuts + [size])
+    return [_slice(batch, low, high) for low, high in bounds]
+
+
+def _slice(batch, low, high):
+    if low == high:
+        return TokenBatch('', array('B'), array('q'), array('q'), array('q'))
+    start, end = batch.starts[low], batch.ends[high - 1]
+    return TokenBatch(batch.text[start - batch.base:end - batch.base], batch.types[low:high], batch.starts[low:high],
+                      batch.ends[low:high], batch.lines[low:high], start)
+
+
+def parse_statements(batch, tree=None):
+    '''
+    Parses batch as statements separated by `;`, returns (tree, statement ids), None on errors
+    '''
+
+    with collecting() as diagnostics:
+        parser = TinyParser(batch, tree)
+        statements = [parser.pro_statement()]
+        while parser.accept(';'):
+            statements.append(parser.pro_statement())
+        if parser.token[1]:
+            parser.report('stmt_sequence')
+    if diagnostics.count:
+        return None
+    return parser.tree, statements
+
+
+def _parse_chunk(batch):
+    result = parse_statements(batch)
+    if result is None:
+        return None
+    tree, statements = result
+    return tree.kind, tree.value, tree.line, tree.first_child, tree.next_sibling, tree.last_child, statements
+
+
+def _moved(ids, offset):
+    # Node ids moved by offset, 0 (no node) stays 0
+    return array('l', map(add, ids, map(mul, map(truth, ids), repeat(offset))))
+
+
+def append_chunk(tree, sequence_id, chunk):
+    '''
+    Appends the nodes of a parsed chunk to tree, its statements become children of sequence_id
+    '''
+
+    kind, value, line, first_child, next_sibling, last_child, statements = chunk
+    offset = len(tree.kind) - 1
+    tree.kind.extend(kind[1:])
+    tree.value.extend(value[1:])
+    tree.line.extend(line[1:])
+    tree.first_child.extend(_moved(first_child[1:], offset))
+    tree.next_sibling.extend(_moved(next_sibling[1:], offset))
+    tree.last_child.extend(_moved(last_child[1:], offset))
+    for statement_id in statements:
+        tree.add_child(sequence_id, statement_id + offset)
+
+
+def parse(input, jobs=None, executor=None):
+    '''
+    Syntax tree of input (the program text), parsed by jobs worker processes (all cores by default)
+    or by executor, a concurrent.futures executor, when given
+    '''
+
+    jobs = jobs or os.cpu_count() or 1
+    if (jobs == 1 and executor is None) or len(input) < min_characters:
+        return TinyParser.parse(input)
+    batch = scan(input)
+    chunks = split(batch, jobs * chunks_per_job) if batch is not None and len(batch) >= min_tokens else []
+    if len(chunks) < 2:
+        return TinyParser.parse(input)
+
+    first, chunks = chunks[0], chunks[1:]
+    if executor is None:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(min(jobs, len(chunks))) as pool:
+            results = list(pool.map(_parse_chunk, chunks))
+    else:
+        results = list(executor.map(_parse_chunk, chunks))
+    head = parse_statements(first, ParseTree())
+    if head is None or None in results:
+        return TinyParser.parse(input)
+
+    # The recursive parser adds the sequence node right after the first statement
+    tree, (first_id,) = head
+    sequence_id = tree.add_node(Kinds.STMT_SEQUENCE, None, first.lines[0])
+    tree.add_child(sequence_id, first_id)
+    for chunk in results:
+        append_chunk(tree, sequence_id, chunk)
+    return tree, sequence_id
@@ -5,7 +5,7 @@ Inputs:
     List of (tokenvalue, tokentype) in a file
 
 Output:
-    Syntax tree as a graph
+    Syntax tree (ParseTree) as a graph
 
 Grammer:
     PROGRAM       → STMT_SEQUENCE
@@ -71,29 +71,131 @@ White Spaces:
 Errors:
     ERROR @ LINE lineno: Unterminated comment
     ERROR @ LINE lineno: Illegal character after `:`
+    ERROR @ LINE context:lineno:column: Unexpected symbol.
+
+Error recovery (panic mode):
+    After an unexpected symbol, further ones are not reported until one of the synchronisation
+    tokens `;`, `end`, `until` or `else` is consumed. A statement sequence that runs into a token
+    it can't go on with skips tokens up to the next synchronisation token, a statement keyword or
+    identifier there is parsed as if the `;` before it was missing. Stray `end`, `until` and
+    `else` at the top level are skipped too, so the whole input is parsed.
 '''
 
 from tiny_scanner import TinyScanner
 from errors import error
-import treelib as tl
+from array import array
 
 Tokenize = TinyScanner.tokenize
 
-class ParseTree(tl.Tree):
 
-    def __init__(self, root_id, root_text, **data):
-        super(ParseTree, self).__init__()
-        '''tag=root_text.replace('\n', '') removed to avoid the library from sorting the nodes alphabetically'''
-        constant_data = {'label': root_text, 'shape': 'box', 'style': 'filled', 'fontname': 'Courier', 'fontcolor': 'white', 'fontsize': '10'}
-        self.create_node(tag='a' , identifier=root_id, data={**constant_data, **data})
-
-    def add_node_to_parent(self, node_id, node_text, parent_id, **data):
-        '''tag=node_text.replace('\n', '') removed to avoid the library from sorting the nodes alphabetically'''
-        constant_data = {'label': node_text, 'shape': 'box', 'style': 'filled', 'fontname': 'Courier', 'fontcolor': 'white', 'fontsize': '10'}
-        self.create_node(tag='a' , identifier=node_id, parent=parent_id, data={**constant_data, **data})
-
-    def add_subtree_to_tree(self, subtree, node_id):
-        self.paste(node_id, subtree)
+class Kinds(object):
+    STMT_SEQUENCE = 1
+    IF = 2
+    REPEAT = 3
+    ASSIGN = 4
+    READ = 5
+    WRITE = 6
+    OP = 7
+    CONST = 8
+    ID = 9
+
+    names = ('', 'stmt_sequence', 'if', 'repeat', 'assign', 'read', 'write', 'op', 'const', 'id')
+
+
+class ParseTree(object):
+    '''
+    Syntax tree stored as parallel arrays indexed by node id
+
+    Node 0 is a sentinel, a 0 in first_child/next_sibling ends the chain.
+    Node ids are handed out in creation order, starting from 1.
+    '''
+
+    __slots__ = ('kind', 'value', 'line', 'first_child', 'next_sibling', 'last_child')
+
+    node_style = {'shape': 'box', 'style': 'filled', 'fontname': 'Courier', 'fontcolor': 'white', 'fontsize': '10'}
+    leaf_kinds = (Kinds.OP, Kinds.CONST, Kinds.ID)
+
+    def __init__(self):
+        self.kind = array('B', [0])
+        self.value = [None]
+        self.line = array('l', [0])
+        self.first_child = array('l', [0])
+        self.next_sibling = array('l', [0])
+        self.last_child = array('l', [0])
+
+    def __len__(self):
+        return len(self.kind) - 1
+
+    def add_node(self, kind, value=None, line=0):
+        '''
+        Appends a detached node and returns its id
+        '''
+
+        self.kind.append(kind)
+        self.value.append(value)
+        self.line.append(line or 0)
+        self.first_child.append(0)
+        self.next_sibling.append(0)
+        self.last_child.append(0)
+        return len(self.kind) - 1
+
+    def add_child(self, parent_id, child_id):
+        '''
+        Links child_id as the last child of parent_id, missing children (id 0) are ignored
+        '''
+
+        if not child_id:
+            return
+        last_id = self.last_child[parent_id]
+        if last_id:
+            self.next_sibling[last_id] = child_id
+        else:
+            self.first_child[parent_id] = child_id
+        self.last_child[parent_id] = child_id
+
+    def children(self, node_id):
+        child_id = self.first_child[node_id]
+        next_sibling = self.next_sibling
+        while child_id:
+            yield child_id
+            child_id = next_sibling[child_id]
+
+    def walk(self, root_id):
+        '''
+        Pre-order (node_id, depth) pairs, iterative so deep trees don't hit the recursion limit
+        '''
+
+        if not root_id:
+            return
+        first_child, next_sibling = self.first_child, self.next_sibling
+        stack = [(root_id, 0)]
+        while stack:
+            node_id, depth = stack.pop()
+            yield node_id, depth
+            child_id = first_child[node_id]
+            if child_id:
+                children = []
+                while child_id:
+                    children.append((child_id, depth + 1))
+                    child_id = next_sibling[child_id]
+                children.reverse()
+                stack.extend(children)
+
+    def label(self, node_id):
+        kind = self.kind[node_id]
+        if kind in (Kinds.STMT_SEQUENCE, Kinds.IF, Kinds.REPEAT, Kinds.WRITE):
+            return Kinds.names[kind]
+        return Kinds.names[kind] + '\n(' + str(self.value[node_id]) + ')'
+
+    def attributes(self, node_id):
+        '''
+        Graphviz attributes of a node, built on demand for the renderers
+        '''
+
+        data = dict(self.node_style, label=self.label(node_id))
+        if self.kind[node_id] in self.leaf_kinds:
+            data['shape'] = 'ellipse'
+        return data
 
 class TinyParser(object):
 
@@ -120,15 +222,24 @@ class TinyParser(object):
         'num'        : 'NUMBER'
     }
 
-    def __init__(self, input):
-        self.tokens = Tokenize(input)
+    sync_tokens = ('SEMI', 'END', 'UNTIL', 'ELSE')
+    statement_tokens = ('IF', 'REPEAT', 'IDENTIFIER', 'READ', 'WRITE')
+
+    def __init__(self, input, tree=None, symbols=None):
+        '''
+        input is either the program text or an iterable of (tokenvalue, tokentype, lineno[, column]),
+        nodes are added to tree when given, definitions and uses of variables to symbols (a
+        tiny_symbols.SymbolTable) when given
+        '''
+
+        if isinstance(input, str):
+            input = Tokenize(input, columns=True, names=symbols.names if symbols is not None else None)
+        self.tokens = iter(input)
         self.token = ('', '', '')
         self.next_token()
-        self.node_id_counter = 0
-
-    def next_node_id(self):
-        self.node_id_counter += 1
-        return self.node_id_counter
+        self.tree = ParseTree() if tree is None else tree
+        self.symbol_table = symbols
+        self.recovering = False
 
     def next_token(self):
         try:
@@ -143,6 +254,8 @@ class TinyParser(object):
 
     def accept(self, in_token):
         if self.check_current(in_token):
+            if self.recovering and self.token[1] in self.sync_tokens:
+                self.recovering = False
             self.next_token()
             return True
         
@@ -151,24 +264,45 @@ class TinyParser(object):
     def expect(self, in_token):
         if self.accept(in_token):
             return True
-        error(self.token[2], 'Unexpected symbol.', 'expect ' + str(in_token))
+        self.report('expect ' + str(in_token))
         return False
 
+    def report(self, context):
+        '''
+        Reports an unexpected symbol, unless still recovering from the last one
+        '''
+
+        if self.recovering:
+            return
+        self.recovering = True
+        column = self.token[3] if len(self.token) > 3 else None
+        error(self.token[2], 'Unexpected symbol.', context, column)
+
+    def synchronize(self, top_level):
+        '''
+        Skips tokens up to the next `;` (or `end`, `until`, `else` that can close the sequence)
+        '''
+
+        while self.token[1] and self.token[1] != 'SEMI':
+            if not top_level and self.token[1] in self.sync_tokens:
+                return
+            self.next_token()
+
     def pro_factor(self):
-        tree, root_id = '', 0
-        temp_token_txt = self.token[0]
+        root_id = 0
+        temp_token_txt, line = self.token[0], self.token[2]
         if self.accept('('):
-            tree, root_id = self.pro_exp()
+            root_id = self.pro_exp()
             self.expect(')')
         elif self.accept('num'):
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'const\n(' + str(temp_token_txt) + ')', shape='ellipse')
+            root_id = self.tree.add_node(Kinds.CONST, temp_token_txt, line)
         elif self.accept('id'):
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'id\n(' + temp_token_txt + ')', shape='ellipse')
+            root_id = self.tree.add_node(Kinds.ID, temp_token_txt, line)
+            if self.symbol_table is not None:
+                self.symbol_table.use(temp_token_txt, root_id, line)
         else:
-            error(self.token[2], 'Unexpected symbol.', 'factor')
-        return tree, root_id
+            self.report('factor')
+        return root_id
 
     def pro_mul_op(self):
         if self.accept('*'):
@@ -176,19 +310,17 @@ class TinyParser(object):
         elif self.accept('/'):
             return '/'
         else:
-            error(self.token[2], 'Unexpected symbol.', 'mul_op')
+            self.report('mul_op')
 
     def pro_term(self):
-        tree, root_id = self.pro_factor()
+        root_id = self.pro_factor()
         while self.check_current('*') or self.check_current('/'):
-            temp_tree, temp_id = tree, root_id
+            temp_id, line = root_id, self.token[2]
             char = self.pro_mul_op()
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'op\n(' + char + ')', shape='ellipse')
-            tree.add_subtree_to_tree(temp_tree, root_id)
-            temp_tree, temp_id = self.pro_factor()
-            tree.add_subtree_to_tree(temp_tree, root_id)
-        return tree, root_id
+            root_id = self.tree.add_node(Kinds.OP, char, line)
+            self.tree.add_child(root_id, temp_id)
+            self.tree.add_child(root_id, self.pro_factor())
+        return root_id
 
     def pro_add_op(self):
         if self.accept('+'):
@@ -196,19 +328,17 @@ class TinyParser(object):
         elif self.accept('-'):
             return '-'
         else:
-            error(self.token[2], 'Unexpected symbol.', 'add_op')
+            self.report('add_op')
 
     def pro_simple_exp(self):
-        tree, root_id = self.pro_term()
+        root_id = self.pro_term()
         while self.check_current('+') or self.check_current('-'):
-            temp_tree, temp_id = tree, root_id
+            temp_id, line = root_id, self.token[2]
             char = self.pro_add_op()
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'op\n(' + char + ')', shape='ellipse')
-            tree.add_subtree_to_tree(temp_tree, root_id)
-            temp_tree, temp_id = self.pro_term()
-            tree.add_subtree_to_tree(temp_tree, root_id)
-        return tree, root_id
+            root_id = self.tree.add_node(Kinds.OP, char, line)
+            self.tree.add_child(root_id, temp_id)
+            self.tree.add_child(root_id, self.pro_term())
+        return root_id
 
     def pro_comparison_op(self):
         if self.accept('<'):
@@ -216,123 +346,127 @@ class TinyParser(object):
         elif self.accept('='):
             return '='
         else:
-            error(self.token[2], 'Unexpected symbol.', 'comparison_op')
+            self.report('comparison_op')
 
     def pro_exp(self):
-        tree, root_id = self.pro_simple_exp()
+        root_id = self.pro_simple_exp()
         if self.check_current('<') or self.check_current('='):
-            temp_tree, temp_id = tree, root_id
+            temp_id, line = root_id, self.token[2]
             char = self.pro_comparison_op()
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'op\n(' + char + ')', shape='ellipse')
-            tree.add_subtree_to_tree(temp_tree, root_id)
-            temp_tree, temp_id = self.pro_simple_exp()
-            tree.add_subtree_to_tree(temp_tree, root_id)
-        return tree, root_id
+            root_id = self.tree.add_node(Kinds.OP, char, line)
+            self.tree.add_child(root_id, temp_id)
+            self.tree.add_child(root_id, self.pro_simple_exp())
+        return root_id
 
     def pro_write_stmt(self):
-        tree, root_id = '', 0
+        root_id = 0
+        line = self.token[2]
         if self.accept('write'):
-            temp_tree, temp_id = self.pro_exp()
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'write')
-            tree.add_subtree_to_tree(temp_tree, root_id)
+            temp_id = self.pro_exp()
+            root_id = self.tree.add_node(Kinds.WRITE, None, line)
+            self.tree.add_child(root_id, temp_id)
         else:
-            error(self.token[2], 'Unexpected symbol.', 'write_stmt')
-        return tree, root_id
+            self.report('write_stmt')
+        return root_id
 
     def pro_read_stmt(self):
-        tree, root_id = '', 0
+        root_id = 0
+        line = self.token[2]
         if self.accept('read'):
             temp_token_txt = self.token[0]
-            self.expect('id')
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'read\n(' + temp_token_txt + ')')
+            defined = self.expect('id')
+            root_id = self.tree.add_node(Kinds.READ, temp_token_txt, line)
+            if defined and self.symbol_table is not None:
+                self.symbol_table.define(temp_token_txt, root_id, line)
         else:
-            error(self.token[2], 'Unexpected symbol.', 'read_stmt')
-        return tree, root_id
+            self.report('read_stmt')
+        return root_id
 
     def pro_assign_stmt(self):
-        tree, root_id = '', 0
-        temp_token_txt = self.token[0]
+        root_id = 0
+        temp_token_txt, line = self.token[0], self.token[2]
         if self.accept('id'):
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'assign\n(' + temp_token_txt + ')')
+            root_id = self.tree.add_node(Kinds.ASSIGN, temp_token_txt, line)
+            if self.symbol_table is not None:
+                self.symbol_table.define(temp_token_txt, root_id, line)
             self.expect(':=')
-            temp_tree, temp_id = self.pro_exp()
-            tree.add_subtree_to_tree(temp_tree, root_id)
+            self.tree.add_child(root_id, self.pro_exp())
         else:
-            error(self.token[2], 'Unexpected symbol.', 'assign_stmt')
-        return tree, root_id
+            self.report('assign_stmt')
+        return root_id
 
     def pro_repeat_stmt(self):
-        tree, root_id = '', 0
+        root_id = 0
+        line = self.token[2]
         if self.accept('repeat'):
-            temp_tree, temp_id = self.pro_stmt_sequence()
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'repeat')
-            tree.add_subtree_to_tree(temp_tree, root_id)
+            temp_id = self.pro_stmt_sequence()
+            root_id = self.tree.add_node(Kinds.REPEAT, None, line)
+            self.tree.add_child(root_id, temp_id)
             self.expect('until')
-            temp_tree, temp_id = self.pro_exp()
-            tree.add_subtree_to_tree(temp_tree, root_id)
+            self.tree.add_child(root_id, self.pro_exp())
         else:
-            error(self.token[2], 'Unexpected symbol.', 'repeat_stmt')
-        return tree, root_id
+            self.report('repeat_stmt')
+        return root_id
 
     def pro_if_stmt(self):
-        tree, root_id = '', 0
+        root_id = 0
+        line = self.token[2]
         if self.accept('if'):
-            temp_tree, temp_id = self.pro_exp()
-            root_id = self.next_node_id()
-            tree = ParseTree(root_id, 'if')
-            tree.add_subtree_to_tree(temp_tree, root_id)
+            temp_id = self.pro_exp()
+            root_id = self.tree.add_node(Kinds.IF, None, line)
+            self.tree.add_child(root_id, temp_id)
             self.expect('then')
-            temp_tree, temp_id = self.pro_stmt_sequence()
-            tree.add_subtree_to_tree(temp_tree, root_id)
+            self.tree.add_child(root_id, self.pro_stmt_sequence())
             if self.accept('else'):
-                temp_tree, temp_id = self.pro_stmt_sequence()
-                tree.add_subtree_to_tree(temp_tree, root_id)
+                self.tree.add_child(root_id, self.pro_stmt_sequence())
             self.expect('end')
         else:
-            error(self.token[2], 'Unexpected symbol.', 'if_stmt')
-        return tree, root_id
+            self.report('if_stmt')
+        return root_id
 
     def pro_statement(self):
-        tree, root_id = '', 0
+        root_id = 0
         if self.check_current('if'):
-            tree, root_id = self.pro_if_stmt()
+            root_id = self.pro_if_stmt()
         elif self.check_current('repeat'):
-            tree, root_id = self.pro_repeat_stmt()
+            root_id = self.pro_repeat_stmt()
         elif self.check_current('id'):
-            tree, root_id = self.pro_assign_stmt()
+            root_id = self.pro_assign_stmt()
         elif self.check_current('read'):
-            tree, root_id = self.pro_read_stmt()
+            root_id = self.pro_read_stmt()
         elif self.check_current('write'):
-            tree, root_id = self.pro_write_stmt()
+            root_id = self.pro_write_stmt()
         else:
-            error(self.token[2], 'Unexpected symbol.', 'statement')
-        return tree, root_id
+            self.report('statement')
+        return root_id
 
-    def pro_stmt_sequence(self):
+    def pro_stmt_sequence(self, top_level=False):
         created_head = False
-        tree, root_id = self.pro_statement()
-        while self.accept(';'):
+        line = self.token[2]
+        root_id = self.pro_statement()
+        while True:
+            if not self.accept(';'):
+                kind = self.token[1]
+                if not kind or (not top_level and kind in self.sync_tokens):
+                    break
+                self.report('stmt_sequence')
+                if kind not in self.statement_tokens:
+                    self.synchronize(top_level)
+                    continue
+                # A statement with its `;` missing
             if not created_head:
-                temp_tree, temp_id = tree, root_id
-                root_id = self.next_node_id()
-                tree = ParseTree(root_id, 'stmt_sequence')
-                tree.add_subtree_to_tree(temp_tree, root_id)
+                temp_id = root_id
+                root_id = self.tree.add_node(Kinds.STMT_SEQUENCE, None, line)
+                self.tree.add_child(root_id, temp_id)
                 created_head = True
-            temp_tree, temp_id = self.pro_statement()
-            tree.add_subtree_to_tree(temp_tree, root_id)
-        return tree, root_id
+            self.tree.add_child(root_id, self.pro_statement())
+        return root_id
 
     def pro_program(self):
-        tree, root_id = self.pro_stmt_sequence()
-        return tree, root_id
+        return self.pro_stmt_sequence(True)
 
     @staticmethod
-    def parse(input):
-        parser = TinyParser(input)
-        tree, root_id = parser.pro_program()
-        return tree, root_id
+    def parse(input, symbols=None):
+        parser = TinyParser(input, symbols=symbols)
+        root_id = parser.pro_program()
+        return parser.tree, root_id
@@ -0,0 +1,186 @@
+'''
+Execution profiler
+
+Inputs:
+    Program compiled by TinyCompiler, its syntax tree and source, integers to read
+
+Output:
+    How many times every statement ran, the time spent in it (with and without the statements nested
+    in it) and the iterations of every repeat loop, as a hotspot report and an annotated source listing
+
+Usage:
+    python tiny_profile.py in_file.ext [--limit N]
+    tinycompiler -r in_file.ext --profile[=FILE]
+    profile = Profile(program)
+    TinyVM.run(program, input, output, profile=profile)
+    print(report(profile, tree, root_id, source))
+    for entry in profile.statements(tree, root_id):
+        ...
+
+A profiled TinyVM.run counts every instruction, times it with perf_counter and counts the jumps taken.
+It runs tiny_vm.profiled_loop, the VM loop with profiling lines added, so running without a profile
+costs nothing more than before. Instructions are tied to statements by the compiler (Program.nodes):
+the code of an if or until test belongs to its if or repeat node. A statement ran as many times as its
+first instruction, a repeat loop iterated as many times as its test ran and was entered as many times
+as its test didn't jump back. Statements compiled to no code (x := x) have no count. Times include the
+profiler's own bookkeeping, they're good to compare statements with each other; a read waiting for
+its input is timed too.
+'''
+
+from tiny_parser import TinyParser, Kinds
+from tiny_vm import TinyCompiler, TinyVM
+from errors import errors_count
+from collections import namedtuple
+import argparse
+import sys
+
+StatementProfile = namedtuple('StatementProfile', 'node_id kind value line count iterations time cumulative')
+
+expression_kinds = (Kinds.OP, Kinds.CONST, Kinds.ID)
+
+
+class Profile(object):
+    '''
+    Execution counts, times (seconds) and taken jumps of every instruction of a Program
+    '''
+
+    def __init__(self, program):
+        self.program = program
+        self.counts = [0] * len(program)
+        self.times = [0.0] * len(program)
+        self.taken = [0] * len(program)
+
+    @property
+    def total(self):
+        return sum(self.times)
+
+    def statements(self, tree, root_id):
+        '''
+        StatementProfile of every statement of the tree the program was compiled from, in pre-order
+        '''
+
+        program = self.program
+        first, last, own = {}, {}, {}
+        for pc, node_id in enumerate(program.nodes):
+            if node_id:
+                first.setdefault(node_id, pc)
+                last[node_id] = pc
+                own[node_id] = own.get(node_id, 0.0) + self.times[pc]
+
+        # Statements with the statement they're nested in, sequences left out
+        order, parents = [], {}
+        stack = [(root_id, 0)] if root_id else []
+        while stack:
+            node_id, parent = stack.pop()
+            kind = tree.kind[node_id]
+            if kind in expression_kinds:
+                continue
+            if kind != Kinds.STMT_SEQUENCE:
+                order.append(node_id)
+                parents[node_id] = parent
+                parent = node_id
+            stack.extend((child_id, parent) for child_id in reversed(list(tree.children(node_id))))
+
+        cumulative = {node_id: own.get(node_id, 0.0) for node_id in order}
+        for node_id in reversed(order):
+            if parents[node_id]:
+                cumulative[parents[node_id]] += cumulative[node_id]
+
+        entries = []
+        for node_id in order:
+            kind = tree.kind[node_id]
+            count = iterations = None
+            if node_id in first:
+                count = self.counts[first[node_id]]
+                if kind == Kinds.REPEAT:
+                    iterations = count
+                    count -= self.taken[last[node_id]]
+            value = tree.value[node_id] if kind in (Kinds.ASSIGN, Kinds.READ) else None
+            entries.append(StatementProfile(node_id, kind, value, tree.line[node_id], count, iterations,
+                                            own.get(node_id, 0.0), cumulative[node_id]))
+        return entries
+
+    def lines(self):
+        '''
+        {line: (count, time)}, the count of the instruction of the line that ran the most
+        '''
+
+        result = {}
+        for line, count, spent in zip(self.program.lines, self.counts, self.times):
+            if not line:
+                continue
+            previous = result.get(line)
+            result[line] = (count, spent) if previous is None else (max(previous[0], count), previous[1] + spent)
+        return result
+
+
+def label(entry):
+    name = Kinds.names[entry.kind]
+    return name if entry.value is None else name + ' ' + str(entry.value)
+
+
+def hotspots(profile, tree, root_id, limit=20):
+    '''
+    Lines of a table of the limit statements that took the most time of their own
+    '''
+
+    total = profile.total or 1.0
+    entries = sorted(profile.statements(tree, root_id), key=lambda entry: (-entry.time, entry.line))[:limit]
+    lines = ['{line:>6}  {statement:<20}{count:>12}{iterations:>12}{time:>12}{cumulative:>12}{share:>8}'.format(
+        line='line', statement='statement', count='count', iterations='iterations', time='self ms', cumulative='total ms', share='self %')]
+    for entry in entries:
+        lines.append('{line:>6}  {statement:<20}{count:>12}{iterations:>12}{time:>12.3f}{cumulative:>12.3f}{share:>8.1f}'.format(
+            line=entry.line, statement=label(entry)[:19], count='-' if entry.count is None else entry.count,
+            iterations='' if entry.iterations is None else entry.iterations, time=entry.time * 1000,
+            cumulative=entry.cumulative * 1000, share=100 * entry.time / total))
+    return lines
+
+
+def annotate(profile, source):
+    '''
+    Lines of the source, each with the count and time (ms) of the code on it
+    '''
+
+    spent = profile.lines()
+    lines = []
+    for line, text in enumerate(source.splitlines(), 1):
+        if line in spent:
+            count, seconds = spent[line]
+            lines.append('{count:>12}{time:>12.3f}  {line:>5}: {text}'.format(count=count, time=seconds * 1000, line=line, text=text))
+        else:
+            lines.append('{blank:>24}  {line:>5}: {text}'.format(blank='', line=line, text=text))
+    return lines
+
+
+def report(profile, tree, root_id, source=None, limit=20):
+    '''
+    Hotspot table, followed by the annotated source when given
+    '''
+
+    lines = ['Total {time:.3f} ms in {count} instructions'.format(time=profile.total * 1000, count=sum(profile.counts)), '']
+    lines.extend(hotspots(profile, tree, root_id, limit))
+    if source is not None:
+        lines.append('')
+        lines.extend(annotate(profile, source))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tiny_profile', description='Run a TINY program and report where its time goes')
+    parser.add_argument('infile')
+    parser.add_argument('--limit', type=int, default=20, help='statements in the hotspot table (default: 20)')
+    args = parser.parse_args(argv)
+    with open(args.infile, 'r') as infile:
+        source = infile.read()
+    tree, root_id = TinyParser.parse(source)
+    if errors_count():
+        return 1
+    program = TinyCompiler.compile(tree, root_id)
+    profile = Profile(program)
+    TinyVM.run(program, sys.stdin, sys.stdout, profile)
+    print(report(profile, tree, root_id, source, args.limit), file=sys.stderr)
+    return 1 if errors_count() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,303 @@
+'''
+Python code backend
+
+Inputs:
+    Syntax tree (ParseTree) of a TINY program without errors, integers to read
+
+Output:
+    What the program writes, one integer per line
+
+Usage:
+    program = TinyPyCompiler.compile(tree, root_id)
+    program.run(input=sys.stdin, output=sys.stdout)
+    program = compile_source(source, cache)         # None if source has errors
+
+The tree becomes a Python ast.Module defining a single function, compiled with compile() and run
+by CPython itself. TINY variables are locals of that function (all start at 0), repeat loops are
+`while True` loops ending in `if condition: break`, comparisons outside conditions give 1 or 0.
+Division truncates toward zero. Generated code carries the TINY line numbers. Deeply nested
+expressions are broken up with temporaries, CPython's compiler can't take them whole.
+
+The code objects of the latest programs_size sources are kept in the process, and marshalled into
+the cache when there's one.
+
+Errors:
+    ERROR @ LINE lineno: Division by zero
+    ERROR @ LINE lineno: Nothing left to read
+    ERROR @ LINE lineno: Read a non integer value `value`
+    ERROR @ LINE lineno: Statements nested too deeply for the python backend, run it on the vm
+'''
+
+from tiny_parser import Kinds
+from tiny_vm import IntegerInput
+from errors import error, errors_count
+from tiny_stats import stage
+from collections import OrderedDict
+import ast
+import hashlib
+import marshal
+import sys
+
+binary_operators = {'+': ast.Add, '-': ast.Sub, '*': ast.Mult}
+comparison_operators = {'<': ast.Lt, '=': ast.Eq}
+nesting_kinds = (Kinds.STMT_SEQUENCE, Kinds.IF, Kinds.REPEAT)
+expression_kinds = (Kinds.OP, Kinds.CONST, Kinds.ID)
+
+# (source hash, optimize) -> PyProgram, least recently used first
+programs_size = 64
+_programs = OrderedDict()
+
+
+class TinyRuntimeError(Exception):
+
+    def __init__(self, line, message):
+        Exception.__init__(self, message)
+        self.line = line
+
+
+def divide(dividend, divisor, line):
+    if not divisor:
+        raise TinyRuntimeError(line, 'Division by zero')
+    quotient = abs(dividend) // abs(divisor)
+    return quotient if (dividend < 0) == (divisor < 0) else -quotient
+
+
+class PyProgram(object):
+    '''
+    Code object of a module defining tiny_program(read, write, divide, variables)
+    '''
+
+    def __init__(self, code, names):
+        self.code = code
+        self.names = names
+        self.function = None
+
+    def dumps(self):
+        return marshal.dumps((self.code, self.names))
+
+    @staticmethod
+    def loads(data):
+        return PyProgram(*marshal.loads(data))
+
+    def run(self, input=None, output=None):
+        '''
+        Runs the program until it ends or fails, returns the final values of its variables by name
+        '''
+
+        if self.function is None:
+            namespace = {}
+            exec(self.code, namespace)
+            self.function = namespace['tiny_program']
+        input = IntegerInput(sys.stdin if input is None else input)
+        output = sys.stdout if output is None else output
+        written = []
+
+        def flush():
+            if written:
+                output.write('\n'.join(written) + '\n')
+                written.clear()
+
+        def write(value):
+            written.append(str(value))
+            if len(written) >= 4096:
+                flush()
+
+        def read(line):
+            # Prompts written so far show up before waiting for input
+            if written:
+                flush()
+                output.flush()
+            word = input.next()
+            if word is None:
+                raise TinyRuntimeError(line, 'Nothing left to read')
+            try:
+                return int(word)
+            except ValueError:
+                raise TinyRuntimeError(line, 'Read a non integer value `{value}`'.format(value=word))
+
+        variables = {}
+        try:
+            self.function(read, write, divide, variables)
+        except TinyRuntimeError as e:
+            error(e.line, str(e))
+        flush()
+        return variables
+
+
+class TinyPyCompiler(object):
+
+    nesting_limit = 100
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.names = {}
+        self.temporaries = 0
+
+    def at(self, node, line):
+        node.lineno = node.end_lineno = max(line, 1)
+        node.col_offset = node.end_col_offset = 0
+        return node
+
+    def variable(self, name, ctx):
+        if name not in self.names:
+            # Prefixed so TINY names can't clash with Python keywords or the helpers
+            self.names[name] = 'v_' + name
+        return ast.Name(self.names[name], ctx())
+
+    def spill(self, value, before, line):
+        '''
+        Computes value into a new temporary by a statement added to before, returns the temporary
+        '''
+
+        self.temporaries += 1
+        name = 't_' + str(self.temporaries)
+        before.append(self.at(ast.Assign([self.at(ast.Name(name, ast.Store()), line)], value), line))
+        return self.at(ast.Name(name, ast.Load()), line)
+
+    def expression(self, root_id, before, condition=False):
+        '''
+        Python expression of an expression node, a comparison at its root is left as such in a condition
+
+        Built with an explicit stack. CPython can't compile expressions nested much deeper than a few
+        hundred levels, an operation nested nesting_limit levels deep is computed into a temporary by a
+        statement added to before, the operands computed before it too so that divisions still fail in
+        the order of TINY.
+        '''
+
+        tree = self.tree
+        stack, values = [(root_id, False)], []     # values are (expression, nesting depth)
+        while stack:
+            node_id, expanded = stack.pop()
+            kind, line = tree.kind[node_id], tree.line[node_id]
+            if kind == Kinds.ID:
+                values.append((self.at(self.variable(tree.value[node_id], ast.Load), line), 0))
+                continue
+            if kind == Kinds.CONST:
+                values.append((self.at(ast.Constant(int(tree.value[node_id])), line), 0))
+                continue
+            if not expanded:
+                stack.append((node_id, True))
+                stack.extend((child_id, False) for child_id in reversed(list(tree.children(node_id))))
+                continue
+
+            (right, right_depth), (left, left_depth) = values.pop(), values.pop()
+            operator = tree.value[node_id]
+            if operator in binary_operators:
+                value = self.at(ast.BinOp(left, binary_operators[operator](), right), line)
+            elif operator == '/':
+                value = self.at(ast.Call(ast.Name('divide', ast.Load()), [left, right, ast.Constant(line)], []), line)
+            else:
+                value = self.at(ast.Compare(left, [comparison_operators[operator]()], [right]), line)
+                if not (condition and node_id == root_id):
+                    value = self.at(ast.IfExp(value, ast.Constant(1), ast.Constant(0)), line)
+            depth = max(left_depth, right_depth) + 1
+            if depth >= self.nesting_limit:
+                for index, (operand, operand_depth) in enumerate(values):
+                    if operand_depth:
+                        values[index] = (self.spill(operand, before, line), 0)
+                value, depth = self.spill(value, before, line), 0
+            values.append((value, depth))
+        return values.pop()[0]
+
+    def statement(self, node_id, children, done):
+        '''
+        Python statements of a statement or stmt_sequence node, those of its nested statements are in done
+        '''
+
+        tree = self.tree
+        kind, line = tree.kind[node_id], tree.line[node_id]
+        if kind == Kinds.STMT_SEQUENCE:
+            return [statement for child_id in children for statement in done.pop(child_id)]
+
+        before = []
+        if kind == Kinds.ASSIGN:
+            statement = ast.Assign([self.variable(tree.value[node_id], ast.Store)], self.expression(children[0], before))
+        elif kind == Kinds.READ:
+            call = ast.Call(ast.Name('read', ast.Load()), [ast.Constant(line)], [])
+            statement = ast.Assign([self.variable(tree.value[node_id], ast.Store)], call)
+        elif kind == Kinds.WRITE:
+            statement = ast.Expr(ast.Call(ast.Name('write', ast.Load()), [self.expression(children[0], before)], []))
+        elif kind == Kinds.IF:
+            test = self.expression(children[0], before, True)
+            orelse = done.pop(children[2]) if len(children) > 2 else []
+            statement = ast.If(test, done.pop(children[1]) or [ast.Pass()], orelse)
+        else:
+            # The test is computed at the end of every iteration
+            last = []
+            until = self.at(ast.If(self.expression(children[1], last, True), [self.at(ast.Break(), line)], []), line)
+            statement = ast.While(ast.Constant(True), done.pop(children[0]) + last + [until], [])
+        return before + [self.at(statement, line)]
+
+    def statements(self, root_id):
+        '''
+        Python statements of a statement or stmt_sequence node, nested statements first with an explicit stack
+        '''
+
+        tree = self.tree
+        done = {}
+        stack = [(root_id, False)]
+        while stack:
+            node_id, expanded = stack.pop()
+            children = list(tree.children(node_id))
+            if not expanded and tree.kind[node_id] in nesting_kinds:
+                stack.append((node_id, True))
+                stack.extend((child_id, False) for child_id in reversed(children) if tree.kind[child_id] not in expression_kinds)
+                continue
+            done[node_id] = self.statement(node_id, children, done)
+        return done[root_id]
+
+    @staticmethod
+    def compile(tree, root_id, filename='<tiny>'):
+        '''
+        PyProgram of the tree, None when its statements are nested too deeply for CPython (reported)
+        '''
+
+        compiler = TinyPyCompiler(tree)
+        body = compiler.statements(root_id) if root_id else []
+        names = sorted(compiler.names)
+
+        def store(name):
+            return ast.Subscript(ast.Name('variables', ast.Load()), ast.Constant(name), ast.Store())
+
+        # Locals are handed back through variables even when the program stops on an error
+        initial = [ast.Assign([ast.Name(compiler.names[name], ast.Store())], ast.Constant(0)) for name in names]
+        final = [ast.Assign([store(name)], ast.Name(compiler.names[name], ast.Load())) for name in names]
+        arguments = ast.arguments([], [ast.arg(name) for name in ('read', 'write', 'divide', 'variables')], None, [], [], None, [])
+        function = ast.FunctionDef('tiny_program', arguments, initial + [ast.Try(body or [ast.Pass()], [], [], final or [ast.Pass()])], [], None)
+        try:
+            module = ast.fix_missing_locations(ast.Module([compiler.at(function, 1)], []))
+            code = compile(module, filename, 'exec')
+        except RecursionError:
+            error(tree.line[root_id], 'Statements nested too deeply for the python backend, run it on the vm')
+            return None
+        return PyProgram(code, names)
+
+
+def compile_source(source, cache=None, optimize=False):
+    '''
+    PyProgram of source, None when source has errors (they're printed)
+    '''
+
+    from tiny_cache import cached, parse_source, tree_options
+    key = (hashlib.sha256(source.encode('utf-8', 'surrogatepass')).digest(), optimize)
+    program = _programs.get(key)
+    if program is not None:
+        _programs.move_to_end(key)
+        return program
+
+    def compute():
+        errors = errors_count()
+        tree, root_id = parse_source(source, None, optimize)
+        if errors_count() != errors:
+            return b''
+        with stage('compile'):
+            program = TinyPyCompiler.compile(tree, root_id)
+        return b'' if program is None else program.dumps()
+
+    # Marshalled code only loads in the Python version that wrote it
+    data = cached(cache, 'pycode', source, compute, (sys.implementation.cache_tag,) + tree_options(optimize))
+    if data:
+        program = _programs[key] = PyProgram.loads(data)
+        if len(_programs) > programs_size:
+            _programs.popitem(last=False)
+    return program
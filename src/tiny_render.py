@@ -0,0 +1,154 @@
+'''
+Syntax tree rendering
+
+Inputs:
+    Syntax tree (ParseTree) and its root node id
+
+Output:
+    The tree as Graphviz DOT text, or drawn by Graphviz as a PNG image
+
+Usage:
+    write_dot(tree, root_id, out_file)
+    dot_text = to_dot(tree, root_id)
+    png = render_png(tree, root_id)
+    render_png(tree, root_id, 'out_file.png')
+
+Nodes are pinned along the diagonal in pre-order. The children of a stmt_sequence hang off an invisible
+anchor node and are chained to each other, only the first one constrains the layout. Nodes at the
+same depth share a colour.
+'''
+
+from tiny_parser import Kinds
+from tiny_stats import stage
+import colorsys
+import io
+import os
+import re
+import subprocess
+import sys
+
+_plain_id = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|-?[0-9]+')
+
+
+def dot_program():
+    '''
+    Path of the bundled Graphviz dot executable (a Windows build), dot from the PATH elsewhere
+    '''
+
+    try:
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    prog = os.path.join(base_path, 'graphviz-2.38', 'bin', 'dot.exe')
+    return prog if os.name == 'nt' and os.path.exists(prog) else 'dot'
+
+
+def quote(value):
+    value = str(value)
+    if _plain_id.fullmatch(value):
+        return value
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+def level_color(level):
+    '''
+    Colour of the nodes at a depth, hues a golden angle apart, dark enough for white labels
+    '''
+
+    red, green, blue = colorsys.hsv_to_rgb(level * 0.618033988749895 % 1, 0.8, 0.7)
+    return '#%02X%02X%02X' % (int(red * 255), int(green * 255), int(blue * 255))
+
+
+def write_dot(tree, root_id, out):
+    '''
+    Writes the DOT text of the tree to the text file out in a single pass
+    '''
+
+    kind, children = tree.kind, tree.children
+    leaf_kinds = tree.leaf_kinds
+    # Attributes shared by every node of a kind, the label is the only per node one
+    styles = {}
+    for code in range(1, len(Kinds.names)):
+        style = dict(tree.node_style)
+        if code in leaf_kinds:
+            style['shape'] = 'ellipse'
+        styles[code] = ''.join(', {key}={value}'.format(key=key, value=quote(value)) for key, value in style.items())
+    colors = []
+    labels = {}
+
+    lines = ['digraph G {\n']
+    position = 0
+    # (node_id, level, caller_node_id, constraint), caller 0 for the root
+    # and (sequence_id, child_id) for the invisible edge to a sequence child
+    stack = [(root_id, 0, 0, True)]
+    while stack:
+        item = stack.pop()
+        if len(item) == 2:
+            lines.append('{0} -> {1} [style=invis];\n'.format(*item))
+            continue
+        node_id, level, caller_node_id, constraint = item
+        pos = '{0}, {0}!'.format(position)
+        position += 1
+        constraint = 'true' if constraint else 'false'
+
+        if kind[node_id] != Kinds.STMT_SEQUENCE:
+            while len(colors) <= level:
+                colors.append(level_color(len(colors)))
+            key = (kind[node_id], tree.value[node_id])
+            label = labels.get(key)
+            if label is None:
+                label = labels[key] = styles[key[0]] + ', label=' + quote(tree.label(node_id))
+            lines.append('{id} [pos="{pos}", color="{color}"{label}];\n'.format(id=node_id, pos=pos, color=colors[level], label=label))
+            if caller_node_id:
+                lines.append('{0} -> {1} [constraint={2}];\n'.format(caller_node_id, node_id, constraint))
+            pending = [(child_id, level + 1, node_id, True) for child_id in children(node_id)]
+        else:
+            lines.append('{id} [pos="{pos}", style=invis];\n'.format(id=node_id, pos=pos))
+            if caller_node_id:
+                lines.append('{0} -> {1} [constraint={2}, style=invis];\n'.format(caller_node_id, node_id, constraint))
+            pending, past_node = [], caller_node_id
+            for child_id in children(node_id):
+                pending.append((child_id, level, past_node, past_node == caller_node_id))
+                pending.append((node_id, child_id))
+                past_node = child_id
+        pending.reverse()
+        stack.extend(pending)
+
+        if len(lines) > 4096:
+            out.write(''.join(lines))
+            lines.clear()
+    lines.append('}\n')
+    out.write(''.join(lines))
+
+
+def to_dot(tree, root_id):
+    out = io.StringIO()
+    with stage('dot'):
+        write_dot(tree, root_id, out)
+    return out.getvalue()
+
+
+def dot_to_png(dot_text):
+    '''
+    Runs Graphviz dot over DOT text, returns the PNG image
+    '''
+
+    with stage('dot_subprocess'):
+        result = subprocess.run([dot_program(), '-Tpng'], input=dot_text.encode('utf-8'), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode:
+        raise RuntimeError('dot failed: ' + result.stderr.decode('utf-8', 'replace').strip())
+    return result.stdout
+
+
+def render_png(tree, root_id, outfile=None):
+    '''
+    Writes the PNG image of the tree to outfile, returns its bytes when there's no outfile
+    '''
+
+    png = dot_to_png(to_dot(tree, root_id))
+    if outfile:
+        with open(outfile, 'wb') as png_file:
+            png_file.write(png)
+        return None
+    return png
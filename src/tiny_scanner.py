@@ -49,9 +49,29 @@ White Spaces:
 Errors:
     ERROR @ LINE lineno: Unterminated comment
     ERROR @ LINE lineno: Illegal character after `:`
+
+Token files (.tok, little-endian):
+    header  : magic b'TINYTOK\\0', version (u16), words per record (u16), string count (u32),
+              token count (u64), string table offset (u64), string table size (u64)
+    records : a record of 5 u32 per token right after the header, type code, string index, line,
+              offset and length of the lexeme in the source
+    strings : string count + 1 u32 offsets into the UTF-8 text of every distinct lexeme that follows
+
+    TinyScanner.write_tokens(source, 'out.tok')
+    with TokenFile('out.tok') as tokens:
+        tree, root_id = TinyParser.parse(tokens)
 '''
 
 from errors import error
+from array import array
+import codecs
+import mmap
+from itertools import accumulate, compress, repeat
+from functools import partial
+from operator import itemgetter, sub
+import re
+import struct
+import sys
 
 
 class States(object):
@@ -62,6 +82,317 @@ class States(object):
     INCOMMENT = 4
 
 
+class Tokens(object):
+    '''
+    Integer codes of the token types, used by the bulk scanner
+    '''
+
+    names = ('', 'IF', 'THEN', 'ELSE', 'END', 'REPEAT', 'UNTIL', 'READ', 'WRITE',
+             'PLUS', 'MINUS', 'TIMES', 'DIVIDE', 'EQUAL', 'LESS', 'LPAREN', 'RPAREN', 'SEMI', 'ASSIGN',
+             'IDENTIFIER', 'NUMBER')
+    codes = {name: code for code, name in enumerate(names)}
+
+    IDENTIFIER = codes['IDENTIFIER']
+    NUMBER = codes['NUMBER']
+
+    # Lexeme classes that never leave the scanner
+    SKIP = len(names)
+    BAD_ASSIGN = SKIP + 1
+    OPEN_COMMENT = SKIP + 2
+
+    is_token = (True,) * len(names) + (False, False, False)
+
+
+class TokenBatch(object):
+    '''
+    A run of tokens stored as parallel arrays
+
+    types holds Tokens codes, starts/ends are offsets into the scanned input and lines the line numbers.
+    text is the piece of input the batch was cut from, it starts at offset base.
+    Lexemes are only sliced out of text when asked for.
+    '''
+
+    __slots__ = ('text', 'base', 'types', 'starts', 'ends', 'lines')
+
+    def __init__(self, text, types, starts, ends, lines, base=0):
+        self.text = text
+        self.base = base
+        self.types = types
+        self.starts = starts
+        self.ends = ends
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.types)
+
+    def lexeme(self, index):
+        return self.text[self.starts[index] - self.base:self.ends[index] - self.base]
+
+    def value(self, index):
+        '''
+        Token value as TinyScanner.tokenize yields it, NUMBER tokens are converted to int
+        '''
+
+        if self.types[index] == Tokens.NUMBER:
+            return int(self.lexeme(index))
+        return self.lexeme(index)
+
+    def type(self, index):
+        return Tokens.names[self.types[index]]
+
+    def column(self, index):
+        '''
+        1-based column of a token, None when its line starts before text does
+        '''
+
+        return _column(self.text, self.base, self.starts[index])
+
+    def __iter__(self):
+        '''
+        (tokenvalue, tokentype, lineno) tuples, same as TinyScanner.tokenize
+        '''
+
+        text, base, names, number = self.text, self.base, Tokens.names, Tokens.NUMBER
+        for code, start, end, line in zip(self.types, self.starts, self.ends, self.lines):
+            if code == number:
+                yield int(text[start - base:end - base]), names[code], line
+            else:
+                yield text[start - base:end - base], names[code], line
+
+
+class TokenCursor(object):
+    '''
+    Walks a sequence of TokenBatch objects one token at a time
+
+    code and line describe the current token, past the end of the input code is 0 and line is ''.
+    '''
+
+    __slots__ = ('batches', 'batch', 'index', 'code', 'line')
+
+    def __init__(self, batches):
+        self.batches = iter(batches)
+        self.batch = None
+        self.index = -1
+        self.code = 0
+        self.line = ''
+        self.advance()
+
+    def advance(self):
+        batch, index = self.batch, self.index + 1
+        while batch is None or index >= len(batch.types):
+            batch, index = next(self.batches, None), 0
+            if batch is None:
+                self.batch, self.code, self.line = None, 0, ''
+                return
+        self.batch, self.index = batch, index
+        self.code = batch.types[index]
+        self.line = batch.lines[index]
+
+    def value(self):
+        if self.batch is None:
+            return ''
+        return self.batch.value(self.index)
+
+    def column(self):
+        if self.batch is None:
+            return None
+        return self.batch.column(self.index)
+
+
+class Names(object):
+    '''
+    Interned identifiers: every distinct name gets the next dense id from 0 and is kept as a single
+    string object, so later lookups compare by identity and reuse its cached hash
+    '''
+
+    __slots__ = ('ids', 'names')
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name_id):
+        return self.names[name_id]
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def id(self, name):
+        '''
+        Id of name, interned if new
+        '''
+
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def intern(self, name):
+        return self.names[self.id(name)]
+
+
+tok_magic = b'TINYTOK\0'
+tok_version = 1
+tok_header = struct.Struct('<8sHHIQQQ')
+tok_record_words = 5
+
+
+class TokenWriter(object):
+    '''
+    Writes TokenBatch objects to a .tok file (a path or a seekable binary file)
+
+    Records are buffered and written buffer_tokens at a time, lexemes are interned as they come and
+    the string table is written last, the header is filled in on close.
+    '''
+
+    def __init__(self, out, buffer_tokens=1 << 16):
+        self.own = not hasattr(out, 'write')
+        self.out = open(out, 'wb') if self.own else out
+        self.start = self.out.tell()
+        self.buffer_tokens = buffer_tokens
+        self.records = array('I')
+        self.strings = {}
+        self.count = 0
+        self.out.write(bytes(tok_header.size))
+
+    def write(self, batch):
+        size = len(batch.types)
+        text, base = batch.text, batch.base
+        lexemes = list(map(text.__getitem__, map(slice, map(sub, batch.starts, repeat(base)), map(sub, batch.ends, repeat(base)))))
+        strings = self.strings
+        # In order of appearance, the same tokens give the same file
+        for lexeme in [lexeme for lexeme in dict.fromkeys(lexemes) if lexeme not in strings]:
+            strings[lexeme] = len(strings)
+
+        records = array('I', [0]) * (size * tok_record_words)
+        records[0::tok_record_words] = array('I', batch.types)
+        records[1::tok_record_words] = array('I', map(strings.__getitem__, lexemes))
+        records[2::tok_record_words] = array('I', batch.lines)
+        records[3::tok_record_words] = array('I', batch.starts)
+        records[4::tok_record_words] = array('I', map(sub, batch.ends, batch.starts))
+        self.records.extend(records)
+        self.count += size
+        if len(self.records) >= self.buffer_tokens * tok_record_words:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder == 'big':
+            self.records.byteswap()
+        self.out.write(self.records.tobytes())
+        self.records = array('I')
+
+    def close(self):
+        self.flush()
+        encoded = [string.encode('utf-8', 'surrogatepass') for string in self.strings]
+        offsets = array('I', accumulate(map(len, encoded), initial=0))
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        table = offsets.tobytes() + b''.join(encoded)
+        strings_offset = tok_header.size + self.count * tok_record_words * 4
+        self.out.write(table)
+        end = self.out.tell()
+        self.out.seek(self.start)
+        self.out.write(tok_header.pack(tok_magic, tok_version, tok_record_words, len(encoded), self.count, strings_offset, len(table)))
+        self.out.seek(end)
+        if self.own:
+            self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class TokenFile(object):
+    '''
+    Tokens of a .tok file (a path or a bytes-like object), iterates like TinyScanner.tokenize
+
+    Files are mapped with mmap, the columns are strided memoryviews of the mapping, nothing is copied
+    but the distinct lexemes, decoded once. Processes reading the same file share its pages.
+    '''
+
+    def __init__(self, source):
+        self.map = None
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            data = memoryview(source)
+        else:
+            with open(source, 'rb') as infile:
+                self.map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            data = memoryview(self.map)
+        self.data = data
+        if len(data) < tok_header.size:
+            raise ValueError('Not a token file')
+        magic, version, words, string_count, count, strings_offset, strings_size = tok_header.unpack_from(data)
+        if magic != tok_magic:
+            raise ValueError('Not a token file')
+        if version != tok_version or words != tok_record_words:
+            raise ValueError('Unsupported token file version {version}'.format(version=version))
+        if strings_offset + strings_size > len(data) or tok_header.size + count * words * 4 > strings_offset:
+            raise ValueError('Truncated token file')
+
+        table_size = (string_count + 1) * 4
+        records = data[tok_header.size:tok_header.size + count * words * 4]
+        offsets = data[strings_offset:strings_offset + table_size]
+        if sys.byteorder == 'big':
+            # Copied, swapped to native order
+            records, offsets = array('I', records), array('I', offsets)
+            records.byteswap()
+            offsets.byteswap()
+            records, offsets = memoryview(records), memoryview(offsets)
+        else:
+            records, offsets = records.cast('I'), offsets.cast('I')
+        self.records, self.offsets = records, offsets
+        self.text = data[strings_offset + table_size:strings_offset + strings_size]
+        self.types = records[0::words]
+        self.strings = records[1::words]
+        self.lines = records[2::words]
+        self.starts = records[3::words]
+        self.lengths = records[4::words]
+        self.values = None
+
+    def __len__(self):
+        return len(self.types)
+
+    def string(self, index):
+        return bytes(self.text[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8', 'surrogatepass')
+
+    def lexeme_values(self):
+        '''
+        Value of every distinct lexeme, NUMBER ones converted to int
+        '''
+
+        if self.values is None:
+            self.values = [int(string) if string[:1].isdigit() else string for string in map(self.string, range(len(self.offsets) - 1))]
+        return self.values
+
+    def __iter__(self):
+        '''
+        (tokenvalue, tokentype, lineno) tuples
+        '''
+
+        values = self.lexeme_values()
+        return zip(map(values.__getitem__, self.strings), map(Tokens.names.__getitem__, self.types), self.lines)
+
+    def close(self):
+        for view in (self.types, self.strings, self.lines, self.starts, self.lengths, self.records, self.offsets, self.text, self.data):
+            view.release()
+        if self.map is not None:
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
 class TinyScanner(object):
 
     reserved_keywords = {
@@ -95,9 +426,16 @@ class TinyScanner(object):
     stream = ''
 
     @staticmethod
-    def tokenize(input):
+    def tokenize(input, columns=False, names=None):
+        '''
+        Yields (tokenvalue, tokentype, lineno) tuples, with columns (tokenvalue, tokentype, lineno, column)
+
+        Identifiers are interned in names (a Names table) when given.
+        '''
+
         stream = input + ' '
         line_no = 1
+        line_start = 0
 
         current_state = States.START
         lookahead = False
@@ -114,6 +452,7 @@ class TinyScanner(object):
                 if c in TinyScanner.white_spaces:
                     if c is '\n':
                         line_no += 1
+                        line_start = i + 1
                 elif c in TinyScanner.digits:
                     value += c
                     current_state = States.INNUM
@@ -121,16 +460,19 @@ class TinyScanner(object):
                     value += c
                     current_state = States.INID
                 elif c in TinyScanner.special_symbols:
-                    yield c, TinyScanner.special_symbols[c], line_no
+                    token = c, TinyScanner.special_symbols[c], line_no
+                    yield token + (i - line_start + 1,) if columns else token
                 elif c is ':':
                     current_state = States.INASSIGN
                 elif c in TinyScanner.comment_open:
                     current_state = States.INCOMMENT
+                    comment_line, comment_column = line_no, i - line_start + 1
             elif current_state is States.INNUM:
                 if c in TinyScanner.digits:
                     value += c
                 else:
-                    yield int(value), 'NUMBER', line_no
+                    token = int(value), 'NUMBER', line_no
+                    yield token + (i - len(value) - line_start + 1,) if columns else token
                     value = ''
                     lookahead = True
                     current_state = States.START
@@ -139,26 +481,264 @@ class TinyScanner(object):
                     value += c
                 else:
                     if value in TinyScanner.reserved_keywords:
-                        yield value, TinyScanner.reserved_keywords[value], line_no
+                        token = value, TinyScanner.reserved_keywords[value], line_no
+                    elif names is not None:
+                        token = names.intern(value), 'IDENTIFIER', line_no
                     else:
-                        yield value, 'IDENTIFIER', line_no
+                        token = value, 'IDENTIFIER', line_no
+                    yield token + (i - len(value) - line_start + 1,) if columns else token
                     value = ''
                     lookahead = True
                     current_state = States.START
             elif current_state is States.INASSIGN:
                 if c is '=':
-                    yield ':=', 'ASSIGN', line_no
+                    token = ':=', 'ASSIGN', line_no
+                    yield token + (i - line_start,) if columns else token
                     current_state = States.START
                 else:
-                    error(line_no, 'Illegal character after `:`')
+                    error(line_no, 'Illegal character after `:`', column=i - line_start)
+                    if c is '\n':
+                        line_start = i + 1
                     current_state = States.START
             elif current_state is States.INCOMMENT:
                 if c in TinyScanner.comment_close:
                     current_state = States.START
                 elif c is '\n':
                     line_no += 1
+                    line_start = i + 1
             
             i += 1
         
         if current_state is States.INCOMMENT:
-            error(line_no, 'Unterminated comment')
+            error(line_no, 'Unterminated comment', column=comment_column if comment_line == line_no else None)
+
+    @staticmethod
+    def tokenize_batches(input, window=1 << 16, pos=0, line=1):
+        '''
+        Bulk scanner engine, yields TokenBatch objects holding the same tokens (and reporting the same
+        errors) as tokenize
+
+        A single master regex cuts about `window` characters at a time into lexemes made of the blanks
+        and comments before a token plus the token itself. Lexemes are classified and numbered with C level
+        iterators, Python code only runs for distinct lexemes not seen before. The last lexeme of a window
+        may continue past it, so it's scanned again as the start of the next window.
+        Scanning can start at any offset pos outside a comment, line being its line number.
+
+        Batches come out about 2.3x faster than tokenize gives tokens (0.13 s against 0.30 s for 876 KB
+        of generated code). Turned back into tuples by tokenize_fast they cost as much as tokenize, and
+        TinyParser parses no faster from them, so it keeps tokenize; the gain is for the batch consumers
+        (tiny_events, tiny_ll_parser, tiny_batch).
+        '''
+
+        size = len(input)
+        while pos < size:
+            final = pos + window >= size
+            batch, end, end_line = _scan_window(input, pos, pos + window, 0, line, final)
+            if end == pos and not final:
+                window *= 2
+                continue
+            pos, line = end, end_line
+            if batch is not None:
+                yield batch
+
+    @staticmethod
+    def tokenize_stream(source, chunk_size=1 << 16):
+        '''
+        Scans a path, a file object (text or binary) or an mmap/bytes object chunk_size characters at a
+        time, yields TokenBatch objects like tokenize_batches
+
+        Only the current chunk and the lexeme cut by its end are held in memory: blanks and comment bodies
+        carried over to the next chunk are dropped once their newlines are counted. Offsets count decoded
+        characters, binary input is read as UTF-8.
+        '''
+
+        carry, base, line = '', 0, 1
+        for chunk in _read_chunks(source, chunk_size):
+            text = carry + chunk
+            batch, end, line = _scan_window(text, 0, len(text), base, line, False)
+            if batch is not None:
+                yield batch
+            carry, base = text[end:], base + end
+
+            blanks, token = _lexeme_parts.fullmatch(carry).groups()
+            if blanks:
+                line += blanks.count('\n')
+                base += len(blanks)
+            if token.startswith(TinyScanner.comment_open):
+                line += token.count('\n')
+                base += len(token) - 1
+                token = TinyScanner.comment_open
+            carry = token
+
+        batch, end, line = _scan_window(carry, 0, len(carry), base, line, True)
+        if batch is not None:
+            yield batch
+
+    @staticmethod
+    def write_tokens(source, out):
+        '''
+        Scans source (anything tokenize_stream takes) into the .tok file out, returns the token count
+        '''
+
+        with TokenWriter(out) as writer:
+            for batch in TinyScanner.tokenize_stream(source):
+                writer.write(batch)
+        return writer.count
+
+    @staticmethod
+    def tokenize_fast(input, columns=False, names=None):
+        '''
+        Drop-in replacement of tokenize backed by tokenize_batches
+
+        Values, type names and columns are built a batch at a time with C level iterators, columns from
+        the newline before every token (a stray `:` swallows a newline without counting it, so line
+        numbers can't be used for that).
+        '''
+
+        if columns:
+            newline_before = partial(input.rfind, '\n', 0)
+        number, identifier = Tokens.NUMBER, Tokens.IDENTIFIER
+        for batch in TinyScanner.tokenize_batches(input):
+            codes, starts, lines = batch.types, batch.starts, batch.lines
+            values = list(map(input.__getitem__, map(slice, starts, batch.ends)))
+            if number in codes:
+                for index in compress(range(len(codes)), map(number.__eq__, codes)):
+                    values[index] = int(values[index])
+            if names is not None and identifier in codes:
+                intern = names.intern
+                for index in compress(range(len(codes)), map(identifier.__eq__, codes)):
+                    values[index] = intern(values[index])
+            types = map(Tokens.names.__getitem__, codes)
+            if columns:
+                yield from zip(values, types, lines, map(sub, starts, map(newline_before, starts)))
+            else:
+                yield from zip(values, types, lines)
+
+
+_blank = r'[^-+*/=<();A-Za-z0-9:{]'
+_lexeme_pattern = re.compile(r'{blank}*(?:\{{[^}}]*\}}{blank}*)*(?:[A-Za-z]+|[0-9]+|[-+*/=<();]|:=|:[\s\S]?|\{{[^}}]*|\Z)'.format(blank=_blank))
+_lexeme_parts = re.compile(r'((?:{blank}|\{{[^}}]*\}})*)(.*)'.format(blank=_blank), re.S)
+
+
+
+def _scan_window(text, pos, endpos, base, line, final):
+    '''
+    Scans text[pos:endpos] as seen from offset base and line, returns the batch (None when empty),
+    the position the next window starts from and its line
+    '''
+
+    lexemes = _lexeme_pattern.findall(text, pos, endpos)
+    if lexemes and not lexemes[-1]:
+        lexemes.pop()
+    if not final:
+        # The last lexeme may go on in the next window
+        if len(lexemes) < 2:
+            return None, pos, line
+        lexemes.pop()
+    if not lexemes:
+        return None, pos, line
+
+    # One lookup per lexeme, other threads may drop entries from the table meanwhile
+    entries = list(map(_lexemes.__getitem__, lexemes))
+    codes = bytes(map(itemgetter(0), entries))
+    types = array('B')
+    types.frombytes(codes)
+    offsets = array('q', accumulate(map(len, lexemes), initial=base + pos))
+    lines = array('q', accumulate(map(itemgetter(2), entries), initial=line))
+    end, line = offsets[-1] - base, lines[-1]
+    ends = offsets[1:]
+    starts = array('q', map(sub, ends, map(itemgetter(1), entries)))
+    del lines[0]
+
+    last_start = starts[-1]
+    if Tokens.BAD_ASSIGN in codes:
+        for index in compress(range(len(types)), map(Tokens.BAD_ASSIGN.__eq__, types)):
+            error(lines[index], 'Illegal character after `:`', column=_column(text, base, starts[index]))
+        keep = list(map(Tokens.is_token.__getitem__, types))
+        types, starts, ends, lines = (array(column.typecode, compress(column, keep)) for column in (types, starts, ends, lines))
+    elif codes[-1] >= Tokens.SKIP:
+        # Blanks at the end of the input or an unterminated comment
+        for column in (types, starts, ends, lines):
+            column.pop()
+    if final and codes[-1] == Tokens.OPEN_COMMENT:
+        error(line, 'Unterminated comment', column=None if '\n' in text[last_start - base:end] else _column(text, base, last_start))
+    return TokenBatch(text, types, starts, ends, lines, base), end, line
+
+
+def _column(text, base, offset):
+    '''
+    Column of the character at offset, None when its line starts before text does
+    '''
+
+    line_start = text.rfind('\n', 0, offset - base) + 1
+    if not line_start and base:
+        return None
+    return offset - base - line_start + 1
+
+
+def _read_chunks(source, chunk_size):
+    '''
+    Yields the text of source chunk_size characters (or bytes) at a time
+    '''
+
+    if isinstance(source, str) or hasattr(source, '__fspath__'):
+        with open(source, 'r') as infile:
+            yield from _read_chunks(infile, chunk_size)
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    if hasattr(source, 'read') and not isinstance(source, mmap.mmap):
+        chunks = iter(lambda: source.read(chunk_size) or None, None)
+    else:
+        view = memoryview(source)
+        chunks = (view[pos:pos + chunk_size] for pos in range(0, len(view), chunk_size))
+
+    for chunk in chunks:
+        if not isinstance(chunk, str):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    tail = decoder.decode(b'', True)
+    if tail:
+        yield tail
+
+
+class _Lexemes(dict):
+    '''
+    Lexeme -> (Tokens code, token length, newline count), filled on first sight of every distinct lexeme
+
+    Entries are whole tuples, so a window reading one never sees it half filled. Lexemes unlikely to
+    show up again (comments, long blanks) aren't kept, and the table starts over once it grows too big.
+    '''
+
+    limit = 1 << 16
+
+    def __missing__(self, lexeme):
+        blanks, token = _lexeme_parts.fullmatch(lexeme).groups()
+        newlines = blanks.count('\n')
+        c = token[:1]
+        if not c:
+            code = Tokens.SKIP
+        elif c in TinyScanner.chars:
+            code = Tokens.codes[TinyScanner.reserved_keywords.get(token, 'IDENTIFIER')]
+        elif c in TinyScanner.digits:
+            code = Tokens.NUMBER
+        elif c in TinyScanner.special_symbols:
+            code = Tokens.codes[TinyScanner.special_symbols[c]]
+        elif c == ':':
+            # The character after a stray `:` is swallowed, newlines included
+            code = Tokens.codes['ASSIGN'] if token == ':=' else Tokens.BAD_ASSIGN
+        else:
+            code = Tokens.OPEN_COMMENT
+            newlines += token.count('\n')
+
+        entry = (code, len(token), newlines)
+        if len(lexeme) > 64 or TinyScanner.comment_open in lexeme:
+            return entry
+        if len(self) > self.limit:
+            self.clear()
+        self[lexeme] = entry
+        return entry
+
+
+_lexemes = _Lexemes()
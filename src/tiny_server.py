@@ -0,0 +1,329 @@
+'''
+Compile server
+
+Inputs:
+    JSON-RPC 2.0 requests on a Unix socket, one JSON document per line
+
+Output:
+    A response line per request, answered as soon as it's done (pipelined requests may be answered
+    out of order, match them by id)
+
+Usage:
+    tinycompiler serve [--socket PATH] [-j jobs] [--cache-dir DIR | --no-cache] [--time-limit SECONDS]
+    tinycompiler -p in_file.ext out_file.svg --connect       (thin client, see main.py -h)
+
+    client = TinyClient()                                   # tiny_client, $TINY_SERVER_SOCKET by default
+    result = client.call('parse', source='read x', optimize=True)
+
+Methods:
+    tokenize(source)                                  -> {tokens: [[value, type, line], ...]}
+    parse(source, optimize=false)                     -> {root, kind, value, line, first_child, next_sibling}
+    render(source, format='svg', optimize=false)      -> {image, encoding: utf-8 | base64 (png)}
+    run(source, input='', backend='vm', optimize=false) -> {output, variables}
+    ping()                                            -> {version}
+
+Every result also holds the errors of the request as {count, errors: [{line, column, message, source}]}.
+Params are checked against the method's signature and types before it runs. A program run for
+longer than the server's time limit (10 s by default) is stopped with an error.
+parse gives the ParseTree columns (kinds by name) with the sentinel node 0 in front.
+
+The server is a single asyncio loop, compiling is handed to a pool of worker processes started once,
+so a request only pays for its own work. Workers keep the imported modules, the compilation cache
+and the compiled programs (Python backend) warm, the loop keeps the latest tokenize/parse/render
+results in memory and answers repeated requests without a worker.
+
+Errors (JSON-RPC error objects):
+    -32700 : Parse error            -32601 : Method not found
+    -32600 : Invalid Request        -32602 : Invalid params
+    -32603 : Internal error         -32000 : Time limit exceeded (run)
+'''
+
+from version import __version__
+from tiny_client import (TinyClient, RPCError, default_socket, PARSE_ERROR, INVALID_REQUEST, METHOD_NOT_FOUND, INVALID_PARAMS,
+                         INTERNAL_ERROR, TIME_LIMIT_EXCEEDED)
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import argparse
+import asyncio
+import base64
+import hashlib
+import inspect
+import io
+import json
+import os
+import signal
+import sys
+
+# Long enough for any source file sent in a request
+line_limit = 1 << 30
+
+memo_size = 256
+memo_methods = ('tokenize', 'parse', 'render')
+
+
+# Types of the params of every method
+param_types = {'source': str, 'input': str, 'format': str, 'backend': str, 'optimize': bool}
+
+# Set in every worker process
+_cache = None
+_time_limit = None
+
+
+def _init_worker(cache_dir, time_limit=None):
+    global _cache, _time_limit
+    if cache_dir is not None:
+        from tiny_cache import Cache
+        _cache = Cache(cache_dir)
+    _time_limit = time_limit
+
+
+def _limited(function, *args):
+    '''
+    Calls function, stopping it with TIME_LIMIT_EXCEEDED once it runs longer than the time limit
+
+    An interval timer raises in the worker's main thread, the VM loop pays nothing for it. Without a
+    limit (or off the main thread, where there are no signals) function runs as long as it takes.
+    '''
+
+    if not _time_limit:
+        return function(*args)
+
+    def expire(signum, frame):
+        raise RPCError(TIME_LIMIT_EXCEEDED, 'Time limit exceeded: the program ran for more than {limit:g} s'.format(limit=_time_limit))
+
+    try:
+        previous = signal.signal(signal.SIGALRM, expire)
+    except ValueError:
+        return function(*args)
+    signal.setitimer(signal.ITIMER_REAL, _time_limit)
+    try:
+        return function(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _tokenize(source):
+    from tiny_cache import scan_source
+    return {'tokens': [list(token) for token in scan_source(source, _cache)]}
+
+
+def _parse(source, optimize=False):
+    from tiny_cache import parse_source
+    from tiny_parser import Kinds
+    tree, root_id = parse_source(source, _cache, optimize)
+    return {'root': root_id, 'kind': [Kinds.names[kind] for kind in tree.kind], 'value': tree.value,
+            'line': tree.line.tolist(), 'first_child': tree.first_child.tolist(), 'next_sibling': tree.next_sibling.tolist()}
+
+
+def _render(source, format='svg', optimize=False):
+    from tiny_cache import image_source
+    if format not in ('png', 'svg', 'dot'):
+        raise RPCError(INVALID_PARAMS, 'Unknown image format ' + str(format))
+    image = image_source(source, format, _cache, optimize)
+    if format == 'png':
+        return {'image': base64.b64encode(image).decode('ascii'), 'encoding': 'base64'}
+    return {'image': image.decode('utf-8'), 'encoding': 'utf-8'}
+
+
+def _run(source, input='', backend='vm', optimize=False):
+    from errors import errors_count
+    if backend == 'python':
+        from tiny_pycode import compile_source
+        program = compile_source(source, _cache, optimize)
+        if program is None:
+            return {'output': '', 'variables': {}}
+        run = program.run
+    elif backend == 'vm':
+        from tiny_cache import parse_source
+        from tiny_vm import TinyCompiler, TinyVM
+        tree, root_id = parse_source(source, _cache, optimize)
+        if errors_count():
+            return {'output': '', 'variables': {}}
+        program = TinyCompiler.compile(tree, root_id)
+        run = lambda input, output: TinyVM.run(program, input, output)
+    else:
+        raise RPCError(INVALID_PARAMS, 'Unknown backend ' + str(backend))
+    output = io.StringIO()
+    variables = _limited(run, io.StringIO(input), output)
+    return {'output': output.getvalue(), 'variables': variables}
+
+
+def _ping():
+    return {'version': __version__}
+
+
+methods = {'tokenize': _tokenize, 'parse': _parse, 'render': _render, 'run': _run, 'ping': _ping}
+signatures = {name: inspect.signature(function) for name, function in methods.items()}
+
+
+def check_params(method, params):
+    '''
+    Raises RPCError(INVALID_PARAMS) unless params fit the method
+    '''
+
+    try:
+        signatures[method].bind(**params)
+    except TypeError as e:
+        raise RPCError(INVALID_PARAMS, str(e))
+    for name, value in params.items():
+        if not isinstance(value, param_types[name]):
+            raise RPCError(INVALID_PARAMS, '{name} must be {kind}'.format(name=name, kind='a boolean' if param_types[name] is bool else 'a string'))
+
+
+def handle(method, params):
+    '''
+    Runs a request in a worker, returns (result, None) or (None, (code, message))
+    '''
+
+    from errors import collecting
+    function = methods[method]
+    try:
+        check_params(method, params)
+        with collecting() as diagnostics:
+            result = function(**params)
+    except RPCError as e:
+        return None, (e.code, str(e))
+    except Exception as e:
+        return None, (INTERNAL_ERROR, '{kind}: {msg}'.format(kind=type(e).__name__, msg=e))
+    result['errors'] = diagnostics.as_dict()
+    return result, None
+
+
+class TinyServer(object):
+
+    def __init__(self, path=None, jobs=None, cache_dir=None, time_limit=10.0):
+        self.path = path or default_socket()
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.time_limit = time_limit
+        self.memo = OrderedDict()
+        self.executor = None
+        self.server = None
+
+    def memo_key(self, method, params):
+        data = json.dumps([method, params], sort_keys=True).encode('utf-8', 'surrogatepass')
+        return hashlib.sha256(data).digest()
+
+    async def dispatch(self, request):
+        '''
+        Response document of a request document
+        '''
+
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or not isinstance(request.get('method'), str):
+                raise RPCError(INVALID_REQUEST, 'Invalid Request')
+            method, params = request['method'], request.get('params', {})
+            if method not in methods:
+                raise RPCError(METHOD_NOT_FOUND, 'Method not found: ' + method)
+            if not isinstance(params, dict):
+                raise RPCError(INVALID_PARAMS, 'params must be an object')
+
+            key = self.memo_key(method, params) if method in memo_methods else None
+            result = self.memo.get(key) if key else None
+            if result is not None:
+                self.memo.move_to_end(key)
+            else:
+                loop = asyncio.get_running_loop()
+                result, failure = await loop.run_in_executor(self.executor, handle, method, params)
+                if failure is not None:
+                    raise RPCError(*failure)
+                if key:
+                    self.memo[key] = result
+                    if len(self.memo) > memo_size:
+                        self.memo.popitem(last=False)
+            return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+        except RPCError as e:
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': e.code, 'message': str(e)}}
+        except BrokenProcessPool as e:
+            # A worker died (killed, out of memory), the next requests get a new pool
+            self.executor.shutdown(wait=False)
+            self.executor = ProcessPoolExecutor(self.jobs, initializer=_init_worker, initargs=(self.cache_dir, self.time_limit))
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': INTERNAL_ERROR, 'message': 'Worker failed: ' + str(e)}}
+
+    async def connection(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def answer(line):
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': 'Parse error: ' + str(e)}}
+            else:
+                response = await self.dispatch(request)
+            async with lock:
+                writer.write(json.dumps(response).encode('utf-8', 'surrogatepass') + b'\n')
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            try:
+                TinyClient(self.path).close()
+            except OSError:
+                # Left over by a server that didn't shut down cleanly
+                os.unlink(self.path)
+            else:
+                raise RuntimeError('A server is already listening on ' + self.path)
+
+        self.executor = ProcessPoolExecutor(self.jobs, initializer=_init_worker, initargs=(self.cache_dir, self.time_limit))
+        # Workers are started and import the compiler before the first request comes in
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, handle, 'ping', {}) for _ in range(self.jobs)))
+
+        stop = loop.create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+        self.server = await asyncio.start_unix_server(self.connection, self.path, limit=line_limit)
+        try:
+            print('Listening on ' + self.path, file=sys.stderr)
+            await stop
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            self.executor.shutdown()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tinycompiler serve', description='Serve compile requests on a Unix socket')
+    parser.add_argument('--socket', help='socket path, $TINY_SERVER_SOCKET or tinycompiler-<uid>.sock in the temporary directory by default')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes, all cores by default')
+    parser.add_argument('--cache-dir', help='cache directory, $TINY_CACHE_DIR or ~/.cache/tinycompiler by default')
+    parser.add_argument('--no-cache', action='store_true', help='keep nothing on disk')
+    parser.add_argument('--time-limit', type=float, default=10.0, metavar='SECONDS', help='longest a run request may take, 0 for no limit (default: 10)')
+    args = parser.parse_args(argv)
+
+    cache_dir = None
+    if not args.no_cache:
+        from tiny_cache import Cache
+        cache_dir = Cache(args.cache_dir).directory
+    try:
+        asyncio.run(TinyServer(args.socket, args.jobs, cache_dir, args.time_limit).serve())
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,653 @@
+'''
+Three-address IR in SSA form
+
+Inputs:
+    Syntax tree (ParseTree) of a TINY program without errors and its root node id
+
+Output:
+    Function: instructions in compact arrays, grouped in basic blocks, every value defined once
+
+Usage:
+    python tiny_ssa.py in_file.ext [-O]
+    function = lower(tree, root_id)
+    propagate_constants(function)   # sparse conditional constant propagation
+    eliminate_dead_code(function)
+    function.compact()
+    print(function.dump())
+
+Instructions are numbered, the number of an instruction is the SSA value it defines. op, a, b and
+line are parallel arrays: a and b hold the operand values, the constant pool index of a const, the
+variable id (into names) of a read. A phi takes a value per predecessor of its block, in the order
+of predecessors, kept in phi_args. Blocks list their instructions in order, phis first; a block
+ends with branch (to its first successor when the value is not 0, to the second otherwise), jump
+or halt. variables holds the variable id every phi, const 0, read and assigned value stands for
+(-1 for temporaries), to name them in dumps.
+
+Lowering reuses the basic blocks of tiny_dataflow. Dominators come from the iterative algorithm of
+Cooper, Harvey and Kennedy over reverse postorder, phis are placed at the iterated dominance frontier
+of the blocks assigning a variable (if joins and repeat headers in TINY) and variables are renamed in
+a walk of the dominator tree. Every variable starts as a const 0 in the entry block, as in the VM.
+
+Passes:
+    propagate_constants : Wegman-Zadeck sparse conditional constant propagation, values proved constant
+                          become consts, branches on them become jumps, blocks never reached are removed
+                          and phis left with a single value are replaced by it
+    eliminate_dead_code : removes the values nothing observable depends on (write, read, branch and
+                          divisions that may fail by zero are kept with the values they use)
+'''
+
+from tiny_dataflow import ControlFlowGraph
+from tiny_optimizer import operations
+from tiny_scanner import Names
+from tiny_parser import TinyParser, Kinds
+from errors import errors_count
+from array import array
+import argparse
+import sys
+
+
+class Ops(object):
+    CONST = 0           # consts[a]
+    ADD = 1             # a + b
+    SUB = 2
+    MUL = 3
+    DIV = 4             # truncates toward zero, stops the program if b is 0
+    LESS = 5            # 1 if a < b else 0
+    EQUAL = 6
+    PHI = 7             # phi_args[value][i] coming from predecessor i
+    READ = 8            # next integer of the input, for variable a
+    WRITE = 9           # write a
+    BRANCH = 10         # to successors[0] if a else successors[1]
+    JUMP = 11           # to successors[0]
+    HALT = 12
+
+    names = ('const', 'add', 'sub', 'mul', 'div', 'less', 'equal', 'phi', 'read', 'write', 'branch', 'jump', 'halt')
+
+    binary = {'+': ADD, '-': SUB, '*': MUL, '/': DIV, '<': LESS, '=': EQUAL}
+    symbols = {ADD: '+', SUB: '-', MUL: '*', DIV: '/', LESS: '<', EQUAL: '='}
+    # Instructions using no value and defining none, or whose value may not be dropped
+    effects = (READ, WRITE, BRANCH, JUMP, HALT)
+
+
+class Function(object):
+    '''
+    A TINY program in SSA form
+    '''
+
+    def __init__(self):
+        self.op = array('B')
+        self.a = array('l')
+        self.b = array('l')
+        self.line = array('l')
+        self.variables = array('l')
+        self.phi_args = {}
+        self.consts = []
+        self.const_ids = {}
+        self.names = Names()
+        self.blocks = []
+        self.successors = []
+        self.predecessors = []
+
+    def __len__(self):
+        return len(self.op)
+
+    def add_block(self):
+        self.blocks.append([])
+        self.successors.append([])
+        self.predecessors.append([])
+        return len(self.blocks) - 1
+
+    def emit(self, block, op, a=0, b=0, line=0, variable=-1):
+        '''
+        Appends an instruction to block, returns its value
+        '''
+
+        self.op.append(op)
+        self.a.append(a)
+        self.b.append(b)
+        self.line.append(line)
+        self.variables.append(variable)
+        value = len(self.op) - 1
+        if block is not None:
+            self.blocks[block].append(value)
+        return value
+
+    def const(self, number):
+        const_id = self.const_ids.get(number)
+        if const_id is None:
+            const_id = self.const_ids[number] = len(self.consts)
+            self.consts.append(number)
+        return const_id
+
+    def operands(self, value):
+        '''
+        Values used by an instruction
+        '''
+
+        op = self.op[value]
+        if op == Ops.PHI:
+            return list(self.phi_args[value])
+        if op in (Ops.WRITE, Ops.BRANCH):
+            return [self.a[value]]
+        if Ops.ADD <= op <= Ops.EQUAL:
+            return [self.a[value], self.b[value]]
+        return []
+
+    def replace_operands(self, value, forward):
+        '''
+        Operands of an instruction replaced by forward[operand] where it holds one
+        '''
+
+        op = self.op[value]
+        if op == Ops.PHI:
+            self.phi_args[value] = array('l', (forward.get(arg, arg) for arg in self.phi_args[value]))
+        elif op in (Ops.WRITE, Ops.BRANCH) or Ops.ADD <= op <= Ops.EQUAL:
+            self.a[value] = forward.get(self.a[value], self.a[value])
+            if op not in (Ops.WRITE, Ops.BRANCH):
+                self.b[value] = forward.get(self.b[value], self.b[value])
+
+    def remove_edge(self, source, target):
+        index = self.predecessors[target].index(source)
+        del self.predecessors[target][index]
+        self.successors[source].remove(target)
+        for value in self.blocks[target]:
+            if self.op[value] != Ops.PHI:
+                break
+            del self.phi_args[value][index]
+
+    def value_name(self, value):
+        variable = self.variables[value]
+        if variable < 0:
+            return '%' + str(value)
+        return '%' + str(value) + '.' + self.names[variable]
+
+    def dump(self):
+        lines = []
+        for block, values in enumerate(self.blocks):
+            preds = ', '.join(map(str, self.predecessors[block]))
+            lines.append('block {block}:{preds}'.format(block=block, preds=' (from ' + preds + ')' if preds else ''))
+            for value in values:
+                op = self.op[value]
+                if op == Ops.CONST:
+                    text = 'const ' + str(self.consts[self.a[value]])
+                elif op == Ops.READ:
+                    text = 'read'
+                elif op == Ops.JUMP:
+                    text = 'jump ' + str(self.successors[block][0])
+                elif op == Ops.BRANCH:
+                    text = 'branch {cond} ? {0} : {1}'.format(*self.successors[block], cond=self.value_name(self.a[value]))
+                else:
+                    text = ' '.join([Ops.names[op]] + [', '.join(map(self.value_name, self.operands(value)))] if self.operands(value) else [Ops.names[op]])
+                if op in (Ops.WRITE, Ops.BRANCH, Ops.JUMP, Ops.HALT):
+                    lines.append('    ' + text)
+                else:
+                    lines.append('    {value} = {text}'.format(value=self.value_name(value), text=text))
+        return '\n'.join(lines)
+
+    def compact(self):
+        '''
+        Drops the instructions no block holds any more and numbers values again in block order
+        '''
+
+        order = [value for values in self.blocks for value in values]
+        numbers = {value: number for number, value in enumerate(order)}
+        old = (self.op, self.a, self.b, self.line, self.variables)
+        self.op, self.a, self.b, self.line, self.variables = (array(column.typecode, map(column.__getitem__, order)) for column in old)
+        for value in range(len(order)):
+            op = self.op[value]
+            if op in (Ops.WRITE, Ops.BRANCH) or Ops.ADD <= op <= Ops.EQUAL:
+                self.a[value] = numbers[self.a[value]]
+                if op not in (Ops.WRITE, Ops.BRANCH):
+                    self.b[value] = numbers[self.b[value]]
+        self.phi_args = {numbers[value]: array('l', map(numbers.__getitem__, args)) for value, args in self.phi_args.items() if value in numbers}
+        self.blocks = [[numbers[value] for value in values] for values in self.blocks]
+
+
+def reverse_postorder(successors, entry=0):
+    order, seen = [], bytearray(len(successors))
+    seen[entry] = 1
+    stack = [(entry, iter(successors[entry]))]
+    while stack:
+        block, targets = stack[-1]
+        for target in targets:
+            if not seen[target]:
+                seen[target] = 1
+                stack.append((target, iter(successors[target])))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+
+def dominators(successors, predecessors, entry=0):
+    '''
+    Immediate dominator of every block (-1 for blocks not reached, entry for itself)
+    '''
+
+    order = reverse_postorder(successors, entry)
+    position = [len(order)] * len(successors)
+    for index, block in enumerate(order):
+        position[block] = index
+    idom = [-1] * len(successors)
+    idom[entry] = entry
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new = -1
+            for pred in predecessors[block]:
+                if idom[pred] < 0:
+                    continue
+                if new < 0:
+                    new = pred
+                    continue
+                # Walk both up to their common dominator
+                finger = pred
+                while finger != new:
+                    while position[finger] > position[new]:
+                        finger = idom[finger]
+                    while position[new] > position[finger]:
+                        new = idom[new]
+            if idom[block] != new:
+                idom[block] = new
+                changed = True
+    return idom
+
+
+def dominance_frontiers(predecessors, idom):
+    frontiers = [set() for _ in predecessors]
+    for block, preds in enumerate(predecessors):
+        if len(preds) < 2 or idom[block] < 0:
+            continue
+        for pred in preds:
+            runner = pred
+            while runner != idom[block] and runner >= 0:
+                frontiers[runner].add(block)
+                runner = idom[runner]
+    return frontiers
+
+
+def lower(tree, root_id):
+    '''
+    Function of the syntax tree of a program
+    '''
+
+    cfg = ControlFlowGraph.build(tree, root_id)
+    function = Function()
+    names = function.names
+    for block in range(len(cfg)):
+        function.add_block()
+        function.successors[block] = list(cfg.successors[block])
+        function.predecessors[block] = list(cfg.predecessors[block])
+
+    # Blocks assigning every variable
+    assigned = []
+    for block in range(len(cfg)):
+        for node_id in cfg.statements[block]:
+            if tree.kind[node_id] in (Kinds.ASSIGN, Kinds.READ):
+                variable = names.id(tree.value[node_id])
+                if variable == len(assigned):
+                    assigned.append({cfg.entry})
+                assigned[variable].add(block)
+    for node_id, depth in tree.walk(root_id):
+        if tree.kind[node_id] == Kinds.ID:
+            variable = names.id(tree.value[node_id])
+            if variable == len(assigned):
+                assigned.append({cfg.entry})
+
+    idom = dominators(function.successors, function.predecessors, cfg.entry)
+    frontiers = dominance_frontiers(function.predecessors, idom)
+    phis = [[] for _ in range(len(cfg))]
+    for variable, blocks in enumerate(assigned):
+        placed, work = set(), list(blocks)
+        while work:
+            for frontier in frontiers[work.pop()]:
+                if frontier not in placed:
+                    placed.add(frontier)
+                    phis[frontier].append(variable)
+                    if frontier not in blocks:
+                        work.append(frontier)
+    phi_variables = {}
+    for block in range(len(cfg)):
+        for variable in phis[block]:
+            value = function.emit(block, Ops.PHI, variable=variable)
+            function.phi_args[value] = array('l', [-1]) * len(function.predecessors[block])
+            phi_variables[value] = variable
+
+    zero = function.emit(None, Ops.CONST, function.const(0))
+    function.blocks[cfg.entry].insert(0, zero)
+    current = [zero] * len(names)
+    children = [[] for _ in range(len(cfg))]
+    for block, parent in enumerate(idom):
+        if parent >= 0 and block != cfg.entry:
+            children[parent].append(block)
+
+    # Renaming, the values a block assigns are undone once its dominator subtree is done
+    undo, stack = [], [(cfg.entry, -1)]
+
+    def assign(variable, value):
+        undo.append((variable, current[variable]))
+        current[variable] = value
+
+    while stack:
+        block, mark = stack.pop()
+        if mark >= 0:
+            while len(undo) > mark:
+                variable, value = undo.pop()
+                current[variable] = value
+            continue
+        stack.append((block, len(undo)))
+
+        for value in list(function.blocks[block]):
+            if function.op[value] == Ops.PHI:
+                assign(phi_variables[value], value)
+        for node_id in cfg.statements[block]:
+            kind, line = tree.kind[node_id], tree.line[node_id]
+            if kind == Kinds.READ:
+                variable = names.id(tree.value[node_id])
+                assign(variable, function.emit(block, Ops.READ, variable, line=line, variable=variable))
+            elif kind == Kinds.ASSIGN:
+                variable = names.id(tree.value[node_id])
+                value = _expression(function, block, tree, tree.first_child[node_id], current)
+                if function.variables[value] < 0:
+                    function.variables[value] = variable
+                assign(variable, value)
+            else:
+                function.emit(block, Ops.WRITE, _expression(function, block, tree, tree.first_child[node_id], current), line=line)
+        condition_id = cfg.conditions[block]
+        if condition_id:
+            function.emit(block, Ops.BRANCH, _expression(function, block, tree, condition_id, current), line=tree.line[condition_id])
+        elif function.successors[block]:
+            function.emit(block, Ops.JUMP)
+        else:
+            function.emit(block, Ops.HALT)
+
+        for successor in function.successors[block]:
+            index = function.predecessors[successor].index(block)
+            for value in function.blocks[successor]:
+                if function.op[value] != Ops.PHI:
+                    break
+                function.phi_args[value][index] = current[phi_variables[value]]
+
+        stack.extend((child, -1) for child in reversed(children[block]))
+    return function
+
+
+def _expression(function, block, tree, root_id, current):
+    '''
+    Emits the instructions of an expression, returns its value
+    '''
+
+    stack, values = [(root_id, False)], []
+    names = function.names
+    while stack:
+        node_id, expanded = stack.pop()
+        kind = tree.kind[node_id]
+        if kind == Kinds.OP:
+            if not expanded:
+                stack.append((node_id, True))
+                stack.extend((child_id, False) for child_id in reversed(list(tree.children(node_id))))
+                continue
+            right, left = values.pop(), values.pop()
+            values.append(function.emit(block, Ops.binary[tree.value[node_id]], left, right, tree.line[node_id]))
+        elif kind == Kinds.ID:
+            values.append(current[names.id(tree.value[node_id])])
+        else:
+            values.append(function.emit(block, Ops.CONST, function.const(int(tree.value[node_id])), line=tree.line[node_id]))
+    return values.pop()
+
+
+def _uses(function):
+    users = [[] for _ in range(len(function))]
+    for values in function.blocks:
+        for value in values:
+            for operand in function.operands(value):
+                users[operand].append(value)
+    return users
+
+
+def _block_of(function):
+    blocks = array('l', [-1]) * len(function)
+    for block, values in enumerate(function.blocks):
+        for value in values:
+            blocks[value] = block
+    return blocks
+
+
+# Lattice of a value in propagate_constants: not known yet, a constant, or not a constant
+_unknown, _constant, _varying = 0, 1, 2
+
+
+def propagate_constants(function, entry=0):
+    '''
+    Sparse conditional constant propagation, returns the number of values made constant
+    '''
+
+    count = len(function)
+    state, constants = bytearray(count), [None] * count
+    users, block_of = _uses(function), _block_of(function)
+    reached = bytearray(len(function.blocks))
+    edges = set()
+    flow, ssa = [(-1, entry)], []
+    op, a, b = function.op, function.a, function.b
+
+    def lower_to(value, new_state, constant=None):
+        if new_state > state[value] or (new_state == _constant and state[value] == _unknown):
+            state[value], constants[value] = new_state, constant
+            ssa.extend(users[value])
+
+    def visit(value, block):
+        kind = op[value]
+        if kind == Ops.PHI:
+            result, preds = None, function.predecessors[block]
+            for index, arg in enumerate(function.phi_args[value]):
+                if (preds[index], block) not in edges or state[arg] == _unknown:
+                    continue
+                if state[arg] == _varying or (result is not None and result != constants[arg]):
+                    lower_to(value, _varying)
+                    return
+                result = constants[arg]
+            if result is not None:
+                lower_to(value, _constant, result)
+        elif kind == Ops.CONST:
+            lower_to(value, _constant, function.consts[a[value]])
+        elif kind == Ops.READ:
+            lower_to(value, _varying)
+        elif Ops.ADD <= kind <= Ops.EQUAL:
+            left, right = state[a[value]], state[b[value]]
+            if left == _varying or right == _varying:
+                lower_to(value, _varying)
+            elif left == _constant and right == _constant:
+                divisor = constants[b[value]]
+                if kind == Ops.DIV and not divisor:
+                    lower_to(value, _varying)
+                else:
+                    lower_to(value, _constant, operations[Ops.symbols[kind]](constants[a[value]], divisor))
+        elif kind == Ops.BRANCH:
+            condition = state[a[value]]
+            successors = function.successors[block]
+            if condition == _varying:
+                flow.extend((block, successor) for successor in successors)
+            elif condition == _constant:
+                flow.append((block, successors[0] if constants[a[value]] else successors[1]))
+        elif kind == Ops.JUMP:
+            flow.append((block, function.successors[block][0]))
+
+    while flow or ssa:
+        while flow:
+            edge = flow.pop()
+            if edge in edges:
+                continue
+            edges.add(edge)
+            block = edge[1]
+            if reached[block]:
+                for value in function.blocks[block]:
+                    if op[value] != Ops.PHI:
+                        break
+                    visit(value, block)
+            else:
+                reached[block] = 1
+                for value in function.blocks[block]:
+                    visit(value, block)
+        while ssa:
+            value = ssa.pop()
+            block = block_of[value]
+            if block >= 0 and reached[block]:
+                visit(value, block)
+
+    # Rewrite: constants, branches decided, unreached blocks and edges dropped
+    folded = 0
+    for block, values in enumerate(function.blocks):
+        if not reached[block]:
+            continue
+        for value in values:
+            kind = op[value]
+            if state[value] == _constant and kind != Ops.CONST and kind not in Ops.effects:
+                op[value], a[value], b[value] = Ops.CONST, function.const(constants[value]), 0
+                function.phi_args.pop(value, None)
+                folded += 1
+        # Phis made constant go after the others
+        values[:] = [value for value in values if op[value] == Ops.PHI] + [value for value in values if op[value] != Ops.PHI]
+        for successor in list(function.successors[block]):
+            if (block, successor) not in edges:
+                function.remove_edge(block, successor)
+        last = values[-1]
+        if op[last] == Ops.BRANCH and len(function.successors[block]) == 1:
+            op[last] = Ops.JUMP
+    for block in range(len(function.blocks)):
+        if not reached[block]:
+            for successor in list(function.successors[block]):
+                function.remove_edge(block, successor)
+            function.blocks[block] = []
+    _drop_blocks(function, reached)
+    _forward_trivial_phis(function)
+    _merge_blocks(function)
+    return folded
+
+
+def _drop_blocks(function, keep):
+    '''
+    Removes the blocks keep doesn't hold, numbers the others again in order
+    '''
+
+    numbers, number = {}, 0
+    for block in range(len(function.blocks)):
+        if keep[block]:
+            numbers[block] = number
+            number += 1
+    function.blocks = [values for block, values in enumerate(function.blocks) if keep[block]]
+    function.successors = [[numbers[target] for target in targets] for block, targets in enumerate(function.successors) if keep[block]]
+    function.predecessors = [[numbers[source] for source in sources] for block, sources in enumerate(function.predecessors) if keep[block]]
+
+
+def _merge_blocks(function, entry=0):
+    '''
+    Appends a block to its only predecessor when it's the only successor of that predecessor
+    '''
+
+    keep = bytearray([1]) * len(function.blocks)
+    for block in range(len(function.blocks)):
+        if not keep[block]:
+            continue
+        while len(function.successors[block]) == 1:
+            successor = function.successors[block][0]
+            if successor == block or successor == entry or len(function.predecessors[successor]) != 1:
+                break
+            # A single predecessor leaves no phi in the successor
+            function.blocks[block].pop()
+            function.blocks[block].extend(function.blocks[successor])
+            function.successors[block] = function.successors[successor]
+            for target in function.successors[block]:
+                sources = function.predecessors[target]
+                sources[sources.index(successor)] = block
+            function.blocks[successor], function.successors[successor], function.predecessors[successor] = [], [], []
+            keep[successor] = 0
+    _drop_blocks(function, keep)
+
+
+def _forward_trivial_phis(function):
+    '''
+    Replaces the phis taking a single value (besides their own) by that value
+    '''
+
+    forward = {}
+
+    def resolve(value):
+        while value in forward:
+            value = forward[value]
+        return value
+
+    changed = True
+    while changed:
+        changed = False
+        for values in function.blocks:
+            for value in values:
+                if function.op[value] != Ops.PHI or value in forward:
+                    continue
+                args = {resolve(arg) for arg in function.phi_args[value]} - {value}
+                if len(args) == 1:
+                    forward[value] = args.pop()
+                    changed = True
+    if not forward:
+        return
+    forward = {value: resolve(value) for value in forward}
+    for block, values in enumerate(function.blocks):
+        function.blocks[block] = [value for value in values if value not in forward]
+        for value in function.blocks[block]:
+            function.replace_operands(value, forward)
+    for value in forward:
+        function.phi_args.pop(value, None)
+
+
+def eliminate_dead_code(function):
+    '''
+    Removes the instructions whose value nothing observable uses, returns how many
+    '''
+
+    live = bytearray(len(function))
+    op, b = function.op, function.b
+    work = []
+    for values in function.blocks:
+        for value in values:
+            kind = op[value]
+            if kind in Ops.effects or (kind == Ops.DIV and not (op[b[value]] == Ops.CONST and function.consts[function.a[b[value]]])):
+                live[value] = 1
+                work.append(value)
+    while work:
+        for operand in function.operands(work.pop()):
+            if not live[operand]:
+                live[operand] = 1
+                work.append(operand)
+
+    removed = 0
+    for block, values in enumerate(function.blocks):
+        kept = [value for value in values if live[value]]
+        removed += len(values) - len(kept)
+        function.blocks[block] = kept
+    for value in [value for value in function.phi_args if not live[value]]:
+        del function.phi_args[value]
+    return removed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tiny_ssa', description='SSA form of a TINY program')
+    parser.add_argument('infile')
+    parser.add_argument('-O', dest='optimize', action='store_true', help='propagate constants and remove dead code')
+    args = parser.parse_args(argv)
+    with open(args.infile, 'r') as infile:
+        tree, root_id = TinyParser.parse(infile.read())
+    if errors_count():
+        return 1
+    function = lower(tree, root_id)
+    if args.optimize:
+        propagate_constants(function)
+        eliminate_dead_code(function)
+        function.compact()
+    print(function.dump())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
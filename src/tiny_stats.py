@@ -0,0 +1,185 @@
+'''
+Compilation statistics
+
+Inputs:
+    Stages of a compilation (reading, scanning, parsing, rendering, ...) and counters
+
+Output:
+    Wall time, CPU time and allocations (tracemalloc) of every stage, counters of tokens by type,
+    nodes by kind, tree depth, errors and cache hits, as a dict or JSON
+
+Usage:
+    with collect(memory=True) as stats:
+        with stage('parse'):
+            tree, root_id = TinyParser.parse(source)
+        count_tree(tree, root_id)
+    stats.as_dict()
+    add_listener(callback)                  # callback('stage', name, record) / callback('counter', name, values)
+
+Stages run while nothing is collecting get a shared no-op context manager and counters return at
+once, so the hooks cost a function call at stage boundaries and nothing inside the scanner or
+parser loops. Nested stages are part of the time of the enclosing one. Stages running more than
+once are added up.
+'''
+
+from collections import Counter
+import contextlib
+import time
+
+_collectors = []
+_listeners = []
+_stages = []
+_idle = contextlib.nullcontext()
+
+
+def enabled():
+    return bool(_collectors or _listeners)
+
+
+def add_listener(callback):
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+
+def _emit(kind, name, data):
+    for collector in _collectors:
+        collector.add(kind, name, data)
+    for callback in list(_listeners):
+        callback(kind, name, data)
+
+
+class _Stage(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        # Loaded with the first stage, tracemalloc alone takes longer to import than the scanner
+        import tracemalloc
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing:
+            size, peak = tracemalloc.get_traced_memory()
+            for outer in _stages:
+                outer.peak = max(outer.peak, peak)
+            # Every stage gets its own peak, the enclosing ones keep theirs above
+            tracemalloc.reset_peak()
+            self.start_size = self.peak = size
+        _stages.append(self)
+        self.start_cpu = time.process_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        import tracemalloc
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        _stages.pop()
+        record = {'wall': wall, 'cpu': cpu, 'calls': 1}
+        if self.tracing and tracemalloc.is_tracing():
+            size, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            for outer in _stages:
+                outer.peak = max(outer.peak, self.peak)
+            record['allocated'] = size - self.start_size
+            record['peak'] = self.peak - self.start_size
+        _emit('stage', self.name, record)
+        return False
+
+
+def stage(name):
+    '''
+    Context manager measuring the stage name
+    '''
+
+    if not (_collectors or _listeners):
+        return _idle
+    return _Stage(name)
+
+
+def count(name, values):
+    '''
+    Adds values ({key: number}) to the counter name
+    '''
+
+    if _collectors or _listeners:
+        _emit('counter', name, dict(values))
+
+
+def count_tokens(tokens, names=None):
+    '''
+    Counts (value, type, ...) tokens by type, types are mapped through names if given
+    '''
+
+    if not (_collectors or _listeners):
+        return
+    types = Counter(token[1] for token in tokens)
+    if names:
+        types = Counter({names.get(key, key): value for key, value in types.items()})
+    count('tokens', types)
+
+
+def count_tree(tree, root_id):
+    '''
+    Counts the nodes of a tree by kind and its depth
+    '''
+
+    if not (_collectors or _listeners):
+        return
+    from tiny_parser import Kinds
+    kinds, depth = Counter(), 0
+    for node_id, node_depth in tree.walk(root_id):
+        kinds[Kinds.names[tree.kind[node_id]]] += 1
+        depth = max(depth, node_depth)
+    count('nodes', kinds)
+    count('tree', {'nodes': sum(kinds.values()), 'max_depth': depth})
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, kind, name, data):
+        if kind == 'stage':
+            total = self.stages.setdefault(name, {})
+            for key, value in data.items():
+                if key == 'peak':
+                    total[key] = max(total.get(key, 0), value)
+                else:
+                    total[key] = total.get(key, 0) + value
+        elif name == 'tree':
+            # Totals of the last tree, not summed over trees
+            self.counters[name] = dict(data)
+        else:
+            self.counters.setdefault(name, Counter()).update(data)
+
+    def as_dict(self):
+        return {'stages': self.stages, 'counters': {name: dict(values) for name, values in self.counters.items()}}
+
+    def to_json(self):
+        import json
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+
+@contextlib.contextmanager
+def collect(memory=True):
+    '''
+    Collects the stages and counters of the block into a Stats, memory turns tracemalloc on for it
+    '''
+
+    import tracemalloc
+    stats = Stats()
+    start_tracing = memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+        if start_tracing:
+            tracemalloc.stop()
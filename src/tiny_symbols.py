@@ -0,0 +1,175 @@
+'''
+Symbol table
+
+Inputs:
+    TINY language snippet code, or a syntax tree (ParseTree)
+
+Output:
+    Every variable with its definitions (assign and read statements) and uses (id nodes), as node ids
+    and line numbers
+
+Usage:
+    python tiny_symbols.py in_file.ext [--unused] [--undefined]
+    symbols = SymbolTable()
+    tree, root_id = TinyParser.parse(source, symbols=symbols)   # or symbols = build(tree, root_id)
+    symbols.uses('x')           # [(node_id, line), ...]
+    symbols.never_read()        # ['y', ...]
+
+Identifiers are interned by the scanner (tiny_scanner.Names) to dense ids, the symbol ids, and the
+table holds a pair of (node id, line) arrays per symbol, filled in as the parser creates the nodes.
+Sites of a name come out in node id order, looking them up costs one dict lookup. The symbols that
+are defined but not read and read but not defined are kept up to date as sites are added, listing
+them only costs their number.
+'''
+
+from tiny_scanner import TinyScanner, Names
+from tiny_parser import TinyParser, Kinds
+from array import array
+import argparse
+import sys
+
+
+class SymbolTable(object):
+
+    def __init__(self, names=None):
+        self.names = Names() if names is None else names
+        # Per symbol id, node ids and lines interleaved
+        self.definition_sites = []
+        self.use_sites = []
+        self.unread = set()
+        self.undefined = set()
+
+    def __len__(self):
+        return len(self.definition_sites)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        '''
+        Names with a definition or a use, the scanner may have interned others in skipped code
+        '''
+
+        names = self.names.names
+        return (names[symbol] for symbol in range(len(self)) if self.definition_sites[symbol] or self.use_sites[symbol])
+
+    def symbol(self, name):
+        '''
+        Symbol id of name, added to the table if new
+        '''
+
+        symbol = self.names.id(name)
+        while symbol >= len(self.definition_sites):
+            self.definition_sites.append(array('l'))
+            self.use_sites.append(array('l'))
+        return symbol
+
+    def define(self, name, node_id, line):
+        symbol = self.names.ids.get(name)
+        if symbol is None or symbol >= len(self.definition_sites):
+            symbol = self.symbol(name)
+        sites = self.definition_sites[symbol]
+        if not sites:
+            self.undefined.discard(symbol)
+            if not self.use_sites[symbol]:
+                self.unread.add(symbol)
+        sites.extend((node_id, line))
+
+    def use(self, name, node_id, line):
+        symbol = self.names.ids.get(name)
+        if symbol is None or symbol >= len(self.use_sites):
+            symbol = self.symbol(name)
+        sites = self.use_sites[symbol]
+        if not sites:
+            self.unread.discard(symbol)
+            if not self.definition_sites[symbol]:
+                self.undefined.add(symbol)
+        sites.extend((node_id, line))
+
+    def _sites(self, table, name):
+        symbol = self.names.ids.get(name)
+        if symbol is None or symbol >= len(table):
+            return []
+        sites = table[symbol]
+        return list(zip(sites[0::2], sites[1::2]))
+
+    def definitions(self, name):
+        '''
+        (node id, line) of every assign and read statement of name
+        '''
+
+        return self._sites(self.definition_sites, name)
+
+    def uses(self, name):
+        '''
+        (node id, line) of every id node reading name
+        '''
+
+        return self._sites(self.use_sites, name)
+
+    def never_read(self):
+        return sorted(map(self.names.__getitem__, self.unread))
+
+    def never_defined(self):
+        '''
+        Names read but never given a value by an assign or read statement
+        '''
+
+        return sorted(map(self.names.__getitem__, self.undefined))
+
+
+def _is_identifier(value):
+    # A read statement missing its identifier holds the token found instead
+    return isinstance(value, str) and value.isalpha() and value not in TinyScanner.reserved_keywords
+
+
+def build(tree, root_id, symbols=None):
+    '''
+    Symbol table of a syntax tree parsed (or loaded from the cache) without one, walked once in node id order
+    '''
+
+    symbols = SymbolTable() if symbols is None else symbols
+    kinds, values, lines = tree.kind, tree.value, tree.line
+    # Node ids of the tree under root_id, in the order the parser created them
+    for node_id in sorted(node_id for node_id, depth in tree.walk(root_id)):
+        kind = kinds[node_id]
+        if kind == Kinds.ID:
+            symbols.use(values[node_id], node_id, lines[node_id])
+        elif kind == Kinds.ASSIGN or (kind == Kinds.READ and _is_identifier(values[node_id])):
+            symbols.define(values[node_id], node_id, lines[node_id])
+    return symbols
+
+
+def cross_reference(symbols):
+    '''
+    A line per symbol: name, lines defining it and lines reading it
+    '''
+
+    for name in sorted(symbols):
+        defined = ' '.join(str(line) for node_id, line in symbols.definitions(name))
+        used = ' '.join(str(line) for node_id, line in symbols.uses(name))
+        yield '{name}: defined {defined}; used {used}'.format(name=name, defined=defined or '-', used=used or '-')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tiny_symbols', description='Cross reference of the variables of a TINY program')
+    parser.add_argument('infile')
+    parser.add_argument('--unused', action='store_true', help='only list the variables that are never read')
+    parser.add_argument('--undefined', action='store_true', help='only list the variables that are never given a value')
+    args = parser.parse_args(argv)
+    with open(args.infile, 'r') as infile:
+        source = infile.read()
+
+    symbols = SymbolTable()
+    TinyParser.parse(source, symbols=symbols)
+    if args.unused or args.undefined:
+        lines = (symbols.never_read() if args.unused else []) + (symbols.never_defined() if args.undefined else [])
+    else:
+        lines = list(cross_reference(symbols))
+    for line in lines:
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,473 @@
+'''
+Bytecode compiler and virtual machine
+
+Inputs:
+    Syntax tree (ParseTree) of a TINY program without errors, integers to read
+
+Output:
+    What the program writes, one integer per line
+
+Usage:
+    program = TinyCompiler.compile(tree, root_id)
+    TinyVM.run(program, input=sys.stdin, output=sys.stdout)
+    TinyVM.run(program, profile=Profile(program))        # see tiny_profile
+
+Code is an integer array of 4 word instructions (opcode, a, b, c). Operands are slots: the constant pool
+comes first and is loaded before the program starts, then a slot per variable (all start at 0), then
+the temporaries of expressions. Comparisons in if and until conditions are fused with the jump.
+Division truncates toward zero.
+
+Errors:
+    ERROR @ LINE lineno: Division by zero
+    ERROR @ LINE lineno: Nothing left to read
+    ERROR @ LINE lineno: Read a non integer value `value`
+'''
+
+from tiny_parser import Kinds
+from errors import error
+from array import array
+from time import perf_counter
+import sys
+
+
+class Opcodes(object):
+    HALT = 0
+    MOVE = 1            # s[a] = s[b]
+    ADD = 2             # s[a] = s[b] + s[c]
+    SUB = 3
+    MUL = 4
+    DIV = 5
+    LESS = 6            # s[a] = 1 if s[b] < s[c] else 0
+    EQUAL = 7
+    JUMP = 8            # pc = c
+    JUMP_IF_FALSE = 9   # if not s[a]: pc = c
+    JUMP_UNLESS_LESS = 10   # if not s[a] < s[b]: pc = c
+    JUMP_UNLESS_EQUAL = 11
+    READ = 12           # s[a] = next integer of the input
+    WRITE = 13          # write s[a]
+
+    names = ('HALT', 'MOVE', 'ADD', 'SUB', 'MUL', 'DIV', 'LESS', 'EQUAL', 'JUMP', 'JUMP_IF_FALSE',
+             'JUMP_UNLESS_LESS', 'JUMP_UNLESS_EQUAL', 'READ', 'WRITE')
+
+
+O = Opcodes
+binary_opcodes = {'+': O.ADD, '-': O.SUB, '*': O.MUL, '/': O.DIV, '<': O.LESS, '=': O.EQUAL}
+jump_opcodes = {'<': O.JUMP_UNLESS_LESS, '=': O.JUMP_UNLESS_EQUAL}
+
+
+class Program(object):
+    '''
+    Compiled TINY program
+
+    code holds 4 words per instruction, lines the source line of every instruction and nodes the
+    statement node it was compiled from (the if or repeat node for the code of its test, 0 for HALT),
+    slots are consts + variables (named by names) + temporaries slot_count in total.
+    '''
+
+    __slots__ = ('code', 'lines', 'consts', 'names', 'slot_count', 'nodes')
+
+    def __init__(self, code, lines, consts, names, slot_count, nodes=None):
+        self.code = code
+        self.lines = lines
+        self.consts = consts
+        self.names = names
+        self.slot_count = slot_count
+        self.nodes = array('l', [0]) * len(lines) if nodes is None else nodes
+
+    def __len__(self):
+        return len(self.lines)
+
+    def instructions(self):
+        '''
+        (opcode, a, b, c) tuples
+        '''
+
+        code = self.code
+        return list(zip(code[0::4], code[1::4], code[2::4], code[3::4]))
+
+    def slot_name(self, slot):
+        if slot < len(self.consts):
+            return str(self.consts[slot])
+        slot -= len(self.consts)
+        if slot < len(self.names):
+            return self.names[slot]
+        return 't' + str(slot - len(self.names))
+
+    def disassemble(self):
+        lines = []
+        for pc, (op, a, b, c) in enumerate(self.instructions()):
+            if op in (O.JUMP, O.HALT):
+                operands = [str(c)] if op == O.JUMP else []
+            elif op in (O.JUMP_IF_FALSE, O.READ, O.WRITE):
+                operands = [self.slot_name(a)] + ([str(c)] if op == O.JUMP_IF_FALSE else [])
+            elif op in (O.JUMP_UNLESS_LESS, O.JUMP_UNLESS_EQUAL):
+                operands = [self.slot_name(a), self.slot_name(b), str(c)]
+            elif op == O.MOVE:
+                operands = [self.slot_name(a), self.slot_name(b)]
+            else:
+                operands = [self.slot_name(a), self.slot_name(b), self.slot_name(c)]
+            lines.append('{pc:>5} {line:>5}  {op:<18}{operands}'.format(pc=pc, line=self.lines[pc], op=O.names[op], operands=', '.join(operands)))
+        return '\n'.join(lines)
+
+
+class TinyCompiler(object):
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.code = array('l')
+        self.lines = array('l')
+        self.nodes = array('l')
+        self.statement = 0
+        self.consts, self.const_slots = [], {}
+        self.names, self.variable_slots = [], {}
+        self.free_temps, self.temp_count = [], 0
+
+    def collect(self, root_id):
+        '''
+        Constant pool and variable slots, in order of appearance
+        '''
+
+        tree, constants, variables = self.tree, {}, {}
+        for node_id, depth in tree.walk(root_id):
+            kind = tree.kind[node_id]
+            if kind == Kinds.CONST:
+                constants.setdefault(int(tree.value[node_id]), None)
+            elif kind in (Kinds.ID, Kinds.ASSIGN, Kinds.READ):
+                variables.setdefault(tree.value[node_id], None)
+        constants.setdefault(0, None)
+        self.consts = list(constants)
+        self.const_slots = {value: slot for slot, value in enumerate(self.consts)}
+        self.names = list(variables)
+        self.variable_slots = {name: slot + len(self.consts) for slot, name in enumerate(self.names)}
+
+    def emit(self, line, op, a=0, b=0, c=0):
+        self.code.extend((op, a, b, c))
+        self.lines.append(line)
+        self.nodes.append(self.statement)
+        return len(self.lines) - 1
+
+    def patch(self, pc, target):
+        self.code[4 * pc + 3] = target
+
+    def new_temp(self):
+        if self.free_temps:
+            return self.free_temps.pop()
+        self.temp_count += 1
+        return -self.temp_count
+
+    def release(self, slot):
+        if slot < 0:
+            self.free_temps.append(slot)
+
+    def expression(self, root_id, target=None):
+        '''
+        Emits the code of an expression, returns the slot holding its value (target when given)
+
+        Temporaries get negative slots until compile moves them after the variables.
+        '''
+
+        tree = self.tree
+        stack, values = [(root_id, target, False)], []
+        while stack:
+            node_id, target, expanded = stack.pop()
+            kind = tree.kind[node_id]
+            if kind == Kinds.OP:
+                if not expanded:
+                    stack.append((node_id, target, True))
+                    children = list(tree.children(node_id))
+                    for child_id in reversed(children):
+                        stack.append((child_id, None, False))
+                    continue
+                right, left = values.pop(), values.pop()
+                self.release(right)
+                self.release(left)
+                slot = self.new_temp() if target is None else target
+                self.emit(tree.line[node_id], binary_opcodes[tree.value[node_id]], slot, left, right)
+            else:
+                if kind == Kinds.ID:
+                    slot = self.variable_slots[tree.value[node_id]]
+                else:
+                    slot = self.const_slots[int(tree.value[node_id]) if kind == Kinds.CONST else 0]
+                if target is not None and target != slot:
+                    self.emit(tree.line[node_id], O.MOVE, target, slot)
+                    slot = target
+            values.append(slot)
+        return values.pop()
+
+    def jump_unless(self, condition_id, line):
+        '''
+        Emits a jump taken when the condition is false, returns its pc to patch the target in
+        '''
+
+        tree = self.tree
+        if tree.kind[condition_id] == Kinds.OP and tree.value[condition_id] in jump_opcodes:
+            left_id, right_id = tree.children(condition_id)
+            left = self.expression(left_id)
+            right = self.expression(right_id)
+            self.release(left)
+            self.release(right)
+            return self.emit(tree.line[condition_id], jump_opcodes[tree.value[condition_id]], left, right)
+        slot = self.expression(condition_id)
+        self.release(slot)
+        return self.emit(line, O.JUMP_IF_FALSE, slot)
+
+    def statements(self, root_id):
+        '''
+        Emits the code of a statement (sequence), with an explicit stack of nodes and pending steps
+        '''
+
+        tree, code_end = self.tree, lambda: len(self.lines)
+        stack = [root_id]
+        while stack:
+            item = stack.pop()
+            if callable(item):
+                item()
+                continue
+            node_id, kind, line = item, tree.kind[item], tree.line[item]
+            children = list(tree.children(node_id))
+
+            if kind == Kinds.STMT_SEQUENCE:
+                stack.extend(reversed(children))
+                continue
+            self.statement = node_id
+            if kind == Kinds.ASSIGN:
+                self.expression(children[0], self.variable_slots[tree.value[node_id]])
+            elif kind == Kinds.READ:
+                self.emit(line, O.READ, self.variable_slots[tree.value[node_id]])
+            elif kind == Kinds.WRITE:
+                slot = self.expression(children[0])
+                self.release(slot)
+                self.emit(line, O.WRITE, slot)
+            elif kind == Kinds.IF:
+                jump = self.jump_unless(children[0], line)
+                if len(children) > 2:
+                    def then_end(jump=jump, line=line, else_id=children[2], node_id=node_id):
+                        self.statement = node_id
+                        end_jump = self.emit(line, O.JUMP)
+                        self.patch(jump, code_end())
+                        stack.extend((lambda: self.patch(end_jump, code_end()), else_id))
+                    stack.extend((then_end, children[1]))
+                else:
+                    stack.extend((lambda jump=jump: self.patch(jump, code_end()), children[1]))
+            elif kind == Kinds.REPEAT:
+                top = code_end()
+
+                def until(condition_id=children[1], top=top, line=line, node_id=node_id):
+                    self.statement = node_id
+                    self.patch(self.jump_unless(condition_id, line), top)
+                stack.extend((until, children[0]))
+
+    @staticmethod
+    def compile(tree, root_id):
+        compiler = TinyCompiler(tree)
+        compiler.collect(root_id)
+        if root_id:
+            compiler.statements(root_id)
+        compiler.statement = 0
+        compiler.emit(0, O.HALT)
+
+        # Temporaries go after the variables
+        base = len(compiler.consts) + len(compiler.names) - 1
+        code = compiler.code
+        for pc in range(len(compiler.lines)):
+            op = code[4 * pc]
+            for index in range(4 * pc + 1, 4 * pc + (3 if op >= O.JUMP else 4)):
+                if code[index] < 0:
+                    code[index] = base - code[index]
+        return Program(code, compiler.lines, compiler.consts, compiler.names,
+                       len(compiler.consts) + len(compiler.names) + compiler.temp_count, compiler.nodes)
+
+
+class IntegerInput(object):
+    '''
+    Integers separated by blanks, read a line at a time
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.words = []
+
+    def next(self):
+        while not self.words:
+            line = self.stream.readline()
+            if not line:
+                return None
+            self.words = line.split()[::-1]
+        return self.words.pop()
+
+
+# The VM loop, profiled_loop is the same loop with the lines ending in `# profile` added, which count,
+# time and count the taken jumps of every instruction into a tiny_profile.Profile. test_profile checks
+# that they stay the same loop, change both together.
+def loop(program, input, output):
+    written = []
+    slots = list(program.consts) + [0] * (program.slot_count - len(program.consts))
+    instructions = program.instructions()
+    MOVE, ADD, SUB, MUL, DIV, LESS, EQUAL = O.MOVE, O.ADD, O.SUB, O.MUL, O.DIV, O.LESS, O.EQUAL
+    JUMP, JUMP_IF_FALSE, JUMP_UNLESS_LESS, JUMP_UNLESS_EQUAL = O.JUMP, O.JUMP_IF_FALSE, O.JUMP_UNLESS_LESS, O.JUMP_UNLESS_EQUAL
+    READ, WRITE, HALT = O.READ, O.WRITE, O.HALT
+
+    pc = 0
+    while True:
+        op, a, b, c = instructions[pc]
+        pc += 1
+        if op == SUB:
+            slots[a] = slots[b] - slots[c]
+        elif op == ADD:
+            slots[a] = slots[b] + slots[c]
+        elif op == MUL:
+            slots[a] = slots[b] * slots[c]
+        elif op == JUMP_UNLESS_LESS:
+            if not slots[a] < slots[b]:
+                pc = c
+        elif op == JUMP_UNLESS_EQUAL:
+            if slots[a] != slots[b]:
+                pc = c
+        elif op == MOVE:
+            slots[a] = slots[b]
+        elif op == JUMP:
+            pc = c
+        elif op == DIV:
+            dividend, divisor = slots[b], slots[c]
+            if not divisor:
+                error(program.lines[pc - 1], 'Division by zero')
+                break
+            quotient = abs(dividend) // abs(divisor)
+            slots[a] = quotient if (dividend < 0) == (divisor < 0) else -quotient
+        elif op == LESS:
+            slots[a] = 1 if slots[b] < slots[c] else 0
+        elif op == EQUAL:
+            slots[a] = 1 if slots[b] == slots[c] else 0
+        elif op == JUMP_IF_FALSE:
+            if not slots[a]:
+                pc = c
+        elif op == WRITE:
+            written.append(str(slots[a]))
+            if len(written) >= 4096:
+                output.write('\n'.join(written) + '\n')
+                written.clear()
+        elif op == READ:
+            if written:
+                # Prompts written so far show up before waiting for input
+                output.write('\n'.join(written) + '\n')
+                output.flush()
+                written.clear()
+            word = input.next()
+            if word is None:
+                error(program.lines[pc - 1], 'Nothing left to read')
+                break
+            try:
+                slots[a] = int(word)
+            except ValueError:
+                error(program.lines[pc - 1], 'Read a non integer value `{value}`'.format(value=word))
+                break
+        elif op == HALT:
+            break
+
+    if written:
+        output.write('\n'.join(written) + '\n')
+    base = len(program.consts)
+    return {name: slots[base + index] for index, name in enumerate(program.names)}
+
+
+def profiled_loop(program, input, output, profile):
+    written = []
+    slots = list(program.consts) + [0] * (program.slot_count - len(program.consts))
+    instructions = program.instructions()
+    counts, times, taken = profile.counts, profile.times, profile.taken  # profile
+    clock = perf_counter  # profile
+    MOVE, ADD, SUB, MUL, DIV, LESS, EQUAL = O.MOVE, O.ADD, O.SUB, O.MUL, O.DIV, O.LESS, O.EQUAL
+    JUMP, JUMP_IF_FALSE, JUMP_UNLESS_LESS, JUMP_UNLESS_EQUAL = O.JUMP, O.JUMP_IF_FALSE, O.JUMP_UNLESS_LESS, O.JUMP_UNLESS_EQUAL
+    READ, WRITE, HALT = O.READ, O.WRITE, O.HALT
+
+    pc = 0
+    started = clock()  # profile
+    while True:
+        op, a, b, c = instructions[pc]
+        current = pc  # profile
+        counts[current] += 1  # profile
+        pc += 1
+        if op == SUB:
+            slots[a] = slots[b] - slots[c]
+        elif op == ADD:
+            slots[a] = slots[b] + slots[c]
+        elif op == MUL:
+            slots[a] = slots[b] * slots[c]
+        elif op == JUMP_UNLESS_LESS:
+            if not slots[a] < slots[b]:
+                pc = c
+                taken[current] += 1  # profile
+        elif op == JUMP_UNLESS_EQUAL:
+            if slots[a] != slots[b]:
+                pc = c
+                taken[current] += 1  # profile
+        elif op == MOVE:
+            slots[a] = slots[b]
+        elif op == JUMP:
+            pc = c
+            taken[current] += 1  # profile
+        elif op == DIV:
+            dividend, divisor = slots[b], slots[c]
+            if not divisor:
+                error(program.lines[pc - 1], 'Division by zero')
+                break
+            quotient = abs(dividend) // abs(divisor)
+            slots[a] = quotient if (dividend < 0) == (divisor < 0) else -quotient
+        elif op == LESS:
+            slots[a] = 1 if slots[b] < slots[c] else 0
+        elif op == EQUAL:
+            slots[a] = 1 if slots[b] == slots[c] else 0
+        elif op == JUMP_IF_FALSE:
+            if not slots[a]:
+                pc = c
+                taken[current] += 1  # profile
+        elif op == WRITE:
+            written.append(str(slots[a]))
+            if len(written) >= 4096:
+                output.write('\n'.join(written) + '\n')
+                written.clear()
+        elif op == READ:
+            if written:
+                # Prompts written so far show up before waiting for input
+                output.write('\n'.join(written) + '\n')
+                output.flush()
+                written.clear()
+            word = input.next()
+            if word is None:
+                error(program.lines[pc - 1], 'Nothing left to read')
+                break
+            try:
+                slots[a] = int(word)
+            except ValueError:
+                error(program.lines[pc - 1], 'Read a non integer value `{value}`'.format(value=word))
+                break
+        elif op == HALT:
+            break
+        now = clock()  # profile
+        times[current] += now - started  # profile
+        started = now  # profile
+
+    if written:
+        output.write('\n'.join(written) + '\n')
+    base = len(program.consts)
+    return {name: slots[base + index] for index, name in enumerate(program.names)}
+
+
+
+
+class TinyVM(object):
+
+    @staticmethod
+    def run(program, input=None, output=None, profile=None):
+        '''
+        Runs program until it ends or fails, returns the final values of its variables by name
+
+        With a tiny_profile.Profile, profiled_loop counts and times the instructions into it, without
+        one the plain loop runs, which has none of the profiling code.
+        '''
+
+        input = IntegerInput(sys.stdin if input is None else input)
+        output = sys.stdout if output is None else output
+        if profile is None:
+            return loop(program, input, output)
+        return profiled_loop(program, input, output, profile)
@@ -0,0 +1,6 @@
+'''
+Compiler version, part of every cache key: bump it whenever the output of the scanner,
+the parser or the renderer changes
+'''
+
+__version__ = '1.6.0'